@@ -1,8 +1,35 @@
 import pygame
+import argparse
 import math
 import random
 import os
 import sys
+import time
+import numpy as np
+from collections import OrderedDict, namedtuple
+
+from tanks.ai import ComputerPlayer
+from tanks.assets import IMAGE, MUSIC, SOUND, AssetManager, pack_atlas
+from tanks.audio import AudioManager
+from tanks.camera import Camera
+from tanks.dirty_rects import DirtyRenderer
+from tanks.netplay import (
+    DEFAULT_PORT, Lockstep, NetConditions, NetError, NetworkThread, host, join,
+)
+from tanks.particles import (
+    DEBRIS, FADE_STEPS, FLASH, KINDS, SMOKE, ParticleSystem,
+)
+from tanks.profiler import FrameProfiler
+from tanks.replay import (
+    Replay, ReplayRecorder, iter_inputs, load_replay, replay_match,
+    save_replay,
+)
+from tanks.scenes import Scene, SceneManager
+from tanks.simulation import (
+    WIDTH, HEIGHT, MIN_WIDTH, RED, BLUE, NO_INPUT, Controls, Match, new_seed,
+)
+from tanks.timestep import FixedTimestep
+from tanks.ui import blit_centered, cached_panel, render_text
 
 def resource_path(relative_path):
     """Krijg het pad naar een resource, werkt voor zowel ontwikkeling als bij een gebundelde .exe"""
@@ -14,151 +41,322 @@ def resource_path(relative_path):
 
     return os.path.join(base_path, relative_path)
 
-# Initialize Pygame
-pygame.init()
+# Redraw only the parts of the screen that changed; False flips every frame
+USE_DIRTY_RECTS = True
 
-# Initialize the mixer module
-pygame.mixer.init()
+# Frame rate cap for drawing; the game itself always runs at TICK_RATE
+MAX_FPS = 144
 
-# Screen settings
-WIDTH, HEIGHT = 800, 600
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption("Over The Top Tanks")
+# Simulation speed while F is held with a shell in flight
+FAST_FORWARD_SCALE = 4.0
 
-# Load the game icon
-try:
-    GAME_ICON = pygame.image.load(resource_path(os.path.join("gfx", "tanks.png"))).convert_alpha()
-    pygame.display.set_icon(GAME_ICON)
-except Exception as e:
-    print(f"Could not load tanks.png image. Exception: {e}")
-    pygame.quit()
-    sys.exit()
+# Columns per cached piece of the ground layer
+CHUNK_WIDTH = 256
+
+# Most debris, smoke and spark particles alive at once. Past FRAME_TARGET
+# seconds of work per frame, fewer are allowed until frames are quick again.
+MAX_PARTICLES = 50000
+FRAME_TARGET = 1 / 60
+
+# Stages of a frame timed by the profiler; F3 shows them over the game.
+# Each kind of thing in the display list is also timed as it is drawn,
+# which is part of "present".
+DRAWN_KINDS = ("star", "ground", "tank", "hearts", "arrow", "shells",
+               "particles", "explosion", "hud", "profiler")
+PROFILE_STAGES = ("wait", "events", "input", "simulation", "display list",
+                  "present") + tuple(f"draw {kind}" for kind in DRAWN_KINDS)
+
+# How main was started: the replay to watch, if any, match settings and
+# the network game to host or join, if any
+GameOptions = namedtuple("GameOptions", ["replay", "speed", "world_width",
+                                         "bitmap", "settling", "network"],
+                         defaults=(None, 1.0, WIDTH, False, False, None))
+
+# A network game: host on address (bind address, port) or join the host
+# at address, with simulated conditions for testing. Only the host's
+# difficulty counts.
+NetOptions = namedtuple("NetOptions", ["hosting", "address", "difficulty",
+                                       "conditions"])
+
+# Mixer channels for sound effects, and how much each cue matters when they
+# are all busy: a cue takes over the oldest sound of no higher priority
+SOUND_CHANNELS = 16
+CUE_PRIORITIES = {"explosion": 0, "cannon": 1, "shoot": 2, "wind": 3}
+
+# Every finished match is saved here as a replay (seed plus inputs)
+RECORD_REPLAYS = True
+REPLAY_DIR = "replays"
+
+# Background stars get their own RNG, seeded with the match, so a replay
+# looks the same every time without touching the match's RNG
+sky_rng = random.Random()
 
 # Colors
 WHITE = (255, 255, 255)
 BLACK = (0, 0, 0)
 GREEN = (34, 139, 34)  # A darker green for better visuals
-RED = (255, 0, 0)
-BLUE = (0, 0, 255)
 GRAY = (200, 200, 200)
 TRANSPARENT_BLACK = (0, 0, 0, 128)
 
-# Load heart icon for health points
-try:
-    HEART_ICON = pygame.image.load(resource_path(os.path.join("gfx", "heart.png"))).convert_alpha()
-    HEART_ICON = pygame.transform.scale(HEART_ICON, (20, 20))
-except Exception as e:
-    print(f"Could not load heart.png image. Exception: {e}")
-    pygame.quit()
-    sys.exit()
-
-# Load tank sprites
-try:
-    RED_TANK_IMAGE = pygame.image.load(resource_path(os.path.join("gfx", "tank1.png"))).convert_alpha()
-    BLUE_TANK_IMAGE = pygame.image.load(resource_path(os.path.join("gfx", "tank2.png"))).convert_alpha()
-    RED_TANK_IMAGE = pygame.transform.scale(RED_TANK_IMAGE, (50, 30))
-    BLUE_TANK_IMAGE = pygame.transform.scale(BLUE_TANK_IMAGE, (50, 30))
-except Exception as e:
-    print(f"Could not load tank images. Exception: {e}")
-    pygame.quit()
-    sys.exit()
-
-# Load sound effects
-try:
-    shoot_sound = pygame.mixer.Sound(resource_path(os.path.join("sounds", "shoot.wav")))
-    explosion_sound = pygame.mixer.Sound(resource_path(os.path.join("sounds", "explosion.wav")))
-    moving_cannon_sound = pygame.mixer.Sound(resource_path(os.path.join("sounds", "movingcanon.wav")))
-    wind_sound = pygame.mixer.Sound(resource_path(os.path.join("sounds", "wind.wav")))
-    wind_sound.set_volume(1.0)  # Set wind sound volume to maximum
-except Exception as e:
-    print(f"Could not load sound effects. Exception: {e}")
-    pygame.quit()
-    sys.exit()
-
-# Get dedicated channels for sounds
-moving_cannon_channel = pygame.mixer.Channel(5)  # Using channel 5 arbitrarily
-wind_sound_channel = pygame.mixer.Channel(6)  # Dedicated channel for wind sound
-
-# Tank class
-class Tank:
-    def __init__(self, x, color, image):
-        self.x = x
-        self.color = color
-        self.image = image
-        self.power = 30  # Starting power adjusted to new max
-        self.angle = 45
-        self.health = 3  # Tanks can be hit three times
-        self.y = 0  # Will be set based on ground height
-
-    def draw(self, screen):
-        # Draw the tank image
-        screen.blit(self.image, (self.x - 25, self.y - 15))
-        # Draw the cannon
+# Every file the game loads. They are read and decoded in the background
+# at startup, once, while the loading screen shows progress.
+ASSET_FILES = (
+    (IMAGE, os.path.join("gfx", "tanks.png")),
+    (IMAGE, os.path.join("gfx", "heart.png")),
+    (IMAGE, os.path.join("gfx", "tank1.png")),
+    (IMAGE, os.path.join("gfx", "tank2.png")),
+    (SOUND, os.path.join("sounds", "shoot.wav")),
+    (SOUND, os.path.join("sounds", "explosion.wav")),
+    (SOUND, os.path.join("sounds", "movingcanon.wav")),
+    (SOUND, os.path.join("sounds", "wind.wav")),
+    (MUSIC, os.path.join("music", "mainmenu.ogg")),
+    (MUSIC, os.path.join("music", "firefight.ogg")),
+)
+assets = AssetManager(resource_path)
+
+# Display, images and sounds are created by init_display() and
+# finish_loading() so that importing this module does not open a window or
+# an audio device
+screen = None
+HEART_ICON = None
+TANK_IMAGES = {}
+audio = None  # AudioManager, once the sounds are loaded
+
+# Network play runs on its own thread, started by the first network game;
+# net_peer is the connection of the game being played
+net_thread = None
+net_peer = None
+
+# Off, and nearly free, until F3 or --profile-log turns it on
+profiler = FrameProfiler(PROFILE_STAGES)
+show_profiler = False  # Whether F3 shows it over the game
+
+
+# Function to open the window and start loading images and sounds
+def init_display():
+    global screen
+
+    # Initialize Pygame
+    pygame.init()
+
+    # Initialize the mixer module
+    pygame.mixer.init()
+
+    # Read and decode the assets while the window comes up
+    for kind, path in ASSET_FILES:
+        assets.request(kind, path)
+    assets.start()
+
+    # Screen settings
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_caption("Over The Top Tanks")
+
+# Function to wait for the assets and set up the sprites and sounds; music
+# fades run on the given TimerQueue
+def finish_loading(timers):
+    global HEART_ICON, audio
+
+    assets.wait()
+
+    # Load the game icon
+    try:
+        game_icon = assets.get(os.path.join("gfx", "tanks.png")).convert_alpha()
+        pygame.display.set_icon(game_icon)
+    except Exception as e:
+        print(f"Could not load tanks.png image. Exception: {e}")
+        pygame.quit()
+        sys.exit()
+
+    # Load heart icon and tank sprites, at the size they are drawn, onto
+    # one atlas
+    try:
+        heart_image = assets.get(os.path.join("gfx", "heart.png")).convert_alpha()
+        red_tank_image = assets.get(os.path.join("gfx", "tank1.png")).convert_alpha()
+        blue_tank_image = assets.get(os.path.join("gfx", "tank2.png")).convert_alpha()
+        _, sprites = pack_atlas({
+            "heart": pygame.transform.scale(heart_image, (20, 20)),
+            "red tank": pygame.transform.scale(red_tank_image, (50, 30)),
+            "blue tank": pygame.transform.scale(blue_tank_image, (50, 30)),
+        })
+        HEART_ICON = sprites["heart"]
+        TANK_IMAGES[RED] = sprites["red tank"]
+        TANK_IMAGES[BLUE] = sprites["blue tank"]
+    except Exception as e:
+        print(f"Could not load images. Exception: {e}")
+        pygame.quit()
+        sys.exit()
+
+    # Load sound effects
+    audio = AudioManager(timers, SOUND_CHANNELS)
+    try:
+        for name, filename in (("shoot", "shoot.wav"),
+                               ("explosion", "explosion.wav"),
+                               ("cannon", "movingcanon.wav"),
+                               ("wind", "wind.wav")):
+            audio.add_cue(name, assets.get(os.path.join("sounds", filename)),
+                          CUE_PRIORITIES[name])
+        audio.cues["wind"].sound.set_volume(1.0)  # Set wind sound volume to maximum
+    except Exception as e:
+        print(f"Could not load sound effects. Exception: {e}")
+        pygame.quit()
+        sys.exit()
+
+    # Bake the explosion animation before the first shot lands
+    explosion_frames(50, 5)
+
+# Function to draw a tank and its cannon, camera_x pixels into the world
+def draw_tank(tank, camera_x=0):
+    # Draw the tank image
+    screen.blit(TANK_IMAGES[tank.color], (tank.x - camera_x - 25,
+                                          tank.y - 15))
+    # Draw the cannon
+    cannon, (x, y) = cannon_sprite(tank)
+    screen.blit(cannon, (x - camera_x, y))
+    # Health icons are drawn separately
+
+# Function to get the cannon of a tank as a small cached sprite. Thick lines
+# do not rasterize the same when clipped, so the cannon is drawn whole once
+# per angle and then blitted, which clips exactly.
+_cannon_sprites = {}
+
+def cannon_sprite(tank):
+    left, top = int(tank.x) - 32, int(tank.y) - 42
+    key = (tank.angle, tank.x - left, tank.y - top)
+    cached = _cannon_sprites.get(tank.color)
+    if cached is None or cached[0] != key:
+        x, y = tank.x - left, tank.y - top
+        surface = pygame.Surface((65, 58))
+        surface.fill(BLACK)
+        surface.set_colorkey(BLACK)
         pygame.draw.line(
-            screen,
-            self.color,
-            (self.x, self.y - 10),
+            surface,
+            tank.color,
+            (x, y - 10),
             (
-                self.x + math.cos(math.radians(self.angle)) * 30,
-                self.y - 10 - math.sin(math.radians(self.angle)) * 30,
+                x + math.cos(math.radians(tank.angle)) * 30,
+                y - 10 - math.sin(math.radians(tank.angle)) * 30,
             ),
             3,
         )
-        # Health icons are drawn separately
-
-    def aim(self, delta_angle):
-        self.angle += delta_angle
-        self.angle = max(0, min(180, self.angle))
-
-    def change_power(self, delta_power):
-        self.power += delta_power
-        self.power = max(10, min(70, self.power))  # Adjusted max power to 70
-
-    def shoot(self):
-        radian_angle = math.radians(self.angle)
-        velocity_x = math.cos(radian_angle) * self.power
-        velocity_y = -math.sin(radian_angle) * self.power
-        return Projectile(self.x, self.y - 10, velocity_x, velocity_y)
-
-    def is_hit(self, projectile):
-        if projectile is None:
-            return False
-        return (
-            self.x - 25 < projectile.x < self.x + 25
-            and self.y - 15 < projectile.y < self.y + 15
-        )
-
-# Projectile class
-class Projectile:
-    def __init__(self, x, y, velocity_x, velocity_y):
-        self.x = x
-        self.y = y
-        self.velocity_x = velocity_x
-        self.velocity_y = velocity_y
-        self.gravity = 0.5
-        self.wind_resistance = 0.99  # Wind resistance to simulate more realistic physics
-        self.active = True
-
-    def move(self, wind):
-        if self.active:
-            self.velocity_x += wind  # Apply wind as a constant force
-            self.x += self.velocity_x
-            self.y += self.velocity_y
-            self.velocity_y += self.gravity
-            self.velocity_x *= self.wind_resistance  # Reduce speed due to air resistance
-            self.velocity_y *= self.wind_resistance
-
-            # Mark the projectile as inactive if it goes off-screen
-            if self.x < 0 or self.x > WIDTH or self.y > HEIGHT:
-                self.active = False
-
-    def draw(self, screen):
-        if (
-            self.active
-            and 0 <= self.x <= WIDTH
-            and 0 <= self.y <= HEIGHT
-        ):  # Draw only if within the screen
-            pygame.draw.circle(screen, RED, (int(self.x), int(self.y)), 5)
+        cached = _cannon_sprites[tank.color] = (key, surface)
+    return cached[1], (left, top)
+
+# Shell sprite, baked on first use: a red dot of radius 5
+_shell_sprite = []
+
+def shell_sprite():
+    if not _shell_sprite:
+        surface = pygame.Surface((11, 11))
+        surface.fill(BLACK)
+        surface.set_colorkey(BLACK)
+        pygame.draw.circle(surface, RED, (5, 5), 5)
+        _shell_sprite.append(surface)
+    return _shell_sprite[0]
+
+# Function to draw the shells in flight at their world positions
+def draw_projectiles(positions, camera_x=0):
+    sprite = shell_sprite()
+    # One blits call for the whole volley; only shells within the screen
+    screen.blits([(sprite, (int(x - camera_x) - 5, int(y) - 5))
+                  for x, y in positions
+                  if 0 <= x - camera_x <= WIDTH and 0 <= y <= HEIGHT],
+                 doreturn=False)
+
+# Particle looks, baked on first use for every kind and step of its life,
+# indexed kind * FADE_STEPS + step: the colour mapped to a screen pixel,
+# its red, green and blue, and its opacity. Particles are stamped straight
+# into the screen's pixels with NumPy rather than blitted one by one, which
+# stays fast for tens of thousands of them.
+_particle_looks = []
+
+# Every particle covers a 2x2 block of pixels from its position
+PARTICLE_DOT_X = np.array([0, 1, 0, 1])
+PARTICLE_DOT_Y = np.array([0, 0, 1, 1])
+
+def particle_looks():
+    if not _particle_looks:
+        colors = np.zeros((KINDS * FADE_STEPS, 3))
+        opacity = np.ones(KINDS * FADE_STEPS, dtype=np.float32)
+        for step in range(FADE_STEPS):
+            fade = step / (FADE_STEPS - 1)  # 0 when new, 1 at the end
+            # Dirt darkens as it settles, sparks cool from white to red and
+            # smoke, the only see-through kind, thins out
+            colors[DEBRIS * FADE_STEPS + step] = (140 - 70 * fade,
+                                                  95 - 50 * fade,
+                                                  50 - 25 * fade)
+            colors[FLASH * FADE_STEPS + step] = (255, 240 - 180 * fade,
+                                                 200 * (1 - fade))
+            colors[SMOKE * FADE_STEPS + step] = (150, 150, 150)
+            opacity[SMOKE * FADE_STEPS + step] = 0.6 * (1 - fade) + 0.05
+        mapped = np.array([screen.map_rgb([int(c) for c in color])
+                           for color in colors], dtype=np.uint32)
+        channels = colors.T.astype(np.float32)
+        _particle_looks.extend((mapped, *channels, opacity))
+    return _particle_looks
+
+# Function to stamp particles into the screen, blending see-through ones
+# with what is already there; x and y are screen positions and index picks
+# each particle's look
+def draw_particles(x, y, index):
+    mapped, red, green, blue, opacity = particle_looks()
+    x = (x[:, None] + PARTICLE_DOT_X).ravel()
+    y = (y[:, None] + PARTICLE_DOT_Y).ravel()
+    index = np.repeat(index, len(PARTICLE_DOT_X))
+    # Only pixels inside the area being redrawn
+    clip = screen.get_clip()
+    inside = (x >= clip.left) & (x < clip.right) & (y >= clip.top) \
+        & (y < clip.bottom)
+    x, y, index = x[inside], y[inside], index[inside]
+
+    pixels = pygame.surfarray.pixels2d(screen)
+    color = mapped[index]
+    see_through = np.flatnonzero(opacity[index] < 1)
+    if see_through.size:
+        look = index[see_through]
+        alpha = opacity[look]
+        below = pixels[x[see_through], y[see_through]].astype(np.uint32)
+        blended = np.uint32(screen.get_masks()[3])
+        for channel, shift in zip((red, green, blue), screen.get_shifts()):
+            under = (below >> shift & 0xFF).astype(np.float32)
+            value = under + (channel[look] - under) * alpha
+            blended = blended | value.astype(np.uint32) << shift
+        color[see_through] = blended
+    pixels[x, y] = color
+    del pixels  # Unlock the screen
+
+# Explosion animation frames, baked once per size: (max_radius, growth_rate)
+# maps to one (surface, offset) for every step of Explosion.update
+_explosion_frames = {}
+
+def explosion_frames(max_radius, growth_rate):
+    key = (max_radius, growth_rate)
+    if key not in _explosion_frames:
+        frames = []
+        radius = 0
+        alpha = 255
+        while True:
+            # Create a surface with per-pixel alpha
+            surface = pygame.Surface((max_radius * 2, max_radius * 2),
+                                     pygame.SRCALPHA)
+            pygame.draw.circle(
+                surface,
+                (255, 165, 0, int(alpha)),  # Orange color with fading alpha
+                (max_radius, max_radius),
+                int(radius)
+            )
+            # Keep only the visible part, with its offset in the full frame
+            bounds = surface.get_bounding_rect()
+            surface = surface.subsurface(bounds).copy()
+            if pygame.display.get_surface() is not None:
+                surface = surface.convert_alpha()  # Fastest format to blit
+            frames.append((surface, bounds.topleft))
+            if radius >= max_radius:
+                break
+            # Same growth and fade as Explosion.update
+            radius += growth_rate
+            alpha -= 255 / (max_radius / growth_rate)
+        _explosion_frames[key] = frames
+    return _explosion_frames[key]
 
 # Explosion class
 class Explosion:
@@ -170,52 +368,198 @@ class Explosion:
         self.growth_rate = 5
         self.alpha = 255
         self.active = True
+        self.frames = explosion_frames(self.max_radius, self.growth_rate)
+        self.step = 0  # Index into self.frames
 
     def update(self):
         if self.current_radius < self.max_radius:
             self.current_radius += self.growth_rate
             self.alpha -= 255 / (self.max_radius / self.growth_rate)
+            self.step += 1
         else:
             self.active = False
 
-    def draw(self, screen):
+    def draw(self, screen, camera_x=0):
         if self.active:
-            # Create a surface with per-pixel alpha
-            explosion_surface = pygame.Surface(
-                (self.max_radius * 2, self.max_radius * 2), pygame.SRCALPHA)
-            pygame.draw.circle(
-                explosion_surface,
-                (255, 165, 0, int(self.alpha)),  # Orange color with fading alpha
-                (self.max_radius, self.max_radius),
-                int(self.current_radius)
-            )
-            # Blit the explosion surface onto the screen
-            screen.blit(explosion_surface, (self.x - self.max_radius,
-                                            self.y - self.max_radius))
-
-# Function to draw stars for parallax background
-def draw_stars(stars):
+            # Blit the pre-rendered frame onto the screen
+            surface, (offset_x, offset_y) = self.frames[self.step]
+            screen.blit(surface, (int(self.x - self.max_radius) - camera_x
+                                  + offset_x,
+                                  int(self.y - self.max_radius) + offset_y))
+
+# Function to loop a music track, quitting if its file cannot be read; a
+# track the mixer cannot play is skipped by the audio manager. The track
+# streams from the copy the asset manager keeps in memory, after the one
+# playing fades out.
+def play_music(filename, label):
+    try:
+        audio.play_music(filename,
+                         assets.get(os.path.join("music", filename)))
+    except Exception as e:
+        print(f"Could not load {label} music. Exception: {e}")
+        pygame.quit()
+        sys.exit()
+
+# Function to list the background stars for the display list
+def star_display_items(stars):
+    items = []
+    for i, star in enumerate(stars):
+        x, y = int(star[0]), int(star[1])
+        items.append((("star", i), (x - 3, y - 3, 7, 7), None,
+                      lambda star=star: draw_star(star)))
+    return items
+
+# Function to draw a single star
+def draw_star(star):
+    pygame.draw.circle(screen, WHITE, (int(star[0]), int(star[1])), 2)
+
+# Function to move the stars to the left, wrapping around the screen
+def move_stars(stars):
     for star in stars:
-        pygame.draw.circle(screen, WHITE, (int(star[0]), int(star[1])), 2)
         star[0] -= star[2]  # Movement of stars to the left
         if star[0] < 0:
             star[0] = WIDTH
-            star[1] = random.randint(0, HEIGHT)
-
-# Function to draw the ground
-def draw_ground(ground):
-    for x in range(WIDTH):
-        pygame.draw.line(screen, GREEN, (x, HEIGHT), (x, HEIGHT - ground[x]))
-
-# Function to draw the health icons
-def draw_health_icons(tank1, tank2):
-    # Red tank health at top left
-    for i in range(tank1.health):
-        screen.blit(HEART_ICON, (10 + i * 25, 10))
-
-    # Blue tank health at top right
-    for i in range(tank2.health):
-        screen.blit(HEART_ICON, (WIDTH - (i + 1) * 25 - 10, 10))
+            star[1] = sky_rng.randint(0, HEIGHT)
+
+# Ground layer class: the terrain rasterized in chunks of CHUNK_WIDTH
+# columns. Only chunks that come into view are drawn and cached, and the
+# least recently shown ones are dropped, so memory follows the screen size
+# rather than the world size. With bitmap terrain the chunks are copied
+# from the mask pixel for pixel, overhangs and all.
+class GroundLayer:
+    def __init__(self, ground, mask=None):
+        self.ground = ground
+        self.mask = mask
+        self.chunks = OrderedDict()  # index -> [surface, rle_surface]
+        self.stale = {}  # index -> columns to paint before the next draw
+        # A screen straddles at most this many chunks; keep a few spare
+        self.max_chunks = WIDTH // CHUNK_WIDTH + 4
+
+    def chunk(self, index):
+        # Get a chunk's surfaces, rasterizing it the first time it is shown
+        chunk = self.chunks.get(index)
+        if chunk is None:
+            start = index * CHUNK_WIDTH
+            width = min(CHUNK_WIDTH, len(self.ground) - start)
+            # Black is see-through so the stars show above the ground
+            surface = pygame.Surface((width, HEIGHT))
+            surface.set_colorkey(BLACK)
+            chunk = self.chunks[index] = [surface, None]
+            self.paint(index, range(start, start + width))
+            while len(self.chunks) > self.max_chunks:
+                self.chunks.popitem(last=False)
+        else:
+            self.chunks.move_to_end(index)
+        return chunk
+
+    def paint(self, index, columns):
+        chunk = self.chunks[index]
+        start = index * CHUNK_WIDTH
+        surface = chunk[0]
+        if self.mask is not None:
+            solid = self.mask.columns(columns.start, columns.stop)
+            pixels = pygame.surfarray.pixels2d(surface)
+            pixels[columns.start - start:columns.stop - start] = np.where(
+                solid, surface.map_rgb(GREEN), surface.map_rgb(BLACK))
+            del pixels  # Unlock the surface
+        else:
+            surface.fill(BLACK, (columns.start - start, 0, len(columns),
+                                 HEIGHT))
+            for x in columns:
+                pygame.draw.line(surface, GREEN, (x - start, HEIGHT),
+                                 (x - start, HEIGHT - self.ground[x]))
+        # Run-length encoded copy: much faster to blit whole, but slow to clip
+        chunk[1] = surface.copy()
+        chunk[1].set_colorkey(BLACK, pygame.RLEACCEL)
+
+    def repaint(self, columns):
+        """Mark the given columns for redrawing where they are cached;
+        returns the changed area in world coordinates.
+
+        Cached chunks are repainted on the next draw, once each however
+        many craters landed in them since.
+        """
+        columns = range(max(0, columns.start),
+                        min(len(self.ground), columns.stop))
+        if not columns:
+            return pygame.Rect(0, 0, 0, 0)
+        for index in range(columns.start // CHUNK_WIDTH,
+                           (columns.stop - 1) // CHUNK_WIDTH + 1):
+            if index in self.chunks:
+                start = index * CHUNK_WIDTH
+                stale = self.stale.get(index, columns)
+                self.stale[index] = range(
+                    max(min(stale.start, columns.start), start),
+                    min(max(stale.stop, columns.stop), start + CHUNK_WIDTH))
+        return pygame.Rect(columns.start, 0, len(columns), HEIGHT)
+
+    def draw(self, target, camera_x=0):
+        for index, columns in self.stale.items():
+            if index in self.chunks:
+                self.paint(index, columns)
+        self.stale.clear()
+
+        area = target.get_clip()
+        whole = area == target.get_rect()
+        last = min(len(self.ground), camera_x + WIDTH) - 1
+        for index in range(max(0, camera_x) // CHUNK_WIDTH,
+                           last // CHUNK_WIDTH + 1):
+            surface, rle_surface = self.chunk(index)
+            x = index * CHUNK_WIDTH - camera_x
+            if whole:
+                target.blit(rle_surface, (x, 0))
+            else:
+                # Only copy the part that is being redrawn
+                part = area.clip(pygame.Rect(x, 0, surface.get_width(),
+                                             HEIGHT))
+                if part:
+                    target.blit(surface, part.topleft, part.move(-x, 0))
+
+# Function to draw one tank's health icons
+def draw_hearts(tank, right_side):
+    for i in range(tank.health):
+        if right_side:
+            # Blue tank health at top right
+            screen.blit(HEART_ICON, (WIDTH - (i + 1) * 25 - 10, 10))
+        else:
+            # Red tank health at top left
+            screen.blit(HEART_ICON, (10 + i * 25, 10))
+
+# Function to draw the power, angle and wind HUD
+def draw_hud(tank, wind, weapon):
+    hud_x = WIDTH // 2 - 100  # Centered HUD rectangle, width is 200
+    screen.blit(hud_surface(tank.power, tank.angle, wind, weapon.name),
+                (hud_x, 10))
+
+# Function to build the parts of the HUD that never change
+def build_hud_background():
+    surface = pygame.Surface((200, 100))
+    pygame.draw.rect(surface, GRAY, (0, 0, 200, 100))  # HUD bg
+    pygame.draw.rect(surface, WHITE, (0, 0, 200, 100), 2)  # Border
+    pygame.draw.line(surface, WHITE, (10, 30), (190, 30), 3)  # Power slider
+    pygame.draw.line(surface, WHITE, (10, 60), (190, 60), 3)  # Angle slider
+    return surface
+
+# Function to get the HUD as a cached surface, rebuilt only when it changes
+def hud_surface(power, angle, wind, weapon_name):
+    wind_text = f"Wind: {wind:.2f}"
+
+    def build():
+        # Display current power, angle, and wind speed as HUD elements
+        surface = cached_panel("hud_background", None,
+                               build_hud_background).copy()
+        power_pos = 10 + int(((power - 10) / 60) * 180)
+        pygame.draw.circle(surface, RED, (power_pos, 30), 10)
+        surface.blit(render_text("Power", 24, WHITE), (10, 10))
+        angle_pos = 10 + int((angle / 180) * 180)
+        pygame.draw.circle(surface, BLUE, (angle_pos, 60), 10)
+        surface.blit(render_text("Angle", 24, WHITE), (10, 40))
+        surface.blit(render_text(wind_text, 24, WHITE), (10, 80))
+        weapon_text = render_text(weapon_name, 20, WHITE)  # Fits by the wind
+        surface.blit(weapon_text, (190 - weapon_text.get_width(), 82))
+        return surface
+
+    return cached_panel("hud", (power, angle, wind_text, weapon_name), build)
 
 # Function to draw a rounded rectangle
 def draw_rounded_rect(surface, color, rect, radius):
@@ -227,606 +571,854 @@ def draw_rounded_rect(surface, color, rect, radius):
     pygame.draw.circle(surface, color, (x + radius, y + h - radius), radius)
     pygame.draw.circle(surface, color, (x + w - radius, y + h - radius), radius)
 
-# Function to draw the main menu
-def draw_main_menu(stars):
-    screen.fill(BLACK)
-    draw_stars(stars)
-    font = pygame.font.Font(None, 74)
-    title_text = font.render("Over The Top Tanks", True, WHITE)
-    screen.blit(title_text, (WIDTH // 2 - title_text.get_width() // 2,
-                             HEIGHT // 4))
-
-    font = pygame.font.Font(None, 36)
-    play_text = font.render("1. Play Game", True, WHITE)
-    instructions_text = font.render("2. Instructions", True, WHITE)
-    credits_text = font.render("3. Credits", True, WHITE)
-    quit_text = font.render("4. Quit", True, WHITE)
-    screen.blit(play_text, (WIDTH // 2 - play_text.get_width() // 2,
-                            HEIGHT // 2))
-    screen.blit(instructions_text, (WIDTH // 2 - instructions_text.get_width()
-                                    // 2, HEIGHT // 2 + 50))
-    screen.blit(credits_text, (WIDTH // 2 - credits_text.get_width() // 2,
-                               HEIGHT // 2 + 100))
-    screen.blit(quit_text, (WIDTH // 2 - quit_text.get_width() // 2,
-                            HEIGHT // 2 + 150))
-
-    pygame.display.flip()
-
-# Function to draw the instructions
-def draw_instructions(stars):
-    running = True
-    clock = pygame.time.Clock()
-    while running:
+# Menu text, one (text, size, color, y) per line, centered on the screen
+MAIN_MENU = (
+    ("Over The Top Tanks", 74, WHITE, HEIGHT // 4),
+    ("1. Play Game", 36, WHITE, HEIGHT // 2),
+    ("2. Play vs Computer", 36, WHITE, HEIGHT // 2 + 50),
+    ("3. Instructions", 36, WHITE, HEIGHT // 2 + 100),
+    ("4. Credits", 36, WHITE, HEIGHT // 2 + 150),
+    ("5. Quit", 36, WHITE, HEIGHT // 2 + 200),
+)
+
+CREDITS = (
+    ("Credits", 74, WHITE, HEIGHT // 4),
+    ("Pascal Mariany", 36, WHITE, HEIGHT // 2),
+    ("www.pascalmariany.com", 36, WHITE, HEIGHT // 2 + 40),
+    ("Press any key to return", 36, WHITE, HEIGHT - 100),
+)
+
+DIFFICULTY_MENU = (
+    ("Select Difficulty", 74, WHITE, HEIGHT // 4),
+    ("1. Easy (No Wind)", 36, WHITE, HEIGHT // 2),
+    ("2. Medium (Weak Wind)", 36, WHITE, HEIGHT // 2 + 50),
+    ("3. Hard (Strong Wind)", 36, WHITE, HEIGHT // 2 + 100),
+)
+
+PAUSE_MENU = (
+    ("Paused", 74, WHITE, HEIGHT // 4),
+    ("1. Continue", 36, WHITE, HEIGHT // 2),
+    ("2. Main Menu", 36, WHITE, HEIGHT // 2 + 50),
+    ("3. Quit", 36, WHITE, HEIGHT // 2 + 100),
+)
+
+INSTRUCTIONS = (
+    "Instructions:",
+    "- Left/Right Arrow: Aim the cannon",
+    "- Up/Down Arrow: Adjust power",
+    "- Space: Shoot",
+    "- W: Switch weapon",
+    "- ESC: Pause the game",
+    "- M: Mute/Unmute music",
+    "- Wind affects the projectile's path",
+    "- Each tank has 3 health points.",
+    "",
+    "Hit any key to go back!"
+)
+
+# Function to build the instructions box, text included
+def build_instructions_panel():
+    # Create a semi-transparent surface
+    instructions_surface = pygame.Surface(
+        (int(WIDTH * 0.9), int(HEIGHT * 0.9)), pygame.SRCALPHA)
+
+    # Set transparency (alpha)
+    transparency = int(255)  # 30% opacity
+    instructions_surface.set_alpha(transparency)
+
+    # Draw rounded rectangle background
+    rect = instructions_surface.get_rect()
+    draw_rounded_rect(
+        instructions_surface,
+        (50, 50, 50, transparency),
+        (0, 0, rect.width, rect.height),
+        20
+    )
+
+    # Render text onto the instructions surface
+    for i, line in enumerate(INSTRUCTIONS):
+        text = render_text(line, 36, WHITE)
+        instructions_surface.blit(
+            text,
+            (rect.width // 2 - text.get_width() // 2, 80 + i * 40)
+        )
+    return instructions_surface
+
+# Loading scene class: a progress bar while the assets load in the
+# background, then the main menu
+class LoadingScene(Scene):
+    frame_interval = 1 / 30
+
+    def __init__(self, options):
+        super().__init__()
+        self.options = options
+
+    def frame(self, elapsed):
+        if assets.ready:
+            finish_loading(self.manager.timers)
+            start_round(self.manager, self.options)
+            return
         screen.fill(BLACK)
-        draw_stars(stars)
-
-        # Create a semi-transparent surface
-        instructions_surface = pygame.Surface(
-            (int(WIDTH * 0.9), int(HEIGHT * 0.9)), pygame.SRCALPHA)
-
-        # Set transparency (alpha)
-        transparency = int(255)  # 30% opacity
-        instructions_surface.set_alpha(transparency)
+        blit_centered(screen, "Loading...", 36, WHITE, HEIGHT // 2 - 40)
+        bar = pygame.Rect(WIDTH // 4, HEIGHT // 2, WIDTH // 2, 20)
+        pygame.draw.rect(screen, GRAY, bar, 2)
+        pygame.draw.rect(screen, GREEN, (bar.x + 4, bar.y + 4, int(
+            (bar.width - 8) * assets.progress), bar.height - 8))
+        pygame.display.flip()
 
-        # Draw rounded rectangle background
+# Function to list lines of centered text for the display list
+def text_display_items(lines):
+    items = []
+    for text, size, color, y in lines:
+        rendered = render_text(text, size, color)
+        rect = rendered.get_rect(midtop=(WIDTH // 2, y))
+        items.append((("text", text, y), rect, None,
+                      lambda rendered=rendered, rect=rect:
+                      screen.blit(rendered, rect)))
+    return items
+
+# Menu scene class: a menu over the moving stars. Only the stars that moved
+# are redrawn each frame, so a menu left open costs next to nothing.
+class MenuScene(Scene):
+    frame_interval = 1 / 60
+    lines = ()
+
+    def __init__(self, stars):
+        super().__init__()
+        self.stars = stars
+        self.renderer = DirtyRenderer(screen, BLACK, enabled=USE_DIRTY_RECTS)
+
+    def enter(self):
+        self.renderer.invalidate()  # Another scene drew over the screen
+
+    def items(self):
+        # Everything on the menu besides the stars
+        return text_display_items(self.lines)
+
+    def frame(self, elapsed):
+        self.renderer.present(star_display_items(self.stars) + self.items())
+        move_stars(self.stars)
+
+# Main menu scene class
+class MainMenuScene(MenuScene):
+    lines = MAIN_MENU
+
+    def __init__(self, options, seed, stars):
+        super().__init__(stars)
+        self.options = options
+        self.seed = seed
+
+    def handle(self, event):
+        if event.type != pygame.KEYDOWN:
+            return
+        if event.key in (pygame.K_1, pygame.K_2):
+            # The computer plays blue when chosen
+            self.manager.push(DifficultyScene(self.options, self.seed,
+                                              self.stars,
+                                              event.key == pygame.K_2))
+        elif event.key == pygame.K_3:
+            self.manager.push(InstructionsScene(self.stars))
+        elif event.key == pygame.K_4:
+            self.manager.push(CreditsScene(self.stars))
+        elif event.key == pygame.K_5:
+            self.manager.quit()
+
+# Instructions scene class
+class InstructionsScene(MenuScene):
+    def items(self):
+        instructions_surface = cached_panel("instructions", INSTRUCTIONS,
+                                            build_instructions_panel)
         rect = instructions_surface.get_rect()
         rect.center = (WIDTH // 2, HEIGHT // 2)
-        draw_rounded_rect(
-            instructions_surface,
-            (50, 50, 50, transparency),
-            (0, 0, rect.width, rect.height),
-            20
-        )
-
-        # Render text onto the instructions surface
-        font = pygame.font.Font(None, 36)
-        instructions = [
-            "Instructions:",
-            "- Left/Right Arrow: Aim the cannon",
-            "- Up/Down Arrow: Adjust power",
-            "- Space: Shoot",
-            "- ESC: Pause the game",
-            "- M: Mute/Unmute music",
-            "- Wind affects the projectile's path",
-            "- Each tank has 3 health points.",
-            "",
-            "Hit any key to go back!"
-        ]
-        for i, line in enumerate(instructions):
-            text = font.render(line, True, WHITE)
-            instructions_surface.blit(
-                text,
-                (rect.width // 2 - text.get_width() // 2, 80 + i * 40)
-            )
-
-        # Blit the instructions surface onto the main screen
-        screen.blit(instructions_surface, rect.topleft)
-
-        pygame.display.flip()
-        clock.tick(60)
-
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                sys.exit()
-            if event.type == pygame.KEYDOWN:
-                running = False
-
-# Function to draw the credits screen
-def draw_credits(stars):
-    running = True
-    clock = pygame.time.Clock()
-    while running:
+        return [("instructions", rect, None,
+                 lambda: screen.blit(instructions_surface, rect.topleft))]
+
+    def handle(self, event):
+        if event.type == pygame.KEYDOWN:
+            self.manager.pop()
+
+# Credits scene class
+class CreditsScene(MenuScene):
+    lines = CREDITS
+
+    def handle(self, event):
+        if event.type == pygame.KEYDOWN:
+            self.manager.pop()
+
+# Difficulty selection scene class; choosing one starts the match
+class DifficultyScene(MenuScene):
+    lines = DIFFICULTY_MENU
+    keys = {pygame.K_1: "easy", pygame.K_2: "medium", pygame.K_3: "hard"}
+
+    def __init__(self, options, seed, stars, against_computer):
+        super().__init__(stars)
+        self.options = options
+        self.seed = seed
+        self.against_computer = against_computer
+
+    def handle(self, event):
+        if event.type == pygame.KEYDOWN and event.key in self.keys:
+            # Load and play game music
+            play_music("firefight.ogg", "game")
+            self.manager.reset(GameScene(self.options, self.seed, self.stars,
+                                         self.keys[event.key],
+                                         self.against_computer))
+
+# Pause menu scene class, over the game it pauses
+class PauseScene(MenuScene):
+    lines = PAUSE_MENU
+
+    def __init__(self, game):
+        super().__init__(game.stars)
+        self.game = game
+
+    def handle(self, event):
+        if event.type != pygame.KEYDOWN:
+            return
+        if event.key == pygame.K_1:
+            self.manager.pop()  # Back to the game
+        elif event.key == pygame.K_2:
+            if self.game.options.replay is not None:
+                # A replay has no menu to go back to
+                self.manager.quit()
+                return
+            save_match_replay(self.game.recorder)
+            options = self.game.options
+            if options.network is not None:
+                # Leave the network game for good: start_round hangs up,
+                # which tells the other player, and then the main menu
+                # plays locally instead of connecting again
+                options = options._replace(network=None)
+            start_round(self.manager, options)
+        elif event.key == pygame.K_3:
+            self.manager.quit()
+
+# Game over scene class. Nothing on it moves, so it is drawn once and the
+# game sleeps until a key is pressed.
+class GameOverScene(Scene):
+    def __init__(self, winner_color, options):
+        super().__init__()
+        self.winner_color = winner_color
+        self.options = options
+
+    def frame(self, elapsed):
         screen.fill(BLACK)
-        draw_stars(stars)
-        font_title = pygame.font.Font(None, 74)
-        credits_title = font_title.render("Credits", True, WHITE)
-        screen.blit(credits_title, (WIDTH // 2 - credits_title.get_width()
-                                    // 2, HEIGHT // 4))
-
-        font = pygame.font.Font(None, 36)
-        name_text = font.render("Pascal Mariany", True, WHITE)
-        website_text = font.render("www.pascalmariany.com", True, WHITE)
-        screen.blit(name_text, (WIDTH // 2 - name_text.get_width() // 2,
-                                HEIGHT // 2))
-        screen.blit(website_text, (WIDTH // 2 - website_text.get_width() // 2,
-                                   HEIGHT // 2 + 40))
-
-        prompt_text = font.render("Press any key to return", True, WHITE)
-        screen.blit(prompt_text, (WIDTH // 2 - prompt_text.get_width() // 2,
-                                  HEIGHT - 100))
-
-        pygame.display.flip()
-        clock.tick(60)
+        blit_centered(screen, "Game Over", 74, WHITE, HEIGHT // 4)
+        blit_centered(screen, f"{self.winner_color} Tank Wins!", 74,
+                      RED if self.winner_color == "Red" else BLUE,
+                      HEIGHT // 4 + 80)
 
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                sys.exit()
-            if event.type == pygame.KEYDOWN:
-                running = False
-
-# Function to generate terrain with multiple peaks
-def generate_terrain(width):
-    # Start with a flat ground
-    ground = [20 for _ in range(width)]
-
-    # Determine the number of peaks (excluding start and end points)
-    num_peaks = random.randint(3, 6)
-
-    # Generate random peak positions and heights
-    # Ensure peaks are not at the very edges
-    peak_positions = sorted(random.sample(range(1, width - 1), num_peaks - 2))
-    peak_positions = [0] + peak_positions + [width - 1]
-    peak_heights = [20] + [random.randint(100, 400) for _ in
-                           range(num_peaks - 2)] + [20]
-
-    # Generate terrain heights using interpolation
-    for i in range(len(peak_positions) - 1):
-        start_x = peak_positions[i]
-        end_x = peak_positions[i + 1]
-        start_height = peak_heights[i]
-        end_height = peak_heights[i + 1]
-        for x in range(start_x, end_x):
-            fraction = (x - start_x) / (end_x - start_x)
-            # Use cosine interpolation for smooth curves
-            fraction = (1 - math.cos(fraction * math.pi)) / 2
-            ground[x] = start_height * (1 - fraction) + end_height * fraction
-
-    # Ensure the last point is set correctly
-    ground[width - 1] = 20
-
-    # Apply smoothing
-    ground = smooth_ground(ground, smoothing_passes=3)
-
-    return ground
-
-# Function to smooth the ground
-def smooth_ground(ground, smoothing_passes=1):
-    for _ in range(smoothing_passes):
-        new_ground = ground.copy()
-        for x in range(1, len(ground) - 1):
-            new_ground[x] = (ground[x - 1] + ground[x] + ground[x + 1]) / 3
-        ground = new_ground
-    return ground
-
-# Function to draw the difficulty selection menu
-def draw_difficulty_menu(stars):
-    running = True
-    clock = pygame.time.Clock()
-    while running:
-        screen.fill(BLACK)
-        draw_stars(stars)
-        font = pygame.font.Font(None, 74)
-        difficulty_text = font.render("Select Difficulty", True, WHITE)
-        screen.blit(difficulty_text, (WIDTH // 2 - difficulty_text.get_width()
-                                      // 2, HEIGHT // 4))
-
-        font = pygame.font.Font(None, 36)
-        easy_text = font.render("1. Easy (No Wind)", True, WHITE)
-        medium_text = font.render("2. Medium (Weak Wind)", True, WHITE)
-        hard_text = font.render("3. Hard (Strong Wind)", True, WHITE)
-        screen.blit(easy_text, (WIDTH // 2 - easy_text.get_width() // 2,
-                                HEIGHT // 2))
-        screen.blit(medium_text, (WIDTH // 2 - medium_text.get_width() // 2,
-                                  HEIGHT // 2 + 50))
-        screen.blit(hard_text, (WIDTH // 2 - hard_text.get_width() // 2,
-                                HEIGHT // 2 + 100))
+        blit_centered(screen, "1. Rematch", 36, WHITE, HEIGHT // 2)
+        blit_centered(screen, "2. Quit", 36, WHITE, HEIGHT // 2 + 50)
 
         pygame.display.flip()
-        clock.tick(60)
 
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                sys.exit()
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_1:
-                    return "easy"
-                elif event.key == pygame.K_2:
-                    return "medium"
-                elif event.key == pygame.K_3:
-                    return "hard"
-
-# Function to draw the pause menu
-def draw_pause_menu(stars):
-    running = True
-    clock = pygame.time.Clock()
-    while running:
+    def handle(self, event):
+        if event.type != pygame.KEYDOWN:
+            return
+        if event.key == pygame.K_1:
+            start_round(self.manager, self.options)  # Will restart the game
+        elif event.key == pygame.K_2:
+            self.manager.quit()
+
+# Connect scene class: hosts or joins a network game, then starts it
+class ConnectScene(MenuScene):
+    def __init__(self, options, seed, stars):
+        super().__init__(stars)
+        self.options = options
+        self.seed = seed
+        self.future = None  # Of the Peer, once connected
+        net = options.network
+        if net.hosting:
+            self.status = f"Waiting for a player on port {net.address[1]}..."
+        else:
+            self.status = f"Connecting to {net.address[0]}:{net.address[1]}..."
+
+    def enter(self):
+        global net_thread
+        super().enter()
+        if self.future is not None:
+            return
+        if net_thread is None:
+            net_thread = NetworkThread()
+        net = self.options.network
+        if net.hosting:
+            # The host picks the match; the other player gets its settings
+            settings = Replay(self.seed, net.difficulty, True, [],
+                              self.options.world_width, self.options.bitmap,
+                              self.options.settling)
+            self.future = net_thread.run(host(settings, net.address[1],
+                                           net.address[0], net.conditions))
+        else:
+            self.future = net_thread.run(join(net.address, net.conditions))
+
+    def items(self):
+        return text_display_items((
+            ("Network Game", 74, WHITE, HEIGHT // 4),
+            (self.status, 36, WHITE, HEIGHT // 2),
+            ("Press ESC to quit", 36, GRAY, HEIGHT - 100),
+        ))
+
+    def handle(self, event):
+        if event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
+            self.future.cancel()
+            self.manager.quit()
+
+    def frame(self, elapsed):
+        global net_peer
+        if self.future.done() and not self.future.cancelled():
+            try:
+                peer = self.future.result()
+            except (NetError, OSError) as e:
+                self.status = f"Could not connect: {e}"
+            else:
+                self.future = None
+                net_peer = peer
+                play_music("firefight.ogg", "game")
+                self.manager.reset(GameScene(self.options, peer.settings.seed,
+                                             self.stars, peer=peer))
+                return
+        super().frame(elapsed)
+
+# Connection lost scene class, for a network game that ended early. Like
+# the game over screen it is drawn once.
+class NetErrorScene(Scene):
+    def __init__(self, message, options):
+        super().__init__()
+        self.message = message
+        self.options = options
+
+    def frame(self, elapsed):
         screen.fill(BLACK)
-        draw_stars(stars)
-        font = pygame.font.Font(None, 74)
-        pause_text = font.render("Paused", True, WHITE)
-        screen.blit(pause_text, (WIDTH // 2 - pause_text.get_width() // 2,
-                                 HEIGHT // 4))
-
-        font = pygame.font.Font(None, 36)
-        continue_text = font.render("1. Continue", True, WHITE)
-        main_menu_text = font.render("2. Main Menu", True, WHITE)
-        quit_text = font.render("3. Quit", True, WHITE)
-        screen.blit(continue_text, (WIDTH // 2 - continue_text.get_width() // 2,
-                                    HEIGHT // 2))
-        screen.blit(main_menu_text, (WIDTH // 2 - main_menu_text.get_width()
-                                     // 2, HEIGHT // 2 + 50))
-        screen.blit(quit_text, (WIDTH // 2 - quit_text.get_width() // 2,
-                                HEIGHT // 2 + 100))
+        blit_centered(screen, "Connection Lost", 74, WHITE, HEIGHT // 4)
+        blit_centered(screen, self.message[:1].upper() + self.message[1:],
+                      36, WHITE, HEIGHT // 4 + 80)
+
+        blit_centered(screen, "1. Play Again", 36, WHITE, HEIGHT // 2)
+        blit_centered(screen, "2. Quit", 36, WHITE, HEIGHT // 2 + 50)
 
         pygame.display.flip()
-        clock.tick(60)
 
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                sys.exit()
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_1:
-                    return "continue"
-                elif event.key == pygame.K_2:
-                    return "main_menu"
-                elif event.key == pygame.K_3:
-                    pygame.quit()
-                    sys.exit()
-
-# Function to wait for a key press
-def wait_for_key():
-    waiting = True
-    while waiting:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                sys.exit()
-            if event.type == pygame.KEYDOWN:
-                waiting = False
-
-# Function to draw the game over screen
-def draw_game_over(winner_color):
-    screen.fill(BLACK)
-    font = pygame.font.Font(None, 74)
-    game_over_text = font.render("Game Over", True, WHITE)
-    winner_text = font.render(f"{winner_color} Tank Wins!",
-                              True, RED if winner_color == "Red" else BLUE)
-    screen.blit(game_over_text, (WIDTH // 2 - game_over_text.get_width() // 2,
-                                 HEIGHT // 4))
-    screen.blit(winner_text, (WIDTH // 2 - winner_text.get_width() // 2,
-                              HEIGHT // 4 + 80))
-
-    font = pygame.font.Font(None, 36)
-    rematch_text = font.render("1. Rematch", True, WHITE)
-    quit_text = font.render("2. Quit", True, WHITE)
-    screen.blit(rematch_text, (WIDTH // 2 - rematch_text.get_width() // 2,
-                               HEIGHT // 2))
-    screen.blit(quit_text, (WIDTH // 2 - quit_text.get_width() // 2,
-                            HEIGHT // 2 + 50))
-
-    pygame.display.flip()
-    choice = wait_for_game_over_choice()
-    return choice
-
-# Function to wait for the user's choice on the game over screen
-def wait_for_game_over_choice():
-    while True:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                sys.exit()
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_1:
-                    return "rematch"
-                elif event.key == pygame.K_2:
-                    return "quit"
+    def handle(self, event):
+        if event.type != pygame.KEYDOWN:
+            return
+        if event.key == pygame.K_1:
+            start_round(self.manager, self.options)  # Host or join again
+        elif event.key == pygame.K_2:
+            self.manager.quit()
 
 # Function to draw an animated arrow above the current tank
-def draw_animated_arrow(tank, offset):
-    x = tank.x
+def draw_animated_arrow(tank, offset, camera_x=0):
+    x = tank.x - camera_x
     y = tank.y - 50 + offset  # Move the arrow higher above the tank
     # Points adjusted to flip the arrow vertically
     points = [(x, y + 20), (x - 10, y), (x + 10, y)]
     pygame.draw.polygon(screen, WHITE, points)
 
-# Main game function
-def main():
-    while True:
-        # Generate the terrain
-        ground = generate_terrain(WIDTH)
-
-        stars = [
-            [
-                random.randint(0, WIDTH),
-                random.randint(0, HEIGHT),
-                random.uniform(0.2, 0.5),
-            ]
-            for _ in range(100)
-        ]
-        clock = pygame.time.Clock()
-
-        # Load and play main menu music
-        try:
-            pygame.mixer.music.load(os.path.join("music", "mainmenu.ogg"))
-            pygame.mixer.music.play(-1)
-            pygame.mixer.music.set_volume(0.5)
-        except Exception as e:
-            print(f"Could not load main menu music. Exception: {e}")
-            pygame.quit()
-            sys.exit()
-
-        running = True
-        in_menu = True
-
-        while in_menu:
-            draw_main_menu(stars)
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    running = False
-                    pygame.quit()
-                    sys.exit()
-                if event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_1:
-                        # Display the difficulty selection menu
-                        difficulty = draw_difficulty_menu(stars)
-                        in_menu = False
-                        # Load and play game music
-                        try:
-                            pygame.mixer.music.load(
-                                os.path.join("music", "firefight.ogg"))
-                            pygame.mixer.music.play(-1)
-                            pygame.mixer.music.set_volume(0.5)
-                        except Exception as e:
-                            print(f"Could not load game music. Exception: {e}")
-                            pygame.quit()
-                            sys.exit()
-                    elif event.key == pygame.K_2:
-                        draw_instructions(stars)
-                    elif event.key == pygame.K_3:
-                        draw_credits(stars)
-                    elif event.key == pygame.K_4:
-                        running = False
-                        pygame.quit()
-                        sys.exit()
-
-        # Initialize tanks and game variables
-        tank1 = Tank(100, RED, RED_TANK_IMAGE)
-        tank2 = Tank(700, BLUE, BLUE_TANK_IMAGE)
-        current_tank = tank1
-
-        projectile = None
-        # Initialize wind based on difficulty
-        if difficulty == "easy":
-            wind = 0  # No wind
-        elif difficulty == "medium":
-            wind = random.uniform(-1, 1)  # Weak wind
+# Function to list everything on the game screen, back to front, for the
+# DirtyRenderer: (key, bounding rect, signature, draw function). World
+# things are drawn camera_x pixels to the left; when the camera moves, the
+# ground's signature changes and the whole screen is redrawn.
+def game_display_list(stars, ground_layer, match, explosions, arrow_offset,
+                      shell_alpha=1.0, camera_x=0, particles=None):
+    items = star_display_items(stars)
+
+    items.append(("ground", screen.get_rect(), camera_x,
+                  lambda: ground_layer.draw(screen, camera_x)))
+
+    for i, tank in enumerate(match.tanks):
+        items.append((("tank", i),
+                      (tank.x - camera_x - 32, tank.y - 42, 65, 58),
+                      (tank.x, tank.y, tank.angle),
+                      lambda tank=tank: draw_tank(tank, camera_x)))
+        items.append((("hearts", i), (0, 10, 85, 20) if i == 0
+                      else (WIDTH - 85, 10, 85, 20), tank.health,
+                      lambda tank=tank, i=i: draw_hearts(tank, i == 1)))
+
+    if arrow_offset is not None:
+        tank = match.current_tank
+        y = tank.y - 50 + arrow_offset
+        items.append(("arrow", (tank.x - camera_x - 11, int(y) - 1, 23, 23),
+                      arrow_offset,
+                      lambda: draw_animated_arrow(tank, arrow_offset,
+                                                  camera_x)))
+
+    # Shells, drawn shell_alpha of the way through their last tick, are one
+    # item however many there are: their bounding box, redrawn when any moves
+    _, shell_x, shell_y = match.shells.positions(shell_alpha)
+    if shell_x.size:
+        screen_x = (shell_x - camera_x).astype(int)
+        screen_y = shell_y.astype(int)
+        left, top = int(screen_x.min()), int(screen_y.min())
+        positions = list(zip(shell_x.tolist(), shell_y.tolist()))
+        items.append(("shells", (left - 6, top - 6,
+                                 int(screen_x.max()) - left + 13,
+                                 int(screen_y.max()) - top + 13),
+                      (screen_x.tobytes(), screen_y.tobytes()),
+                      lambda: draw_projectiles(positions, camera_x)))
+
+    for explosion in explosions:
+        items.append((("explosion", id(explosion)),
+                      (explosion.x - camera_x - explosion.max_radius - 1,
+                       explosion.y - explosion.max_radius - 1,
+                       explosion.max_radius * 2 + 2,
+                       explosion.max_radius * 2 + 2),
+                      explosion.current_radius,
+                      lambda explosion=explosion: explosion.draw(screen,
+                                                                 camera_x)))
+
+    # Particles are one item too, redrawn whenever they have moved
+    if particles is not None and len(particles):
+        x, y, index = particles.sprites()
+        x = x.astype(np.intp) - camera_x
+        y = y.astype(np.intp)
+        shown = (x > -2) & (x < WIDTH + 1) & (y > -2) & (y < HEIGHT + 1)
+        if shown.any():
+            x, y, index = x[shown], y[shown], index[shown]
+            left, top = int(x.min()) - 1, int(y.min()) - 1
+            items.append(("particles", (left, top, int(x.max()) - left + 2,
+                                        int(y.max()) - top + 2),
+                          (particles.version, camera_x),
+                          lambda: draw_particles(x, y, index)))
+
+    tank = match.current_tank
+    weapon = match.weapons[tank.weapon]
+    items.append(("hud", (WIDTH // 2 - 100, 10, 200, 100),
+                  (tank.power, tank.angle, f"{match.wind:.2f}", weapon.name),
+                  lambda: draw_hud(tank, match.wind, weapon)))
+    return items
+
+# Function to time every item of a display list as it is drawn, each under
+# the "draw" stage of its kind
+def profiled_display_list(items):
+    return [(key, rect, signature,
+             profiler.timed(f"draw {key[0] if isinstance(key, tuple) else key}",
+                            draw))
+            for key, rect, signature, draw in items]
+
+# Function to get the profiler overlay: average and 99th percentile time of
+# every stage over the last frames, and a graph of recent frame times.
+# It is rebuilt four times a second at 60 FPS.
+def profiler_surface():
+    def build():
+        rows = profiler.stats()
+        surface = pygame.Surface((250, 36 + 14 * len(rows) + 70),
+                                 pygame.SRCALPHA)
+        surface.fill((0, 0, 0, 190))
+        for column, text in ((8, "ms"), (170, "avg"), (240, "p99")):
+            label = render_text(text, 18, GRAY)
+            surface.blit(label, (column - (label.get_width()
+                                           if column > 8 else 0), 8))
+        for i, (name, average, p99) in enumerate(rows):
+            y = 28 + i * 14
+            surface.blit(render_text(name, 16, WHITE), (8, y))
+            for column, value in ((170, average), (240, p99)):
+                text = render_text(f"{value:.2f}", 16, WHITE)
+                surface.blit(text, (column - text.get_width(), y))
+
+        # Frame times, newest on the right, against the frame target
+        bottom = surface.get_height() - 8
+        scale = 60 / (2 * FRAME_TARGET * 1000)  # Pixels per millisecond
+        for i, nanoseconds in enumerate(reversed(profiler.frame_times)):
+            if i >= 234:
+                break
+            milliseconds = nanoseconds / 1e6
+            color = GREEN if milliseconds <= FRAME_TARGET * 1000 else RED
+            pygame.draw.line(surface, color, (241 - i, bottom),
+                             (241 - i, bottom - min(60, int(
+                                 milliseconds * scale))))
+        target = bottom - int(FRAME_TARGET * 1000 * scale)
+        pygame.draw.line(surface, GRAY, (8, target), (241, target))
+        return surface
+
+    return cached_panel("profiler", profiler.frame // 15, build)
+
+# Function to list the profiler overlay for the display list
+def profiler_display_item():
+    surface = profiler_surface()
+    return ("profiler", surface.get_rect(topleft=(10, 40)),
+            profiler.frame // 15, lambda: screen.blit(surface, (10, 40)))
+
+# Function to list the network status for the display list: the round trip
+# and input delay, and who the game is waiting for
+def net_display_item(lockstep):
+    rtt = lockstep.peer.rtt
+    text = f"Ping {rtt * 1000:.0f} ms" if rtt is not None else "Ping -"
+    text += f", input delay {lockstep.input_delay}"
+    if lockstep.waiting and not lockstep.match.is_idle():
+        text += ", waiting for the other player"
+    rendered = render_text(text, 20, GRAY)
+    rect = rendered.get_rect(bottomleft=(10, HEIGHT - 8))
+    return ("net", rect, text, lambda: screen.blit(rendered, rect))
+
+# Function to close the connection of the network game, if one was played
+def hang_up():
+    global net_peer
+    if net_peer is not None:
+        net_peer.close()
+        net_peer = None
+
+# Function to save the replay of a match that just ended
+def save_match_replay(recorder):
+    if not RECORD_REPLAYS:
+        return
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{recorder.seed:016x}.ottr"
+    try:
+        os.makedirs(REPLAY_DIR, exist_ok=True)
+        save_replay(os.path.join(REPLAY_DIR, name), recorder.replay)
+    except OSError as e:
+        print(f"Could not save replay. Exception: {e}")
+
+# Game scene class: one match, until it is won or left for the main menu
+class GameScene(Scene):
+    frame_interval = 1 / MAX_FPS
+
+    def __init__(self, options, seed, stars, difficulty=None,
+                 against_computer=False, peer=None):
+        super().__init__()
+        self.options = options
+        self.stars = stars
+
+        # Initialize the match: tanks, wind and turn order. A network game
+        # gets its settings from the host, like a replay.
+        if peer is not None:
+            self.match = replay_match(peer.settings)
+            self.inputs = None
+        elif options.replay is None:
+            self.match = Match(difficulty, seed=seed,
+                               width=options.world_width,
+                               bitmap=options.bitmap,
+                               settling=options.settling)
+            self.inputs = None
         else:
-            wind = random.uniform(-2, 2)  # Strong wind
-
-        turn_counter = 0
-        shot_fired = False
-        turn_start_time = pygame.time.get_ticks()  # Initialize turn start time
-
-        font = pygame.font.Font(None, 24)
+            self.match = replay_match(options.replay)
+            # Controls for every tick
+            self.inputs = iter_inputs(options.replay)
+        match = self.match
+        self.recorder = ReplayRecorder(match)
+        # Difficulty also sets how well the computer aims
+        self.computer = ComputerPlayer(match, match.tanks[1], difficulty) \
+            if against_computer else None
+        # Over the network each side plays one tank, the host red
+        self.net = Lockstep(match, peer.local, peer, self.recorder) \
+            if peer is not None else None
+        self.ground_layer = GroundLayer(match.ground, match.mask)
+        # On a world wider than the screen the camera follows the action
+        self.camera = Camera(match.width)
+        self.camera.center_on(match.current_tank.x)
+        self.renderer = DirtyRenderer(screen, BLACK, enabled=USE_DIRTY_RECTS)
+        # Cosmetic only, with their own RNG so replays look the same
+        self.particles = ParticleSystem(MAX_PARTICLES,
+                                        np.random.default_rng(seed))
+
+        self.turn_start_time = pygame.time.get_ticks()  # Initialize turn start time
 
         # Initialize explosions list
-        explosions = []
+        self.explosions = []
 
         # Arrow animation variables
-        arrow_offset = 0
-        arrow_direction = 1
-        arrow_speed = 0.5
-        max_offset = 5
-
-        # Function to handle the end of a turn
-        def end_turn():
-            nonlocal current_tank, turn_counter, shot_fired, projectile, wind, turn_start_time
-            current_tank = tank2 if current_tank == tank1 else tank1
-            turn_counter += 1
-            projectile = None
-            shot_fired = False
-            turn_start_time = pygame.time.get_ticks()  # Reset turn start time
-
-            previous_wind = wind  # Store the previous wind value
-
-            if difficulty == "easy":
-                wind = 0  # Wind remains zero
-            elif turn_counter % 3 == 0:
-                if difficulty == "medium":
-                    wind = random.uniform(-1, 1)  # Weak wind
-                else:
-                    wind = random.uniform(-2, 2)  # Strong wind
-
-            # If the wind has changed, play the wind sound
-            if wind != previous_wind:
-                # Add a slight delay to ensure the sound plays fully
-                pygame.time.delay(100)
-                wind_sound_channel.play(wind_sound)
-
-        # Main game loop
-        game_over = False
-        while running and not game_over:
-            screen.fill(BLACK)
-            draw_stars(stars)
-            draw_ground(ground)
+        self.arrow_offset = 0
+        self.arrow_direction = 1
+        self.arrow_speed = 0.5
+        self.max_offset = 5
+
+        # The simulation runs in fixed ticks; frames are drawn in between
+        self.stepper = FixedTimestep()
+        self.events = []  # Events since the last frame
+        self.fire_requested = False
+        self.switch_requested = False
+        self.cannon_moving = False  # Whether the computer or replay turned it
+
+    def enter(self):
+        # Back from the pause menu: redraw everything, don't count the time
+        # spent paused and don't profile the frame the pause cut short
+        self.renderer.invalidate()
+        self.stepper.reset()
+        profiler.set_enabled(profiler.enabled)
+
+    def handle(self, event):
+        self.events.append(event)  # Handled at the start of the next frame
+
+    def frame(self, elapsed):
+        global show_profiler
+        match, particles, camera = self.match, self.particles, self.camera
+        renderer, stepper = self.renderer, self.stepper
+        tank1 = match.tanks[0]
+
+        profiler.lap("wait")  # Since the last frame, in SceneManager.wait
+        profiler.begin_frame()
+        frame_start = time.perf_counter()
+
+        events, self.events = self.events, []
+        for event in events:
+            if event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_ESCAPE:
+                    audio.set_looping("cannon", False)
+                    self.manager.push(PauseScene(self))
+                    return
+                if event.key == pygame.K_m:
+                    # Toggle mute for background music
+                    audio.toggle_mute()
+                if event.key == pygame.K_SPACE:
+                    self.fire_requested = True  # Fired on the next tick
+                if event.key == pygame.K_w:
+                    self.switch_requested = True
+                if event.key == pygame.K_F3:
+                    # The profiler keeps running while it logs to a file
+                    show_profiler = not show_profiler
+                    profiler.set_enabled(show_profiler
+                                         or profiler.export is not None)
+                    renderer.invalidate()
+        profiler.lap("events")
+
+        # Held keys repeat once per tick, so aiming speed is time-based
+        keys = pygame.key.get_pressed()
+        aim = keys[pygame.K_RIGHT] - keys[pygame.K_LEFT]
+        power = keys[pygame.K_UP] - keys[pygame.K_DOWN]
+        computer = self.computer
+        computer_turn = computer and match.current_tank is computer.tank
+        net_turn = self.net is not None \
+            and match.current_tank is not match.tanks[self.net.local]
+        if computer_turn or net_turn or self.inputs is not None:
+            # Set by the computer's, the replay's or the other player's aim
+            angle_adjusting = self.cannon_moving
+        else:
+            angle_adjusting = keys[pygame.K_LEFT] or keys[pygame.K_RIGHT]
 
-            # Update tanks' positions based on ground height
-            tank1.y = HEIGHT - ground[int(tank1.x)]
-            tank2.y = HEIGHT - ground[int(tank2.x)]
+        # Play or stop the moving cannon sound
+        audio.set_looping("cannon", angle_adjusting)
 
-            tank1.draw(screen)
-            tank2.draw(screen)
+        # Hold F to fast-forward a shell in flight; replays can run at any
+        # speed on top of that. Network games keep to the clock.
+        speed = self.options.speed
+        if keys[pygame.K_f] and (match.shells or match.is_settling()) \
+                and self.net is None:
+            stepper.time_scale = FAST_FORWARD_SCALE * speed
+        else:
+            stepper.time_scale = speed
 
-            draw_health_icons(tank1, tank2)  # Draw health icons
+        profiler.lap("input")
+        for _ in range(stepper.advance(elapsed)):
+            move_stars(self.stars)
 
             # Update arrow animation only if less than 3 seconds have passed
-            if (pygame.time.get_ticks() - turn_start_time) < 3000:
-                # Update arrow animation
-                arrow_offset += arrow_direction * arrow_speed
-                if arrow_offset > max_offset or arrow_offset < -max_offset:
-                    arrow_direction *= -1
-
-                # Draw animated arrow above the current tank
-                draw_animated_arrow(current_tank, arrow_offset)
-
-            if projectile and projectile.active:
-                projectile.move(wind)
-                projectile.draw(screen)
-
-                # Check if the projectile hits the ground
-                if 0 <= int(projectile.x) < WIDTH:
-                    if projectile.y >= HEIGHT - ground[int(projectile.x)]:
-                        # Play explosion sound
-                        explosion_sound.play()
-
-                        # Create explosion
-                        explosion = Explosion(projectile.x, projectile.y)
-                        explosions.append(explosion)
-
-                        # Create crater
-                        crater_radius = 15
-                        for i in range(
-                            int(projectile.x) - crater_radius,
-                            int(projectile.x) + crater_radius,
-                        ):
-                            if 0 <= i < WIDTH:
-                                distance = abs(i - projectile.x)
-                                if distance <= crater_radius:
-                                    depth = ((crater_radius - distance)
-                                             ** 0.5) * 5
-                                    ground[i] = max(0, ground[i] - int(depth))
-                        projectile.active = False
-                        end_turn()  # Switch turns
-
-                # Check if the other tank is hit
-                if tank1.is_hit(projectile) or tank2.is_hit(projectile):
-                    hit_tank = tank1 if tank1.is_hit(projectile) else tank2
-                    hit_tank.health -= 1
-                    explosion_sound.play()  # Play explosion sound
-
-                    # Create explosion
-                    explosion = Explosion(projectile.x, projectile.y)
-                    explosions.append(explosion)
-
-                    projectile.active = False
-                    if hit_tank.health <= 0:
-                        winner_color = "Red" if hit_tank == tank2 else "Blue"
-                        choice = draw_game_over(winner_color)
-                        if choice == "rematch":
-                            game_over = True  # Will restart the game loop
-                        elif choice == "quit":
-                            pygame.quit()
-                            sys.exit()
-                    else:
-                        end_turn()  # Switch turns
-
-            # Update and draw explosions
-            for explosion in explosions[:]:
+            if (pygame.time.get_ticks() - self.turn_start_time) < 3000:
+                self.arrow_offset += self.arrow_direction * self.arrow_speed
+                if self.arrow_offset > self.max_offset \
+                        or self.arrow_offset < -self.max_offset:
+                    self.arrow_direction *= -1
+
+            if self.net is not None:
+                # The ticks the network lets run now: none while waiting for
+                # the other player, a few while catching up
+                try:
+                    ticks = self.net.step(Controls(
+                        aim, power, self.fire_requested,
+                        int(self.switch_requested)))
+                except NetError as e:
+                    audio.set_looping("cannon", False)
+                    hang_up()
+                    self.manager.push(NetErrorScene(str(e), self.options))
+                    return
+            else:
+                if self.inputs is not None:
+                    # Once a replay runs out the match just sits idle
+                    controls = next(self.inputs, NO_INPUT)
+                    self.cannon_moving = bool(controls.aim)
+                elif computer and match.current_tank is computer.tank:
+                    # The computer thinks for a slice of each tick at most
+                    controls = computer.controls()
+                    self.cannon_moving = bool(controls.aim)
+                else:
+                    controls = Controls(aim, power, self.fire_requested,
+                                        int(self.switch_requested))
+                self.recorder.record(controls)
+                ticks = [(controls, match.tick(controls))]
+            self.fire_requested = self.switch_requested = False
+            for controls, events in ticks:
+                if self.net is not None:
+                    self.cannon_moving = bool(controls.aim)
+                for event in events:
+                    if event.kind in ("shot", "split"):
+                        audio.play("shoot")  # Play shooting sound
+                    if event.kind in ("crater", "hit", "fall"):
+                        audio.play("explosion")  # Play explosion sound
+                        self.explosions.append(Explosion(event.x, event.y))
+                    if event.kind == "shot":
+                        # Sparks from the end of the cannon
+                        shooter = event.tank
+                        radian_angle = math.radians(shooter.angle)
+                        particles.flash(
+                            shooter.x + math.cos(radian_angle) * 30,
+                            shooter.y - 10 - math.sin(radian_angle) * 30,
+                            shooter.angle)
+                    elif event.kind == "split":
+                        particles.flash(event.x, event.y, 90)
+                    elif event.kind == "hit":
+                        particles.flash(event.x, event.y, 90, count=40)
+                    elif event.kind == "fall":
+                        # Dust from under a tank that landed hard
+                        particles.debris(event.x, event.y, 40, speed=2.0)
+                    if event.kind in ("crater", "settle"):
+                        renderer.mark_dirty(self.ground_layer.repaint(
+                            event.columns).move(-camera.offset, 0))
+                    if event.kind == "crater":
+                        # More dirt from bigger craters
+                        particles.debris(event.x, event.y,
+                                         2 * len(event.columns))
+                    elif event.kind == "turn_end":
+                        self.turn_start_time = pygame.time.get_ticks()  # Reset turn start time
+                    elif event.kind == "wind_change":
+                        # Play the wind sound a moment later, so it is not cut
+                        # off, without holding up the game
+                        self.manager.timers.schedule(
+                            0.1, lambda: audio.play("wind"))
+                    elif event.kind == "game_over":
+                        if self.options.replay is None:
+                            save_match_replay(self.recorder)
+                        winner_color = "Red" if event.tank is tank1 \
+                            else "Blue"
+                        audio.set_looping("cannon", False)
+                        audio.flush()  # The last hit's explosion
+                        self.manager.push(GameOverScene(winner_color,
+                                                        self.options))
+                        return
+
+            # Smoke behind every shell, then move all particles
+            _, shell_x, shell_y = match.shells.positions()
+            particles.update(match.wind, match.ground)
+            particles.smoke(shell_x, shell_y)
+
+            # Follow the middle of the shells, or the tank to shoot
+            camera.follow(shell_x.mean() if shell_x.size
+                          else match.current_tank.x)
+
+            # Update explosions
+            for explosion in self.explosions[:]:
                 explosion.update()
-                explosion.draw(screen)
                 if not explosion.active:
-                    explosions.remove(explosion)
-
-            # Check if the projectile is inactive after being fired
-            if projectile and not projectile.active and shot_fired:
-                end_turn()
-
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    running = False
-                    pygame.quit()
-                    sys.exit()
-                if event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_ESCAPE:
-                        choice = draw_pause_menu(stars)
-                        if choice == "main_menu":
-                            game_over = True  # Exit to main menu
-                            # Load and play main menu music
-                            try:
-                                pygame.mixer.music.load(
-                                    os.path.join("music", "mainmenu.ogg"))
-                                pygame.mixer.music.play(-1)
-                                pygame.mixer.music.set_volume(0.5)
-                            except Exception as e:
-                                print(f"Could not load main menu music."
-                                      f" Exception: {e}")
-                                pygame.quit()
-                                sys.exit()
-                            break
-                        elif choice == "quit":
-                            pygame.quit()
-                            sys.exit()
-                        # If 'continue', do nothing
-                    if event.key == pygame.K_m:
-                        # Toggle mute for background music
-                        if pygame.mixer.music.get_volume() > 0:
-                            pygame.mixer.music.set_volume(0)
-                        else:
-                            pygame.mixer.music.set_volume(0.5)
-                    if event.key == pygame.K_SPACE:
-                        if not shot_fired and (projectile is None or not projectile.active):
-                            projectile = current_tank.shoot()
-                            shoot_sound.play()  # Play shooting sound
-                            shot_fired = True
-
-            keys = pygame.key.get_pressed()
-            angle_adjusting = False
-
-            if keys[pygame.K_LEFT]:
-                current_tank.aim(-1)
-                angle_adjusting = True
-            if keys[pygame.K_RIGHT]:
-                current_tank.aim(1)
-                angle_adjusting = True
-
-            # Play or stop the moving cannon sound
-            if angle_adjusting:
-                if not moving_cannon_channel.get_busy():
-                    moving_cannon_channel.play(moving_cannon_sound, loops=-1)
-            else:
-                if moving_cannon_channel.get_busy():
-                    moving_cannon_channel.stop()
-
-            if keys[pygame.K_UP]:
-                current_tank.change_power(1)
-            if keys[pygame.K_DOWN]:
-                current_tank.change_power(-1)
-
-            # Display current power, angle, and wind speed as HUD elements
-            hud_x = WIDTH // 2 - 100  # Centered HUD rectangle, width is 200
-            pygame.draw.rect(screen, GRAY, (hud_x, 10, 200, 100))  # HUD bg
-            pygame.draw.rect(screen, WHITE, (hud_x, 10, 200, 100), 2)  # Border
-
-            # Power slider
-            pygame.draw.line(screen, WHITE, (hud_x + 10, 40),
-                             (hud_x + 190, 40), 3)
-            power_pos = hud_x + 10 + int(((current_tank.power - 10) / 60)
-                                         * 180)
-            pygame.draw.circle(
-                screen,
-                RED,
-                (power_pos, 40),
-                10,
-            )
-            power_label = font.render("Power", True, WHITE)
-            screen.blit(power_label, (hud_x + 10, 20))
-
-            # Angle slider
-            pygame.draw.line(screen, WHITE, (hud_x + 10, 70),
-                             (hud_x + 190, 70), 3)
-            angle_pos = hud_x + 10 + int((current_tank.angle / 180) * 180)
-            pygame.draw.circle(
-                screen,
-                BLUE,
-                (angle_pos, 70),
-                10,
-            )
-            angle_label = font.render("Angle", True, WHITE)
-            screen.blit(angle_label, (hud_x + 10, 50))
-
-            # Wind indicator
-            wind_label = font.render(f"Wind: {wind:.2f}", True, WHITE)
-            screen.blit(wind_label, (hud_x + 10, 90))
-
-            pygame.display.flip()
-            clock.tick(60)  # Limit frame rate to 60 FPS
+                    self.explosions.remove(explosion)
+
+        # Draw only what changed, or the whole screen when much did.
+        # Shells are drawn between their last two ticks for smooth motion.
+        profiler.lap("simulation")
+        show_arrow = (pygame.time.get_ticks() - self.turn_start_time) < 3000
+        items = game_display_list(
+            self.stars, self.ground_layer, match, self.explosions,
+            self.arrow_offset if show_arrow else None, stepper.alpha,
+            camera.offset, particles)
+        if self.net is not None:
+            items.append(net_display_item(self.net))
+        if show_profiler:
+            items.append(profiler_display_item())
+        if profiler.enabled:
+            items = profiled_display_list(items)
+        profiler.lap("display list")
+        renderer.present(items)
+        profiler.lap("present")
+        # Fewer particles while frames take too long
+        particles.adapt(time.perf_counter() - frame_start, FRAME_TARGET)
+        # Start the sounds this frame asked for, once each
+        audio.flush()
+
+# Function to start a round: a fresh seed and sky, then the main menu, or
+# straight into the match for a replay, or to connecting for a network game
+def start_round(manager, options):
+    hang_up()  # Leaving a network game
+
+    # Terrain, wind and stars all follow from the seed; a replay brings its
+    # own, so the match plays out exactly as it was recorded. A network
+    # match is played from the host's seed, sent when the other side joins.
+    seed = options.replay.seed if options.replay is not None else new_seed()
+    sky_rng.seed(seed)
+
+    stars = [
+        [
+            sky_rng.randint(0, WIDTH),
+            sky_rng.randint(0, HEIGHT),
+            sky_rng.uniform(0.2, 0.5),
+        ]
+        for _ in range(100)
+    ]
+
+    # Load and play main menu music, or the game music for a replay
+    if options.network is not None:
+        play_music("mainmenu.ogg", "main menu")
+        manager.reset(ConnectScene(options, seed, stars))
+    elif options.replay is None:
+        play_music("mainmenu.ogg", "main menu")
+        manager.reset(MainMenuScene(options, seed, stars))
+    else:
+        play_music("firefight.ogg", "game")
+        manager.reset(GameScene(options, seed, stars))
 
-        # If the game is over and a rematch was selected, the loop restarts
-        # If the game is over and quit was selected, the program exits
+# Main game function
+def main(replay=None, speed=1.0, world_width=WIDTH, bitmap=False,
+         settling=False, network=None):
+    init_display()
+    # Every scene runs in the manager's loop until one quits the game
+    manager = SceneManager()
+    manager.push(LoadingScene(GameOptions(replay, speed, world_width, bitmap,
+                                          settling, network)))
+    manager.run()
+    hang_up()
+    if net_thread is not None:
+        net_thread.stop()
+    pygame.quit()
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Over The Top Tanks")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--replay", help="watch a recorded match")
+    mode.add_argument("--host", type=int, nargs="?", const=DEFAULT_PORT,
+                      metavar="PORT",
+                      help=f"host a network game (default port "
+                           f"{DEFAULT_PORT}); you play red")
+    mode.add_argument("--join", metavar="ADDRESS[:PORT]",
+                      help="join a network game; you play blue")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="playback speed for --replay, e.g. 4")
+    parser.add_argument("--world-width", type=int, default=WIDTH,
+                        help="width of the battlefield in pixels, at least "
+                             f"{MIN_WIDTH}; wider than the window scrolls")
+    parser.add_argument("--bitmap-terrain", action="store_true",
+                        help="pixel terrain that craters can undercut, "
+                             "leaving overhangs and tunnels")
+    parser.add_argument("--settling", action="store_true",
+                        help="ground slides and falls after craters, and "
+                             "tanks take damage from long falls")
+    parser.add_argument("--profile-log",
+                        help="write the time of every stage of every frame "
+                             "to a .csv or .jsonl file")
+    parser.add_argument("--difficulty", choices=("easy", "medium", "hard"),
+                        default="medium",
+                        help="wind strength of a hosted network game")
+    parser.add_argument("--net-latency", type=float, default=0,
+                        metavar="MS",
+                        help="add this much latency to every packet sent, "
+                             "to try network play on one machine")
+    parser.add_argument("--net-jitter", type=float, default=0, metavar="MS",
+                        help="add up to this much more at random")
+    parser.add_argument("--net-loss", type=float, default=0, metavar="SHARE",
+                        help="drop this share of the packets sent, e.g. 0.1")
+    args = parser.parse_args()
+    if args.world_width < MIN_WIDTH:
+        parser.error(f"--world-width must be at least {MIN_WIDTH}")
+    network = None
+    if args.host is not None or args.join:
+        if args.join:
+            address, _, port = args.join.partition(":")
+            address = (address, int(port) if port else DEFAULT_PORT)
+        else:
+            address = ("0.0.0.0", args.host)
+        network = NetOptions(args.host is not None, address, args.difficulty,
+                             NetConditions(args.net_latency / 1000,
+                                           args.net_jitter / 1000,
+                                           args.net_loss))
+    if args.profile_log:
+        profiler.start_export(args.profile_log)
+    try:
+        main(load_replay(args.replay) if args.replay else None, args.speed,
+             args.world_width, args.bitmap_terrain, args.settling, network)
+    finally:
+        profiler.close()
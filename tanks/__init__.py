@@ -0,0 +1,6 @@
+"""Game logic and helpers for Over The Top Tanks.
+
+The modules in this package do not open a window or an audio device when
+imported, so they can be used from tools, bots and servers as well as from
+the pygame front end in ``Over The Top Tanks.py``.
+"""
@@ -0,0 +1,315 @@
+"""Computer opponent for Over The Top Tanks.
+
+``ShotSolver`` picks an angle and power for a tank by searching over the
+game's own physics. For each candidate angle it root-finds the power whose
+closed-form flight comes down through the target's height right on the
+target, starting from a coarse spread of angles and refining around the
+best one. Only promising shots are checked against the terrain and tanks
+with ``find_impact``. The search is a generator that does one small piece
+of work per step, so it can be spread over several frames, and it stops at
+a hard time budget with the best shot found so far.
+
+``ComputerPlayer`` drives a tank through the same ``Controls`` a human
+uses: it runs the solver a slice per tick, adds aim error for its skill
+level, turns the cannon towards the result and fires.
+"""
+import math
+import random
+import time
+from collections import namedtuple
+
+from tanks.simulation import (
+    NO_INPUT,
+    TANK,
+    TANK_HALF_WIDTH,
+    WIND_RESISTANCE,
+    Controls,
+)
+from tanks.trajectory import (
+    find_impact,
+    flight_terms,
+    launch_velocities,
+)
+
+# Hard compute limit per turn, and the most the solver may use in one tick
+THINK_BUDGET = 0.005
+TICK_SLICE = 0.002
+
+# Aim error as standard deviations of (angle, power). Skill never buys
+# extra computation, it only spoils a good solution.
+AI_SKILLS = {
+    "easy": (6.0, 4.0),
+    "medium": (3.0, 2.0),
+    "hard": (1.0, 0.5),
+}
+
+# Elevations tried first, in degrees up from the ground towards the target.
+# Past 90 the shell goes backwards and needs the wind to carry it over.
+_COARSE_ELEVATIONS = (45, 30, 60, 15, 75, 90, 120, 150)
+# Steps around the best elevation once the coarse pass is done
+_FINE_STEPS = (5, 2, 1)
+_MIN_ELEVATION = 5
+_MAX_ELEVATION = 175
+_MIN_POWER = 10
+_MAX_POWER = 70
+# Shells aim this far above a tank's base, into the hull, so they do not
+# come down on the ground just in front of it
+_AIM_HEIGHT = 10
+_POWER_ITERATIONS = 8
+_NEWTON_ITERATIONS = 8
+_LOG_RESISTANCE = math.log(WIND_RESISTANCE)
+
+# The shot a solver settled on; miss is the distance from the target in
+# pixels and hit says whether the terrain check saw the shot strike it
+Shot = namedtuple("Shot", ["angle", "power", "miss", "hit"])
+
+
+# Function to find where a shell comes down through a height, ignoring terrain
+def plane_crossing(x, y, velocity_x, velocity_y, wind, target_y,
+                   max_frames=10000):
+    """Return the x where the falling shell reaches ``target_y``.
+
+    Solves y(k) = target_y on the falling part of the closed-form flight
+    with Newton's method, which converges from the far side because the
+    height is convex in k. A shell whose peak stays below ``target_y``
+    (it cannot climb that high) reports the x of its peak instead, so it
+    still counts as short. Returns None if it is still rising after
+    ``max_frames``.
+    """
+    (_, coef_x, drift_x,
+     _, coef_y, drift_y) = flight_terms(velocity_x, velocity_y, wind)
+
+    def position(start, drift, coef, k):
+        return start + k * drift + coef * (1 - WIND_RESISTANCE ** k)
+
+    # The peak is where the vertical speed is zero
+    peak = 0.0
+    if coef_y:
+        turning = drift_y / (coef_y * _LOG_RESISTANCE)
+        if turning > 0:
+            peak = max(0.0, math.log(turning) / _LOG_RESISTANCE)
+    if position(y, drift_y, coef_y, peak) > target_y:
+        return position(x, drift_x, coef_x, peak)
+
+    # Step past the crossing, then walk back to it
+    k = max(peak, 1.0)
+    while position(y, drift_y, coef_y, k) < target_y:
+        k *= 2
+        if k > max_frames:
+            return None
+    for _ in range(_NEWTON_ITERATIONS):
+        slope = drift_y - coef_y * WIND_RESISTANCE ** k * _LOG_RESISTANCE
+        if slope <= 0:
+            break
+        k -= (position(y, drift_y, coef_y, k) - target_y) / slope
+    return position(x, drift_x, coef_x, k)
+
+
+# Shot solver class
+class ShotSolver:
+    def __init__(self, match, tank=None, target=None, budget=THINK_BUDGET):
+        self.match = match
+        self.tank = tank if tank is not None else match.current_tank
+        if target is None:
+            target = match.tanks[1] if self.tank is match.tanks[0] \
+                else match.tanks[0]
+        self.target = target
+        self.target_index = match.tanks.index(target)
+        self.budget = budget
+        self.spent = 0.0
+        self.best = None
+        self.best_elevation = None
+        self.done = False
+        # Which way to shoot: 1 for right, -1 for left
+        self.direction = 1 if target.x >= self.tank.x else -1
+        self._search = self._run()
+
+    def step(self, time_slice=TICK_SLICE):
+        """Search for up to ``time_slice`` seconds; True once finished.
+
+        The budget is checked between pieces of work, and each piece is
+        a single root find or terrain check, well under a millisecond.
+        The first candidate shot is always found, however small the
+        budget, so ``best`` is set once this returns True.
+        """
+        if self.done:
+            return True
+        start = time.perf_counter()
+        limit = min(time_slice, self.budget - self.spent)
+        while time.perf_counter() - start < limit or self.best is None:
+            try:
+                next(self._search)
+            except StopIteration:
+                self.done = True
+                break
+        self.spent += time.perf_counter() - start
+        if self.spent >= self.budget:
+            self.done = True
+        return self.done
+
+    def solve(self):
+        """Run the whole search now, still within the budget."""
+        while not self.step(self.budget):
+            pass
+        return self.best
+
+    def angle_for(self, elevation):
+        return elevation if self.direction > 0 else 180 - elevation
+
+    def plane_miss(self, angle, power):
+        # Signed miss along the shooting direction: negative is short
+        velocity_x, velocity_y = launch_velocities(angle, power)
+        landing = plane_crossing(self.tank.x, self.tank.y - 10,
+                                 float(velocity_x), float(velocity_y),
+                                 self.match.wind,
+                                 self.target.y - _AIM_HEIGHT)
+        if landing is None:
+            return -math.inf
+        return (landing - self.target.x) * self.direction
+
+    def solve_power(self, angle):
+        """Root-find the power that lands on the target for an angle.
+
+        Uses regula falsi with the Illinois fix on the signed miss, which
+        grows with power. Returns (power, signed miss) with power rounded
+        to a whole step, as the keyboard sets it.
+        """
+        low, high = _MIN_POWER, _MAX_POWER
+        miss_low = self.plane_miss(angle, low)
+        miss_high = self.plane_miss(angle, high)
+        if miss_low >= 0:
+            return low, miss_low  # Even the weakest shot flies too far
+        if miss_high <= 0 or math.isinf(miss_low):
+            return high, miss_high  # The strongest shot falls short
+
+        side = 0
+        power = high
+        for _ in range(_POWER_ITERATIONS):
+            power = (low * miss_high - high * miss_low) / (miss_high
+                                                          - miss_low)
+            miss = self.plane_miss(angle, power)
+            if abs(miss) < 1:
+                break
+            if miss < 0:
+                low, miss_low = power, miss
+                if side == -1:
+                    miss_high /= 2
+                side = -1
+            else:
+                high, miss_high = power, miss
+                if side == 1:
+                    miss_low /= 2
+                side = 1
+
+        # Pick the closer of the two whole powers around the root
+        candidates = {max(_MIN_POWER, min(_MAX_POWER, whole))
+                      for whole in (math.floor(power), math.ceil(power))}
+        return min(((whole, self.plane_miss(angle, whole))
+                    for whole in candidates), key=lambda c: abs(c[1]))
+
+    def check(self, angle, power):
+        # Fly the shot against the real terrain and tanks
+        velocity_x, velocity_y = launch_velocities(angle, power)
+        impact = find_impact(self.tank.x, self.tank.y - 10, float(velocity_x),
+                             float(velocity_y), self.match.wind,
+                             self.match.ground, self.match.tanks,
+                             self._terrain_index, swept=self.match.swept)
+        if impact.outcome == TANK:
+            if impact.tank == self.target_index:
+                return Shot(angle, power, 0.0, True)
+            return Shot(angle, power, math.inf, False)  # Own goal
+        return Shot(angle, power, abs(impact.x - self.target.x), False)
+
+    def consider(self, shot, elevation):
+        if self.best is None or (not self.best.hit and (
+                shot.hit or shot.miss < self.best.miss)):
+            self.best = shot
+            self.best_elevation = elevation
+
+    def try_elevation(self, elevation):
+        # One root find, then a terrain check only if it looks like a hit
+        angle = self.angle_for(elevation)
+        power, miss = self.solve_power(angle)
+        yield
+        if abs(miss) < TANK_HALF_WIDTH:
+            self.consider(self.check(angle, power), elevation)
+            yield
+        else:
+            self.consider(Shot(angle, power, abs(miss), False), elevation)
+
+    def _run(self):
+        # The match keeps range maxima over its ground up to date, so only
+        # the columns craters changed since the last search are redone
+        self._terrain_index = self.match.ground_index
+        self._terrain_index.refresh()
+        yield
+
+        # Coarse pass over a spread of elevations
+        for elevation in _COARSE_ELEVATIONS:
+            yield from self.try_elevation(elevation)
+            if self.best.hit:
+                return
+
+        # Fine passes around the best elevation so far
+        for step in _FINE_STEPS:
+            center = self.best_elevation
+            for elevation in (center - step, center + step):
+                if not _MIN_ELEVATION <= elevation <= _MAX_ELEVATION:
+                    continue
+                yield from self.try_elevation(elevation)
+                if self.best.hit:
+                    return
+
+
+# Computer player class
+class ComputerPlayer:
+    def __init__(self, match, tank, skill="medium", rng=random,
+                 budget=THINK_BUDGET):
+        self.match = match
+        self.tank = tank
+        self.angle_error, self.power_error = AI_SKILLS[skill]
+        self.rng = rng
+        self.budget = budget
+        self.solver = None
+        self.goal = None  # (angle, power) the cannon is turning towards
+        self.turn = None
+
+    def controls(self, time_slice=TICK_SLICE):
+        """Return the Controls for this tick, thinking a slice if needed."""
+        match = self.match
+        if match.current_tank is not self.tank or not match.can_fire():
+            return NO_INPUT
+        if self.turn != match.turn_counter:
+            self.turn = match.turn_counter
+            self.solver = ShotSolver(match, self.tank, budget=self.budget)
+            self.goal = None
+
+        if self.goal is None:
+            if not self.solver.step(time_slice):
+                return NO_INPUT  # Still thinking
+            self.goal = self.spoil(self.solver.best)
+
+        angle, power = self.goal
+        aim = (angle > self.tank.angle) - (angle < self.tank.angle)
+        change = (power > self.tank.power) - (power < self.tank.power)
+        return Controls(aim, change, not aim and not change)
+
+    def spoil(self, shot):
+        # Add this skill's aim error to a shot; returns (angle, power)
+        angle = shot.angle + self.rng.gauss(0, self.angle_error)
+        power = shot.power + self.rng.gauss(0, self.power_error)
+        return (max(0, min(180, round(angle))),
+                max(_MIN_POWER, min(_MAX_POWER, round(power))))
+
+    def take_turn(self):
+        """Think with the whole budget, set the cannon and fire, all at once.
+
+        This is the shot ``controls`` works towards over many ticks; the
+        ticks spent turning the cannon change nothing else, so headless
+        matches skip them. Returns what ``Match.fire`` returns.
+        """
+        self.turn = self.match.turn_counter
+        self.solver = ShotSolver(self.match, self.tank, budget=self.budget)
+        self.goal = self.spoil(self.solver.solve())
+        self.tank.angle, self.tank.power = self.goal
+        return self.match.fire()
@@ -0,0 +1,121 @@
+"""Images, sounds and music, loaded once in the background.
+
+``AssetManager`` reads every file the game needs on a worker thread while
+the window is already up and showing progress, and decodes images and
+sounds there too. Each file is read from disk exactly once: the decoded
+surfaces and sounds are kept by path, and music is kept as the bytes of
+the file, which ``pygame.mixer.music.load`` streams from memory. Switching
+between the menus and the game then never touches the disk, which matters
+when the game is installed on a slow network drive.
+
+Surfaces decoded on the worker are not converted to the screen's format
+yet; that, and anything else that needs the display, is left to the main
+thread once ``ready`` is True. ``pack_atlas`` puts small sprites side by
+side on one surface, so they share a single texture and are blitted from
+subsurfaces of it.
+"""
+import io
+import os
+import threading
+
+import pygame
+
+# Kinds of asset and what they become once loaded
+IMAGE = "image"  # An unconverted pygame.Surface
+SOUND = "sound"  # A pygame.mixer.Sound
+MUSIC = "music"  # The file's bytes, for pygame.mixer.music.load
+
+# Space between sprites on an atlas, so scaled or filtered blits never
+# pick up a neighbour's pixels
+ATLAS_PADDING = 1
+
+
+# Asset manager class
+class AssetManager:
+    def __init__(self, resolve=os.path.abspath):
+        self.resolve = resolve  # Turns a relative path into a real one
+        self.requested = []  # (kind, path) in the order they load
+        self.assets = {}  # path -> loaded asset
+        self.errors = {}  # path -> exception raised loading it
+        self.loaded = 0  # Requests finished so far, loaded or failed
+        self.thread = None
+
+    def request(self, kind, path):
+        if self.thread is not None:
+            raise RuntimeError("assets can only be requested before start")
+        if (kind, path) not in self.requested:
+            self.requested.append((kind, path))
+
+    def start(self):
+        """Load everything requested on a background thread."""
+        self.thread = threading.Thread(target=self._load_all,
+                                       name="asset loader", daemon=True)
+        self.thread.start()
+
+    def _load_all(self):
+        for kind, path in self.requested:
+            try:
+                with open(self.resolve(path), "rb") as file:
+                    data = file.read()
+                if kind == IMAGE:
+                    asset = pygame.image.load(io.BytesIO(data), path)
+                elif kind == SOUND:
+                    asset = pygame.mixer.Sound(file=io.BytesIO(data))
+                else:
+                    asset = data
+                self.assets[path] = asset
+            except Exception as e:
+                self.errors[path] = e
+            self.loaded += 1
+
+    @property
+    def progress(self):
+        # Share of the requests finished, from 0 to 1
+        return self.loaded / len(self.requested) if self.requested else 1.0
+
+    @property
+    def ready(self):
+        return self.thread is not None and not self.thread.is_alive()
+
+    def wait(self):
+        if self.thread is None:
+            self.start()
+        self.thread.join()
+
+    def get(self, path):
+        """Return a loaded asset, raising the error that stopped it from
+        loading, if any."""
+        if path in self.errors:
+            raise self.errors[path]
+        return self.assets[path]
+
+
+# Function to pack sprites onto one surface, tallest first, in rows
+def pack_atlas(sprites, width=256):
+    """Return (atlas, {name: subsurface}) for a dict of name -> surface.
+
+    Each subsurface shows one sprite and shares the atlas's pixels.
+    """
+    places = {}
+    x = y = row_height = 0
+    atlas_width = 0
+    for name, surface in sorted(sprites.items(),
+                                key=lambda item: -item[1].get_height()):
+        sprite_width, sprite_height = surface.get_size()
+        if x and x + sprite_width > width:
+            x, y = 0, y + row_height + ATLAS_PADDING
+            row_height = 0
+        places[name] = pygame.Rect(x, y, sprite_width, sprite_height)
+        x += sprite_width + ATLAS_PADDING
+        row_height = max(row_height, sprite_height)
+        atlas_width = max(atlas_width, x - ATLAS_PADDING)
+
+    atlas = pygame.Surface((max(atlas_width, 1), max(y + row_height, 1)),
+                           pygame.SRCALPHA)
+    for name, rect in places.items():
+        # Copied as they are, not blended with the empty atlas
+        atlas.blit(sprites[name], rect, special_flags=pygame.BLEND_RGBA_MAX)
+    if pygame.display.get_surface() is not None:
+        atlas = atlas.convert_alpha()
+    return atlas, {name: atlas.subsurface(rect)
+                   for name, rect in places.items()}
@@ -0,0 +1,164 @@
+"""Sound effects and music for the front end.
+
+``AudioManager`` owns every mixer channel as one fixed pool. Sound effects
+are named cues with a priority. ``play`` only notes that a cue was asked
+for, and ``flush``, called once per frame, starts each requested cue once
+however many times it was asked for, so a volley of craters is one
+explosion. When every channel is busy, a cue takes over the channel of the
+oldest sound that is no more important than itself, or is dropped if
+everything playing matters more; rapid explosions then never cut off a
+shot or the wind. Which channel plays what, and until when, is tracked
+here, so nothing polls the mixer.
+
+Music streams from memory through ``pygame.mixer.music``, which plays one
+track at a time. ``play_music`` returns at once: the old track fades out
+in small volume steps run from a ``TimerQueue``, then the new one starts
+and fades in, so a change of music never holds up a frame.
+"""
+import io
+import itertools
+import time
+from collections import namedtuple
+
+import pygame
+
+# Seconds a change of music takes to fade out, and again to fade in
+MUSIC_FADE = 0.5
+# Seconds between volume steps while fading out
+FADE_STEP = 1 / 60
+
+# A named sound effect
+Cue = namedtuple("Cue", ["sound", "priority", "length"])
+
+# A cue playing on a channel: ends is when it stops, infinite for a loop,
+# and order is when it started, counted in cues started
+Voice = namedtuple("Voice", ["cue", "priority", "order", "ends"])
+
+
+# Audio manager class
+class AudioManager:
+    def __init__(self, timers, channels=16, music_volume=0.5,
+                 clock=time.perf_counter):
+        pygame.mixer.set_num_channels(channels)
+        self.timers = timers  # Runs the steps of music fades
+        self.clock = clock
+        self.channels = [pygame.mixer.Channel(i) for i in range(channels)]
+        self.voices = [None] * channels  # Voice on each channel, or None
+        self.cues = {}
+        self.requests = set()  # Cues asked for since the last flush
+        self.loops = {}  # Looping cue -> its channel
+        self.started = itertools.count()
+        self.music_volume = music_volume
+        self.muted = False
+        self.track = None  # Name of the music playing, or fading out
+        self.next_track = None  # (name, data) to start once it faded out
+        self.fade_start = None  # When the fade-out began, while fading
+
+    def add_cue(self, name, sound, priority=0):
+        self.cues[name] = Cue(sound, priority, sound.get_length())
+
+    def play(self, name):
+        # Ask for a cue; it starts at the next flush
+        self.requests.add(name)
+
+    def flush(self):
+        """Start every cue asked for since the last flush, once each."""
+        if not self.requests:
+            return
+        now = self.clock()
+        # The most important first, so they get the free channels
+        for name in sorted(self.requests,
+                           key=lambda name: -self.cues[name].priority):
+            self.start(name, now)
+        self.requests.clear()
+
+    def set_looping(self, name, playing):
+        # Start or stop a looping cue; the mixer is only called when that
+        # changes, or when the loop lost its channel to another cue
+        index = self.loops.get(name)
+        if index is not None and (self.voices[index] is None
+                                  or self.voices[index].cue != name):
+            del self.loops[name]
+            index = None
+        if playing and index is None:
+            index = self.start(name, self.clock(), loops=-1)
+            if index is not None:
+                self.loops[name] = index
+        elif not playing and index is not None:
+            self.channels[index].stop()
+            self.voices[index] = None
+            del self.loops[name]
+
+    def start(self, name, now, loops=0):
+        """Play a cue on a free or stolen channel; returns the channel's
+        index, or None if everything playing matters more."""
+        cue = self.cues[name]
+        index = self.channel_for(cue.priority, now)
+        if index is None:
+            return None
+        self.channels[index].play(cue.sound, loops=loops)
+        ends = now + cue.length if loops == 0 else float("inf")
+        self.voices[index] = Voice(name, cue.priority, next(self.started),
+                                   ends)
+        return index
+
+    def channel_for(self, priority, now):
+        # A free channel, or else the one playing the oldest of the least
+        # important sounds, if that is no more important than priority
+        victim = None
+        for index, voice in enumerate(self.voices):
+            if voice is None or voice.ends <= now:
+                return index
+            if voice.priority <= priority and (
+                    victim is None
+                    or (voice.priority, voice.order)
+                    < (self.voices[victim].priority,
+                       self.voices[victim].order)):
+                victim = index
+        return victim
+
+    def play_music(self, name, data):
+        """Loop a track from the bytes of its file, after fading out the
+        one playing; returns at once."""
+        if name == self.track and self.next_track is None:
+            return
+        self.next_track = (name, data)
+        if self.track is None:
+            self.start_next_track()
+        elif self.fade_start is None:
+            self.fade_start = self.clock()
+            self.timers.schedule(FADE_STEP, self.fade_step)
+
+    def fade_step(self):
+        progress = (self.clock() - self.fade_start) / MUSIC_FADE
+        if progress >= 1:
+            self.fade_start = None
+            self.start_next_track()
+            return
+        pygame.mixer.music.set_volume(self.volume() * (1 - progress))
+        self.timers.schedule(FADE_STEP, self.fade_step)
+
+    def start_next_track(self):
+        # Often run from a timer after a fade, where an error would end the
+        # game, so a track the mixer cannot play is reported and skipped
+        name, data = self.next_track
+        self.next_track = None
+        self.track = None
+        try:
+            pygame.mixer.music.load(io.BytesIO(data), name)
+        except pygame.error as e:
+            pygame.mixer.music.stop()
+            print(f"Could not play music {name}. Exception: {e}")
+            return
+        self.track = name
+        pygame.mixer.music.set_volume(self.volume())
+        pygame.mixer.music.play(-1, fade_ms=int(MUSIC_FADE * 1000))
+
+    def volume(self):
+        return 0 if self.muted else self.music_volume
+
+    def toggle_mute(self):
+        # Mute or unmute the music; a fade in progress picks it up
+        self.muted = not self.muted
+        if self.fade_start is None:
+            pygame.mixer.music.set_volume(self.volume())
@@ -0,0 +1,482 @@
+"""Benchmarks for the hot paths of the game, to catch slowdowns.
+
+Run ``python -m tanks.benchmark`` from the game's folder. It measures:
+
+- simulation: ``Projectile.move`` calls per second, whole shots
+  simulated per second with a single shell, a 500-shell volley and bitmap
+  terrain, and how many times faster than real time a single shell's
+  flight runs through ``Match.tick``, as replays re-simulate it;
+- terrain: milliseconds to generate and smooth the ground at a few widths;
+- env: shots per second through the reinforcement learning environments,
+  one match at a time and in a batch of matches;
+- render: frames per second of the real drawing code (display list, dirty
+  rectangles, ground, stars, particles and explosions) in scripted
+  scenarios: idle, a volley in flight and a barrage of explosions;
+- startup: milliseconds from launching Python to the first frame on
+  screen, and to the main menu once everything has loaded.
+
+Everything runs headless with SDL's dummy video and audio drivers, and
+every scenario is seeded, so runs measure the same work each time. Each
+benchmark keeps its best of ``--repeat`` runs, the one least disturbed by
+the rest of the machine.
+
+``--output FILE`` saves the results as JSON, and ``--baseline FILE``
+compares them with an earlier file: a metric that got more than
+``--threshold`` (10% by default) worse is a regression, and the exit status
+is 1. Noisy metrics can get their own threshold, e.g.
+``--threshold-for "render.*=0.25"``.
+"""
+import argparse
+import fnmatch
+import importlib.util
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from tanks.env import TanksEnv, TanksVectorEnv
+from tanks.scenes import TimerQueue
+from tanks.simulation import (
+    HEIGHT,
+    Event,
+    WEAPONS,
+    WIDTH,
+    Match,
+    Projectile,
+    generate_terrain,
+    smooth_ground,
+)
+from tanks.timestep import TICK_RATE
+
+# Results file layout; bumped when the meaning of a metric changes
+FORMAT_VERSION = 1
+
+# Every match, terrain and scenario is drawn from this seed
+SEED = 20240601
+
+# Health of the tanks in benchmark matches, so they can be shot at forever
+ENDLESS_HEALTH = 10 ** 9
+
+# A metric this much worse than the baseline is a regression
+DEFAULT_THRESHOLD = 0.10
+
+TERRAIN_WIDTHS = (WIDTH, 4000, 20000)
+TERRAIN_COLUMNS = 2000000  # Columns of terrain made per run, at any width
+SHOTS = 100  # Shots per simulation benchmark
+MOVES = 200000  # Projectile.move calls per run
+RENDER_FRAMES = 300  # Frames per render scenario, five seconds of play
+ENV_MATCHES = 1024  # Matches stepped at once by the vector env
+
+# The pygame front end, loaded from its file for the render benchmarks
+FRONT_END = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "Over The Top Tanks.py")
+
+# One measurement. higher_is_better is True for rates, False for times.
+Result = namedtuple("Result", ["name", "value", "unit", "higher_is_better"])
+
+
+# Function to time a function, keeping the best of several runs of number
+# calls each; returns the seconds per call
+def best_time(function, repeat, number=1):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        best = min(best, time.perf_counter() - start)
+    return best / number
+
+
+# Function to time Projectile.move on its own
+def projectile_moves():
+    wind = 0.5
+    projectile = Projectile(100, 500, 20, -20)
+    for _ in range(MOVES):
+        projectile.move(wind)
+        if not projectile.active:
+            projectile = Projectile(100, 500, 20, -20)
+
+
+# Function to make a match whose tanks cannot die, for shooting at forever
+def endless_match(weapon=0, bitmap=False):
+    match = Match("hard", seed=SEED, bitmap=bitmap)
+    for tank in match.tanks:
+        tank.health = ENDLESS_HEALTH
+        tank.weapon = weapon
+    return match
+
+
+# Function to fire SHOTS shots at random and simulate each until it lands
+def simulate_shots(match):
+    rng = random.Random(SEED)
+    for _ in range(SHOTS):
+        tank = match.current_tank
+        tank.angle = rng.randint(20, 160)
+        tank.power = rng.randint(20, 70)
+        match.fire()
+        match.resolve_shot()
+
+
+# Function to fire SHOTS single shells at random and tick each match until
+# it lands, the way a replay is re-simulated; returns the ticks played
+def tick_shots(match):
+    rng = random.Random(SEED)
+    ticks = 0
+    for _ in range(SHOTS):
+        tank = match.current_tank
+        tank.angle = rng.randint(20, 160)
+        tank.power = rng.randint(20, 70)
+        match.fire()
+        while match.shells or match.is_settling():
+            match.tick()
+            ticks += 1
+    return ticks
+
+
+def simulation_benchmarks(repeat):
+    yield Result("simulation.projectile_moves",
+                 MOVES / best_time(projectile_moves, repeat), "moves/s", True)
+    volley = [weapon.name for weapon in WEAPONS].index("Volley")
+    for name, weapon, bitmap in (("shots", 0, False),
+                                 ("volley_shots", volley, False),
+                                 ("bitmap_shots", 0, True)):
+        # A fresh match each run, made outside the timing
+        matches = [endless_match(weapon, bitmap) for _ in range(repeat)]
+        elapsed = best_time(lambda: simulate_shots(matches.pop()), repeat)
+        yield Result(f"simulation.{name}", SHOTS / elapsed, "shots/s", True)
+
+    ticks = tick_shots(endless_match())
+    matches = [endless_match() for _ in range(repeat)]
+    elapsed = best_time(lambda: tick_shots(matches.pop()), repeat)
+    yield Result("simulation.single_shell_speed", ticks / TICK_RATE / elapsed,
+                 "x real time", True)
+
+
+def terrain_benchmarks(repeat):
+    for width in TERRAIN_WIDTHS:
+        # Small maps take well under a millisecond, so time many at once
+        number = max(1, TERRAIN_COLUMNS // width)
+        elapsed = best_time(
+            lambda: generate_terrain(width, random.Random(SEED)), repeat,
+            number)
+        yield Result(f"terrain.generate_{width}", elapsed * 1000, "ms",
+                     False)
+        ground = generate_terrain(width, random.Random(SEED))
+        elapsed = best_time(lambda: smooth_ground(ground, 3), repeat, number)
+        yield Result(f"terrain.smooth_{width}", elapsed * 1000, "ms", False)
+
+
+# Function to make seeded random actions for a number of shots
+def random_actions(count):
+    rng = np.random.default_rng(SEED)
+    return np.column_stack([rng.uniform(20, 160, count),
+                            rng.uniform(20, 70, count)])
+
+
+# Function to step an env through its shots, starting over when it ends
+def env_shots(env, actions):
+    for action in actions:
+        _, _, terminated, truncated, _ = env.step(action)
+        if terminated or truncated:
+            env.reset()
+
+
+def env_benchmarks(repeat):
+    env = TanksEnv("hard", seed=SEED)
+    env.reset()
+    actions = random_actions(SHOTS)
+    elapsed = best_time(lambda: env_shots(env, actions), repeat)
+    yield Result("env.shots", SHOTS / elapsed, "shots/s", True)
+
+    # The vector env starts finished matches over by itself
+    vector = TanksVectorEnv(ENV_MATCHES, "hard", seed=SEED)
+    vector.reset()
+    actions = random_actions(ENV_MATCHES)
+    elapsed = best_time(lambda: vector.step(actions), repeat, 5)
+    yield Result("env.vector_shots", ENV_MATCHES / elapsed, "shots/s", True)
+
+
+# Function to load the pygame front end as a module, headless
+def load_front_end():
+    # The dummy drivers must be chosen before pygame starts
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+    # Images, sounds and music are found relative to the game's folder
+    os.chdir(os.path.dirname(FRONT_END))
+    spec = importlib.util.spec_from_file_location("over_the_top_tanks",
+                                                  FRONT_END)
+    game = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(game)
+    return game
+
+
+# Function to play a scripted scenario through the game's drawing code
+def render_scenario(game, scenario, frames):
+    """Run ``frames`` ticks of ``scenario`` and draw each one; returns the
+    seconds taken.
+
+    Each frame is what the game loop does for one tick: move the stars,
+    update the match, particles and explosions, then build the display list
+    and present it. The scenarios are "idle" (the turn's arrow bobbing over
+    a still battlefield), "mid_flight" (a 500-shell volley in the air,
+    fired again whenever it lands) and "multi_explosion" (ten explosions
+    and craters every ten frames).
+    """
+    game.sky_rng.seed(SEED)
+    rng = random.Random(SEED)
+    stars = [[game.sky_rng.randint(0, WIDTH), game.sky_rng.randint(0, HEIGHT),
+              game.sky_rng.uniform(0.2, 0.5)] for _ in range(100)]
+    match = endless_match(
+        [weapon.name for weapon in WEAPONS].index("Volley"))
+    ground_layer = game.GroundLayer(match.ground, match.mask)
+    renderer = game.DirtyRenderer(game.screen, game.BLACK)
+    particles = game.ParticleSystem(game.MAX_PARTICLES,
+                                    np.random.default_rng(SEED))
+    explosions = []
+    arrow_offset, arrow_direction = 0, 1
+
+    start = time.perf_counter()
+    for frame in range(frames):
+        game.move_stars(stars)
+        arrow_offset += arrow_direction * 0.5
+        if abs(arrow_offset) > 5:
+            arrow_direction *= -1
+
+        events = []
+        if scenario == "mid_flight":
+            if not match.shells:
+                match.current_tank.angle = rng.randint(45, 135)
+                match.current_tank.power = 40
+                match.fire()
+            events = match.update()
+        elif scenario == "multi_explosion" and frame % 10 == 0:
+            for _ in range(10):
+                x = rng.uniform(0, WIDTH - 1)
+                y = HEIGHT - match.ground[int(x)]
+                events.append(Event("crater", x, y,
+                                         columns=match.dig(x, y)))
+        for event in events:
+            if event.kind == "crater":
+                explosions.append(game.Explosion(event.x, event.y))
+                renderer.mark_dirty(ground_layer.repaint(event.columns))
+                particles.debris(event.x, event.y, 2 * len(event.columns))
+
+        _, shell_x, shell_y = match.shells.positions()
+        particles.update(match.wind, match.ground)
+        particles.smoke(shell_x, shell_y)
+        for explosion in explosions[:]:
+            explosion.update()
+            if not explosion.active:
+                explosions.remove(explosion)
+
+        # The tanks cannot die, but show the usual three hearts
+        for tank in match.tanks:
+            tank.health = 3
+        items = game.game_display_list(
+            stars, ground_layer, match, explosions,
+            arrow_offset if scenario == "idle" else None, 1.0, 0, particles)
+        renderer.present(items)
+        for tank in match.tanks:
+            tank.health = ENDLESS_HEALTH
+    return time.perf_counter() - start
+
+
+def render_benchmarks(repeat, frames=RENDER_FRAMES):
+    game = load_front_end()
+    game.init_display()
+    game.finish_loading(TimerQueue())
+    for scenario in ("idle", "mid_flight", "multi_explosion"):
+        elapsed = min(render_scenario(game, scenario, frames)
+                      for _ in range(repeat))
+        yield Result(f"render.{scenario}", frames / elapsed, "fps", True)
+
+
+# Function to start the game up to the main menu and print when the first
+# frame and the menu were on screen; run in a fresh Python by
+# startup_benchmarks
+def first_frame():
+    game = load_front_end()
+    game.init_display()
+    manager = game.SceneManager()
+    manager.push(game.LoadingScene(game.GameOptions()))
+    while manager.last_frame is None:
+        manager.step()
+    print(time.time())
+    while not isinstance(manager.scene, game.MainMenuScene) \
+            or manager.last_frame is None:
+        manager.step()
+    print(time.time())
+
+
+def startup_benchmarks(repeat):
+    first = menu = float("inf")
+    for _ in range(repeat):
+        # Wall-clock time, the only clock both processes share
+        start = time.time()
+        output = subprocess.run(
+            [sys.executable, "-m", "tanks.benchmark", "--first-frame"],
+            cwd=os.path.dirname(FRONT_END), capture_output=True, text=True,
+            check=True).stdout.split()
+        first = min(first, float(output[-2]) - start)
+        menu = min(menu, float(output[-1]) - start)
+    yield Result("startup.first_frame", first * 1000, "ms", False)
+    yield Result("startup.main_menu", menu * 1000, "ms", False)
+
+
+# Benchmark groups, in the order they run
+BENCHMARKS = {
+    "simulation": simulation_benchmarks,
+    "terrain": terrain_benchmarks,
+    "env": env_benchmarks,
+    "render": render_benchmarks,
+    "startup": startup_benchmarks,
+}
+
+
+# Function to run benchmark groups and print each result as it comes
+def run_benchmarks(groups=tuple(BENCHMARKS), repeat=3, output=sys.stdout):
+    results = []
+    for group in groups:
+        for result in BENCHMARKS[group](repeat):
+            results.append(result)
+            if output is not None:
+                print(f"{result.name:32} {result.value:12.2f} {result.unit}",
+                      file=output)
+    return results
+
+
+# Function to save results with a note of the machine they came from
+def save_results(path, results):
+    pygame = sys.modules.get("pygame")
+    data = {
+        "version": FORMAT_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "processor": platform.processor() or platform.machine(),
+            "numpy": np.__version__,
+            "pygame": pygame.version.ver if pygame is not None else None,
+        },
+        "results": {result.name: {"value": result.value,
+                                  "unit": result.unit,
+                                  "higher_is_better": result.higher_is_better}
+                    for result in results},
+    }
+    with open(path, "w") as file:
+        json.dump(data, file, indent=2)
+        file.write("\n")
+
+
+def load_results(path):
+    with open(path) as file:
+        data = json.load(file)
+    if data.get("version") != FORMAT_VERSION:
+        raise ValueError(f"{path}: unsupported benchmark results version "
+                         f"{data.get('version')}")
+    return [Result(name, entry["value"], entry["unit"],
+                   entry["higher_is_better"])
+            for name, entry in data["results"].items()]
+
+
+# Function to get the regression threshold of a metric: the last
+# (pattern, threshold) override whose pattern matches its name, or default
+def threshold_for(name, default=DEFAULT_THRESHOLD, overrides=()):
+    threshold = default
+    for pattern, value in overrides:
+        if fnmatch.fnmatchcase(name, pattern):
+            threshold = value
+    return threshold
+
+
+# Function to compare results with a baseline
+def compare_results(results, baseline, default=DEFAULT_THRESHOLD,
+                    overrides=()):
+    """Return (result, baseline value, change, regressed) for every result
+    the baseline also has.
+
+    ``change`` is the share the metric improved by, so it is negative when
+    it got worse, whichever way the metric goes.
+    """
+    previous = {result.name: result.value for result in baseline}
+    rows = []
+    for result in results:
+        if result.name not in previous or not previous[result.name]:
+            continue
+        before = previous[result.name]
+        change = (result.value - before) / before
+        if not result.higher_is_better:
+            change = -change
+        regressed = change < -threshold_for(result.name, default, overrides)
+        rows.append((result, before, change, regressed))
+    return rows
+
+
+# Function to parse a --threshold-for value such as "render.*=0.25"
+def threshold_override(text):
+    pattern, separator, value = text.rpartition("=")
+    if not separator or not pattern:
+        raise argparse.ArgumentTypeError(f"expected PATTERN=SHARE: {text}")
+    return pattern, float(value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the simulation, terrain, rendering and "
+                    "startup headless.")
+    parser.add_argument("groups", nargs="*",
+                        help="benchmark groups to run: "
+                             + ", ".join(BENCHMARKS) + " (default: all)")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="runs of each benchmark; the best counts")
+    parser.add_argument("--output", help="save the results to a JSON file")
+    parser.add_argument("--baseline",
+                        help="compare with results saved by --output")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="share a metric may get worse before it counts "
+                             "as a regression, e.g. 0.1")
+    parser.add_argument("--threshold-for", type=threshold_override,
+                        action="append", default=[],
+                        metavar="PATTERN=SHARE",
+                        help="threshold for the metrics matching a pattern, "
+                             "e.g. 'render.*=0.25'")
+    parser.add_argument("--first-frame", action="store_true",
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.first_frame:
+        first_frame()
+        return 0
+    unknown = [group for group in args.groups if group not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark group: {', '.join(unknown)}")
+
+    results = run_benchmarks(args.groups or tuple(BENCHMARKS), args.repeat)
+    if args.output:
+        save_results(args.output, results)
+
+    if not args.baseline:
+        return 0
+    rows = compare_results(results, load_results(args.baseline),
+                           args.threshold, args.threshold_for)
+    print(f"\ncompared with {args.baseline}:")
+    for result, before, change, regressed in rows:
+        print(f"{result.name:32} {before:12.2f} -> {result.value:12.2f} "
+              f"{result.unit:8} {change:+7.1%}"
+              + ("  REGRESSION" if regressed else ""))
+    regressions = sum(regressed for *_, regressed in rows)
+    if regressions:
+        print(f"{regressions} regression(s)")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,47 @@
+"""Camera over a world that can be wider than the screen.
+
+The camera is the world x of the screen's left edge. It eases towards
+whatever it follows (the shell in flight, otherwise the tank whose turn it
+is) once per simulation tick, so it moves the same at any frame rate, and
+it never shows past the ends of the world. On a world no wider than the
+screen it stays at 0 and nothing scrolls.
+"""
+from tanks.simulation import WIDTH
+
+# Share of the remaining distance the camera covers each tick
+CAMERA_EASE = 0.12
+
+
+# Camera class
+class Camera:
+    def __init__(self, world_width, view_width=WIDTH):
+        self.world_width = world_width
+        self.view_width = view_width
+        self.x = 0.0
+
+    @property
+    def max_x(self):
+        return max(0, self.world_width - self.view_width)
+
+    @property
+    def offset(self):
+        # Whole pixels, so world-space sprites stay crisp
+        return int(round(self.x))
+
+    def clamp(self, x):
+        return max(0.0, min(float(self.max_x), x))
+
+    def center_on(self, world_x):
+        self.x = self.clamp(world_x - self.view_width / 2)
+
+    def follow(self, world_x, ease=CAMERA_EASE):
+        """Move part of the way towards centring ``world_x``; call per tick."""
+        target = self.clamp(world_x - self.view_width / 2)
+        self.x += (target - self.x) * ease
+        if abs(target - self.x) < 0.5:
+            self.x = target
+
+    def visible_columns(self):
+        # World columns on screen, for culling
+        start = self.offset
+        return range(start, min(self.world_width, start + self.view_width))
@@ -0,0 +1,101 @@
+"""Dirty-rectangle presentation for the pygame front end.
+
+Each frame the game hands ``DirtyRenderer.present`` its display list: one
+``(key, rect, signature, draw)`` entry per thing on screen, back to front.
+Entries whose rect or signature changed since the last frame mark their old
+and new rects dirty. Only those areas are cleared, redrawn (clipped, in the
+same back-to-front order) and pushed with ``pygame.display.update``, so a
+frame where only the shell and a few stars moved touches a few kilobytes of
+pixels instead of the whole screen.
+"""
+import pygame
+
+# Above this share of the screen a plain fill and flip is cheaper
+FULL_REDRAW_SHARE = 0.5
+# Merging is quadratic in the number of rects; past this many (a volley of
+# shells) a full redraw is cheaper than working out what to redraw
+MAX_DIRTY_RECTS = 200
+
+
+# Function to merge overlapping rects so no area is redrawn twice
+def merge_rects(rects):
+    merged = []
+    for rect in rects:
+        rect = pygame.Rect(rect)
+        index = rect.collidelist(merged)
+        while index != -1:
+            rect.union_ip(merged.pop(index))
+            index = rect.collidelist(merged)
+        merged.append(rect)
+    return merged
+
+
+# Dirty renderer class
+class DirtyRenderer:
+    def __init__(self, surface, background, enabled=True):
+        self.surface = surface
+        self.background = background
+        self.enabled = enabled  # False always fills and flips the full screen
+        self.previous = {}  # key -> (rect, signature) shown last frame
+        self.extra = []  # Areas changed outside the display list
+        self.full_redraw = True
+
+    def invalidate(self):
+        # Redraw everything next frame, e.g. after a menu drew over the game
+        self.full_redraw = True
+
+    def mark_dirty(self, rect):
+        self.extra.append(pygame.Rect(rect))
+
+    def present(self, items):
+        screen_rect = self.surface.get_rect()
+        current = {key: (pygame.Rect(rect), signature)
+                   for key, rect, signature, _ in items}
+
+        dirty = []
+        if self.enabled and not self.full_redraw:
+            dirty.extend(self.extra)
+            for key, shown in current.items():
+                old = self.previous.get(key)
+                if old is None:
+                    dirty.append(shown[0])
+                elif old != shown:
+                    dirty.append(old[0])
+                    dirty.append(shown[0])
+            for key in self.previous.keys() - current.keys():
+                dirty.append(self.previous[key][0])
+            if len(dirty) > MAX_DIRTY_RECTS:
+                dirty = None
+        else:
+            dirty = None
+
+        if dirty is not None:
+            dirty = [rect.clip(screen_rect) for rect in merge_rects(dirty)]
+            dirty = [rect for rect in dirty if rect.width and rect.height]
+            dirty_area = sum(rect.width * rect.height for rect in dirty)
+            if dirty_area > FULL_REDRAW_SHARE * screen_rect.width \
+                    * screen_rect.height:
+                dirty = None
+
+        self.previous = current
+        self.extra = []
+        self.full_redraw = False
+
+        if dirty is None:
+            # Full-screen fallback
+            self.surface.fill(self.background)
+            for _, _, _, draw in items:
+                draw()
+            pygame.display.flip()
+            return
+
+        if not dirty:
+            return
+        rects = [shown[0] for shown in current.values()]
+        for area in dirty:
+            self.surface.set_clip(area)
+            self.surface.fill(self.background, area)
+            for index in area.collidelistall(rects):
+                items[index][3]()
+        self.surface.set_clip(None)
+        pygame.display.update(dirty)
@@ -0,0 +1,451 @@
+"""Reinforcement learning environments where one step is one shot.
+
+``TanksEnv`` wraps a real ``Match``. ``reset`` starts a match and returns
+the first observation; ``step((angle, power))`` turns the current tank's
+cannon, fires and flies the shell to the end with ``Match.resolve_shot``,
+with no frames in between. By default the agent plays both tanks: every
+step fires for whichever tank's turn it is, and the observation is always
+seen from the tank about to fire. With ``opponent`` set to a skill, the
+agent is red and a ``ComputerPlayer`` answers every shot in the same step.
+
+``TanksVectorEnv`` plays ``count`` matches side by side, each with its own
+terrain, wind and tanks, kept in NumPy arrays. ``step`` takes one shot per
+match and flies all of them in a single batched loop with the arithmetic of
+``ProjectilePool``, testing each shell against its own match's ground and
+tanks. The matches follow the same rules as a ``Match`` on heightmap
+terrain with swept collision and the basic shell, and draw their terrain
+and wind the same way: match ``i`` of a vector env reset with seed ``s``
+plays exactly like a ``TanksEnv`` reset with seed ``s + i`` given the same
+shots. A match that ends is started again within the same step, so the
+observation returned for it is already the first of the next match.
+
+Both follow Gymnasium's API: ``reset(seed=None)`` returns ``(observation,
+info)`` and ``step`` returns ``(observation, reward, terminated, truncated,
+info)``, but neither needs Gymnasium installed. An action is an angle in
+degrees and a power, clipped to what the keyboard can reach. An
+observation is a float32 array of ``width + len(OBSERVATION_FIELDS)``
+values: the ground height of every column, then the fields below. The
+reward is from the view of the tank that fired: ``REWARD_HIT`` for hitting
+the other tank, minus that for hitting itself, and for a miss minus its
+distance from the other tank as a share of the world's width, or -1 for a
+shell that left the world.
+
+Observations, rewards and flags are written into arrays allocated once, and
+every step returns the same arrays; copy them to keep them.
+"""
+import math
+import random
+
+import numpy as np
+
+from tanks.ai import ComputerPlayer
+from tanks.simulation import (
+    CRATER_RADIUS,
+    FLYING,
+    GRAVITY,
+    GROUND,
+    HEIGHT,
+    OFF_SCREEN,
+    TANK,
+    TANK_HALF_HEIGHT,
+    TANK_HALF_WIDTH,
+    TANK_HEALTH,
+    WIDTH,
+    WIND_RESISTANCE,
+    Match,
+    check_width,
+    generate_terrain,
+    initial_wind,
+    new_seed,
+    next_wind,
+    spawn_positions,
+)
+from tanks.trajectory import (
+    GROUND_CHUNK,
+    ground_contacts,
+    launch_velocities,
+    tank_contacts,
+)
+
+# What follows the ground heights in an observation; "target" is the tank
+# that is not firing
+OBSERVATION_FIELDS = ("wind", "x", "y", "health",
+                      "target_x", "target_y", "target_health")
+
+# Actions are clipped to these, like Tank.aim and Tank.change_power
+ANGLE_RANGE = (0, 180)
+POWER_RANGE = (10, 70)
+
+REWARD_HIT = 1.0
+
+# A match still undecided after this many shots is truncated
+DEFAULT_MAX_SHOTS = 100
+
+# A shell still flying after this many ticks counts as lost, as
+# Match.resolve_shot gives up on it
+MAX_FRAMES = 10000
+
+# Columns per block of the highest-ground bound that decides which shell
+# paths need the column walk
+BLOCK_COLUMNS = 16
+
+
+# Function to get the reward for a miss that landed some distance away
+def miss_reward(distance, width):
+    return -min(abs(distance) / width, 1.0)
+
+
+# Single match environment class
+class TanksEnv:
+    def __init__(self, difficulty="medium", width=WIDTH, opponent=None,
+                 bitmap=False, settling=False, max_shots=DEFAULT_MAX_SHOTS,
+                 seed=None):
+        check_width(width)
+        self.difficulty = difficulty
+        self.width = width
+        self.opponent_skill = opponent  # None for self-play
+        self.bitmap = bitmap
+        self.settling = settling
+        self.max_shots = max_shots
+        # Seeds each match; reset(seed=...) starts it over
+        self.rng = random.Random(seed if seed is not None else new_seed())
+        self.match = None
+        self.opponent = None
+        self.shots = 0
+        self.observation = np.zeros(width + len(OBSERVATION_FIELDS),
+                                    dtype=np.float32)
+
+    def reset(self, seed=None):
+        if seed is not None:
+            self.rng = random.Random(seed)
+        self.match = Match(self.difficulty, seed=self.rng.getrandbits(64),
+                           width=self.width, bitmap=self.bitmap,
+                           settling=self.settling)
+        self.opponent = None
+        if self.opponent_skill is not None:
+            # No time budget, so the opponent plays the same on any machine
+            self.opponent = ComputerPlayer(self.match, self.match.tanks[1],
+                                           self.opponent_skill, self.rng,
+                                           math.inf)
+        self.shots = 0
+        self.observe()
+        return self.observation, {}
+
+    def step(self, action):
+        match = self.match
+        if match is None or match.winner is not None:
+            raise RuntimeError("the match is over; call reset first")
+        shooter = match.current_tank
+        angle, power = action
+        shooter.angle = float(max(ANGLE_RANGE[0], min(ANGLE_RANGE[1], angle)))
+        shooter.power = float(max(POWER_RANGE[0], min(POWER_RANGE[1], power)))
+        match.fire()
+        outcome, hit, reward = self.resolve(shooter)
+        if self.opponent is not None and match.winner is None:
+            # The computer answers; a hit on the agent costs it the same
+            self.opponent.take_turn()
+            _, opponent_hit, _ = self.resolve(self.opponent.tank)
+            if opponent_hit is shooter:
+                reward -= REWARD_HIT
+        self.shots += 1
+
+        terminated = match.winner is not None
+        truncated = not terminated and self.shots >= self.max_shots
+        self.observe()
+        winner = match.tanks.index(match.winner) if terminated else None
+        return self.observation, reward, terminated, truncated, {
+            "outcome": outcome, "winner": winner}
+
+    def resolve(self, shooter):
+        # Fly the shot just fired; returns (outcome, tank hit or None,
+        # reward for the shooter)
+        target = self.match.tanks[1] if shooter is self.match.tanks[0] \
+            else self.match.tanks[0]
+        for event in self.match.resolve_shot():
+            if event.kind == "hit":
+                reward = REWARD_HIT if event.tank is target else -REWARD_HIT
+                return TANK, event.tank, reward
+            if event.kind == "crater":
+                return GROUND, None, miss_reward(event.x - target.x,
+                                                 self.match.width)
+        return OFF_SCREEN, None, -1.0
+
+    def observe(self):
+        match = self.match
+        shooter = match.tanks[0] if self.opponent is not None \
+            else match.current_tank
+        target = match.tanks[1] if shooter is match.tanks[0] \
+            else match.tanks[0]
+        self.observation[:self.width] = match.ground
+        self.observation[self.width:] = (
+            match.wind, shooter.x, shooter.y, shooter.health,
+            target.x, target.y, target.health)
+
+
+# Vectorized environment class: many self-play matches in arrays
+class TanksVectorEnv:
+    def __init__(self, count, difficulty="medium", width=WIDTH,
+                 max_shots=DEFAULT_MAX_SHOTS, seed=None):
+        check_width(width)
+        self.count = count
+        self.difficulty = difficulty
+        self.width = width
+        self.max_shots = max_shots
+        self.rows = np.arange(count)
+
+        # State of every match, one row each; tanks are columns 0 and 1
+        self.ground = np.zeros((count, width))
+        self.peak = np.zeros(count)  # Highest ground; craters only lower it
+        # Highest ground of each block of BLOCK_COLUMNS columns
+        self.block_starts = np.arange(0, width, BLOCK_COLUMNS)
+        self.block_peak = np.zeros((count, len(self.block_starts)))
+        self.tank_x = np.zeros((count, 2))
+        self.tank_column = np.zeros((count, 2), dtype=np.intp)
+        self.tank_y = np.zeros((count, 2))
+        self.health = np.zeros((count, 2), dtype=np.int32)
+        self.wind = np.zeros(count)
+        self.current = np.zeros(count, dtype=np.intp)  # Tank about to fire
+        self.turn = np.zeros(count, dtype=np.int64)
+        self.shots = np.zeros(count, dtype=np.int64)
+        # Each env seeds its matches from its own RNG, and each match draws
+        # terrain and wind from an RNG of its own, like Match.rng
+        self.seed = seed
+        self.rngs = []
+        self.match_rngs = [None] * count
+
+        # Crater columns around int(x), as dig_crater visits them
+        self.crater_offsets = np.arange(-CRATER_RADIUS, CRATER_RADIUS)
+
+        # Returned by every step and filled in place
+        self.observation = np.zeros((count, width + len(OBSERVATION_FIELDS)),
+                                    dtype=np.float32)
+        self.reward = np.zeros(count, dtype=np.float32)
+        self.terminated = np.zeros(count, dtype=bool)
+        self.truncated = np.zeros(count, dtype=bool)
+        self.info = {
+            "outcome": np.zeros(count, dtype=np.int8),  # FLYING and so on
+            "tank": np.zeros(count, dtype=np.int8),  # Tank hit, or -1
+            "landing_x": np.zeros(count),  # Where the shell stopped
+            "winner": np.zeros(count, dtype=np.int8),  # Tank that won, or -1
+        }
+
+    def reset(self, seed=None):
+        if seed is None:
+            seed = self.seed if self.seed is not None else new_seed()
+            self.seed = None  # Later resets go on with fresh matches
+        self.rngs = [random.Random(seed + i) for i in range(self.count)]
+        for row in range(self.count):
+            self.reset_match(row)
+        self.info["outcome"][:] = FLYING
+        self.info["tank"][:] = -1
+        self.info["landing_x"][:] = np.nan
+        self.info["winner"][:] = -1
+        self.observe()
+        return self.observation, self.info
+
+    def reset_match(self, row):
+        # Draw terrain and wind in the same order as Match.__init__
+        rng = random.Random(self.rngs[row].getrandbits(64))
+        self.match_rngs[row] = rng
+        self.ground[row] = generate_terrain(self.width, rng)
+        self.peak[row] = self.ground[row].max()
+        self.block_peak[row] = np.maximum.reduceat(self.ground[row],
+                                                   self.block_starts)
+        self.tank_x[row] = self.tank_column[row] = spawn_positions(self.width)
+        self.tank_y[row] = HEIGHT - self.ground[row, self.tank_column[row]]
+        self.wind[row] = initial_wind(self.difficulty, rng)
+        self.health[row] = TANK_HEALTH
+        self.current[row] = 0
+        self.turn[row] = 0
+        self.shots[row] = 0
+
+    def step(self, actions):
+        """Take one shot in every match; ``actions`` is (count, 2) of angle
+        and power."""
+        actions = np.asarray(actions, dtype=np.float64)
+        angles = np.clip(actions[:, 0], *ANGLE_RANGE)
+        powers = np.clip(actions[:, 1], *POWER_RANGE)
+        rows = self.rows
+        shooter = self.current
+        target = 1 - shooter
+
+        velocity_x, velocity_y = launch_velocities(angles, powers)
+        self.fly(self.tank_x[rows, shooter], self.tank_y[rows, shooter] - 10,
+                 velocity_x, velocity_y)
+        outcome = self.info["outcome"]
+        tank = self.info["tank"]
+        landing_x = self.info["landing_x"]
+
+        # Rewards for the tank that fired
+        reward = self.reward
+        reward[:] = -1.0
+        landed = np.flatnonzero(outcome == GROUND)
+        reward[landed] = -np.minimum(np.abs(
+            landing_x[landed] - self.tank_x[landed, target[landed]])
+            / self.width, 1.0)
+        hit = np.flatnonzero(outcome == TANK)
+        reward[hit] = np.where(tank[hit] == target[hit], REWARD_HIT,
+                               -REWARD_HIT)
+
+        # Craters, then hits; a tank with no health left loses
+        self.dig(landed, landing_x[landed])
+        self.health[hit, tank[hit]] -= 1
+        np.any(self.health <= 0, axis=1, out=self.terminated)
+        winner = self.info["winner"]
+        winner[:] = -1
+        winner[self.terminated] = 1 - tank[self.terminated]
+
+        # Everyone else's turn ends, as Match.end_turn
+        playing = ~self.terminated
+        self.current[playing] = target[playing]
+        self.turn[playing] += 1
+        self.shots += 1
+        if self.difficulty != "easy":
+            for row in np.flatnonzero(playing
+                                      & (self.turn % 3 == 0)).tolist():
+                self.wind[row] = next_wind(self.difficulty,
+                                           int(self.turn[row]),
+                                           self.wind[row],
+                                           self.match_rngs[row])
+        np.logical_and(playing, self.shots >= self.max_shots,
+                       out=self.truncated)
+
+        for row in np.flatnonzero(self.terminated
+                                  | self.truncated).tolist():
+            self.reset_match(row)
+        self.observe()
+        return (self.observation, self.reward, self.terminated,
+                self.truncated, self.info)
+
+    def fly(self, x, y, velocity_x, velocity_y):
+        """Fly one shell per match until each lands, hits or leaves.
+
+        Fills the outcome, tank and landing_x arrays of ``info``. Shells
+        that are done drop out of the working set, like simulate_shots.
+        """
+        outcome = self.info["outcome"]
+        tank = self.info["tank"]
+        landing_x = self.info["landing_x"]
+        live = self.rows
+        wind = self.wind
+        # Tank boxes of every match; tanks do not move during a flight
+        left = self.tank_x - TANK_HALF_WIDTH
+        right = self.tank_x + TANK_HALF_WIDTH
+        top = self.tank_y - TANK_HALF_HEIGHT
+        bottom = self.tank_y + TANK_HALF_HEIGHT
+
+        for _ in range(MAX_FRAMES):
+            if not live.size:
+                break
+            start_x, start_y = x.copy(), y.copy()
+
+            # Same update order as ProjectilePool.step
+            velocity_x += wind
+            x += velocity_x
+            y += velocity_y
+            velocity_y += GRAVITY
+            velocity_x *= WIND_RESISTANCE
+            velocity_y *= WIND_RESISTANCE
+
+            boxes = [(left[live, i], right[live, i], top[live, i],
+                      bottom[live, i]) for i in (0, 1)]
+            result, hit, stop_x = self.contacts(live, start_x, start_y, x, y,
+                                                boxes)
+            off_screen = (result == FLYING) & ((x < 0) | (x > self.width)
+                                               | (y > HEIGHT))
+            result[off_screen] = OFF_SCREEN
+            stop_x[off_screen] = x[off_screen]
+
+            done = result != FLYING
+            if done.any():
+                finished = live[done]
+                outcome[finished] = result[done]
+                tank[finished] = hit[done]
+                landing_x[finished] = stop_x[done]
+                keep = ~done
+                live = live[keep]
+                x, y = x[keep], y[keep]
+                velocity_x, velocity_y = velocity_x[keep], velocity_y[keep]
+                wind = wind[keep]
+
+        # Shells that never came down are lost
+        outcome[live] = OFF_SCREEN
+        tank[live] = -1
+        landing_x[live] = x
+
+    def contacts(self, live, x0, y0, x1, y1, boxes):
+        # swept_contacts, with every shell in its own match
+        count = live.size
+        outcome = np.full(count, FLYING, dtype=np.int8)
+        tank = np.full(count, -1, dtype=np.int8)
+        stop_x = np.full(count, np.nan)
+        stop_y = np.full(count, np.nan)
+        best = np.full(count, np.inf)
+
+        # Only segments that reach below their match's highest peak, and
+        # then below the highest blocks they pass over, can touch its ground
+        reach = np.maximum(y0, y1)
+        candidates = np.flatnonzero(reach >= HEIGHT - self.peak[live])
+        if candidates.size:
+            left = np.floor(np.minimum(x0[candidates], x1[candidates]))
+            right = np.floor(np.maximum(x0[candidates], x1[candidates]))
+            in_world = (right >= 0) & (left <= self.width - 1)
+            first = np.clip(left, 0, self.width - 1).astype(np.intp) \
+                // BLOCK_COLUMNS
+            last = np.clip(right, 0, self.width - 1).astype(np.intp) \
+                // BLOCK_COLUMNS
+            row = live[candidates]
+            peak = self.block_peak[row, first]
+            for block in range(1, int((last - first).max()) + 1):
+                np.maximum(peak, self.block_peak[
+                    row, np.minimum(first + block, last)], out=peak)
+            candidates = candidates[in_world
+                                    & (reach[candidates] >= HEIGHT - peak)]
+        for first in range(0, candidates.size, GROUND_CHUNK):
+            rows = candidates[first:first + GROUND_CHUNK]
+            t, hit_x, hit_y = ground_contacts(x0[rows], y0[rows], x1[rows],
+                                              y1[rows], self.ground,
+                                              live[rows])
+            hit = t < np.inf
+            rows = rows[hit]
+            best[rows] = t[hit]
+            outcome[rows] = GROUND
+            stop_x[rows] = hit_x[hit]
+            stop_y[rows] = hit_y[hit]
+
+        tank_contacts(x0, y0, x1, y1, boxes, best, outcome, tank, stop_x,
+                      stop_y)
+        return outcome, tank, stop_x
+
+    def dig(self, rows, x):
+        # dig_crater in each of rows at its x, then drop the tanks onto
+        # the new ground as Match.place_tanks does
+        if not rows.size:
+            return
+        columns = np.trunc(x).astype(np.intp)[:, None] + self.crater_offsets
+        distance = np.abs(columns - x[:, None])
+        inside = (columns >= 0) & (columns < self.width) \
+            & (distance <= CRATER_RADIUS)
+        depth = np.trunc((CRATER_RADIUS - distance[inside]) ** 0.5 * 5)
+        row = np.broadcast_to(rows[:, None], columns.shape)[inside]
+        column = columns[inside]
+        self.ground[row, column] = np.maximum(
+            0, self.ground[row, column] - depth)
+        self.block_peak[rows] = np.maximum.reduceat(self.ground[rows],
+                                                    self.block_starts, axis=1)
+        self.tank_y[rows] = HEIGHT - self.ground[rows[:, None],
+                                                 self.tank_column[rows]]
+
+    def observe(self):
+        rows = self.rows
+        shooter = self.current
+        target = 1 - shooter
+        fields = self.observation[:, self.width:]
+        self.observation[:, :self.width] = self.ground
+        fields[:, 0] = self.wind
+        fields[:, 1] = self.tank_x[rows, shooter]
+        fields[:, 2] = self.tank_y[rows, shooter]
+        fields[:, 3] = self.health[rows, shooter]
+        fields[:, 4] = self.tank_x[rows, target]
+        fields[:, 5] = self.tank_y[rows, target]
+        fields[:, 6] = self.health[rows, target]
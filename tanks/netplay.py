@@ -0,0 +1,695 @@
+"""Network play: two peers run the same match in lockstep over UDP.
+
+Nothing but input crosses the network. Each side sends the ``Controls`` of
+every tick for its own tank, and both run the same deterministic ``Match``
+from the same settings. The host is red and moves first; the settings go
+to the one who joins as an empty replay (see tanks.replay).
+
+The game is turn based, so a tick only needs the input of the player
+whose turn it is. ``Match.update`` runs first to learn whose turn that is,
+then ``Lockstep`` waits for that player's input before ``Match.control``
+finishes the tick. The player taking their turn never waits for the
+network, and the other side plays their moves back a moment later.
+
+Three things hide the latency:
+
+- Input delay. Local input is scheduled ``input_delay`` ticks ahead, so it
+  normally reaches the other side before it is needed. The delay follows
+  the measured round trip, from MIN_INPUT_DELAY up to MAX_INPUT_DELAY; past
+  that, responsive aiming matters more and the other side just lags.
+- Prediction. While the other player's turn has nothing moving, a tick
+  with no input changes nothing (``Match.is_idle``), so missing input is
+  taken to be no input and the clock runs on. When the real input arrives
+  and differs, the match goes back to that tick. Every tick guessed was
+  idle, so going back costs nothing, and the ticks are run again with the
+  real input, a few extra per frame until the side has caught up.
+- Redundancy. Every packet carries all input the other side has not
+  acknowledged yet, so a lost packet is covered by the next one, 1/60 s
+  later, without resends or timeouts.
+
+After every turn both sides take a CRC-32 of the terrain, the tanks, the
+wind and the match's RNG (``match_checksum``) and exchange it; the first
+difference raises ``DesyncError``.
+
+The sockets run on asyncio. ``Peer`` is the protocol for one side. It can
+add latency, jitter and packet loss of its own (``NetConditions``), so
+everything can be tried on localhost. The game calls ``Lockstep`` from its
+own thread, and ``NetworkThread`` runs the event loop beside it.
+
+Run ``python -m tanks.netplay`` to play a match between two computer
+players over localhost UDP, with ``--latency``, ``--jitter`` and
+``--loss``, and check that both sides stayed in sync.
+"""
+import argparse
+import asyncio
+import math
+import random
+import struct
+import threading
+import time
+import zlib
+from collections import deque, namedtuple
+
+import numpy as np
+
+from tanks.ai import ComputerPlayer
+from tanks.replay import (
+    DIFFICULTIES, Replay, ReplayError, ReplayRecorder, decode_controls,
+    decode_replay, encode_controls, encode_replay, iter_inputs, replay_match,
+)
+from tanks.simulation import (
+    MIN_WIDTH,
+    NO_INPUT,
+    WIDTH,
+    Controls,
+    new_seed,
+)
+from tanks.timestep import TICK
+
+DEFAULT_PORT = 47800
+
+MAGIC = b"OTTN"
+PROTOCOL_VERSION = 1
+
+# Packet kinds
+HELLO = 1  # Joining: asks the host for the match
+WELCOME = 2  # The host's answer: the match settings, as an empty replay
+INPUTS = 3  # Input, acknowledgements, timing and the latest checksum
+BYE = 4  # Leaving
+
+# Every packet starts with magic, version and kind
+_HEADER = struct.Struct("<4sBB")
+# INPUTS: remote inputs received in a row (the ack), tick of the first
+# input carried, send time, the last send time received and how long ago
+# in ms, then the latest turn checksum; the input bytes follow
+_INPUTS = struct.Struct("<IIIIHII")
+_NONE = 0xFFFFFFFF  # No checksum yet, or no packet to echo yet
+
+# Seconds between packets, and how many inputs one may carry at most
+SEND_INTERVAL = TICK
+MAX_INPUTS_PER_PACKET = 1024
+# Seconds between HELLOs while joining, and how long to keep trying
+HELLO_INTERVAL = 0.25
+JOIN_TIMEOUT = 30.0
+# Seconds without a packet after which the other side is gone
+DISCONNECT_TIMEOUT = 10.0
+# Seconds a side waits for its last inputs to be acknowledged when leaving
+DRAIN_TIMEOUT = 2.0
+
+# Input delay in ticks. It rises with the round trip at once and falls by a
+# tick at most every DELAY_SETTLE_TICKS, so jitter does not make it hunt.
+MIN_INPUT_DELAY = 2
+MAX_INPUT_DELAY = 12
+DELAY_SETTLE_TICKS = 60
+# A side more than input_delay + CATCH_UP_SLACK ticks behind the input it
+# has runs up to MAX_CATCH_UP extra ticks per tick of time until it is not
+CATCH_UP_SLACK = 2
+MAX_CATCH_UP = 4
+
+# Simulated network conditions for one direction: latency and jitter in
+# seconds, loss as a share of packets dropped
+NetConditions = namedtuple("NetConditions", ["latency", "jitter", "loss"],
+                           defaults=(0.0, 0.0, 0.0))
+NO_CONDITIONS = NetConditions()
+
+
+# Class for network play errors: the other side left or could not be reached
+class NetError(ConnectionError):
+    pass
+
+
+# Class for a match that played out differently on the two sides
+class DesyncError(NetError):
+    pass
+
+
+# Function to get the checksum both sides compare after every turn
+def match_checksum(match):
+    """Return a CRC-32 of the terrain, the tanks, the wind, the turn and
+    the state of the match's RNG."""
+    crc = zlib.crc32(np.asarray(match.ground, dtype=np.float64).tobytes())
+    if match.mask is not None:
+        crc = zlib.crc32(match.mask.bits.tobytes(), crc)
+    for tank in match.tanks:
+        crc = zlib.crc32(struct.pack("<5di", tank.x, tank.y, tank.angle,
+                                     tank.power, tank.fall_speed,
+                                     tank.health * 256 + tank.weapon), crc)
+    crc = zlib.crc32(struct.pack("<di", match.wind, match.turn_counter), crc)
+    _, state, _ = match.rng.getstate()
+    return zlib.crc32(struct.pack(f"<{len(state)}I", *state), crc)
+
+
+# Function to stamp a packet with the time in ms, wrapping at 32 bits
+def _stamp():
+    return int(time.monotonic() * 1000) & 0xFFFFFFFF
+
+
+# Peer class: one side's end of the connection, on the asyncio event loop
+class Peer(asyncio.DatagramProtocol):
+    def __init__(self, settings=None, conditions=NO_CONDITIONS, seed=None):
+        self.loop = asyncio.get_running_loop()
+        # The match as an empty replay; the joining side learns it later
+        self.settings = settings
+        self.local = 0 if settings is not None else 1  # Index of our tank
+        self.conditions = conditions
+        self.rng = random.Random(seed)  # Decides which packets are lost
+        self.transport = None
+        self.address = None  # The other side
+        self.connected = self.loop.create_future()
+        self.sender = None  # Task sending a packet every SEND_INTERVAL
+
+        self.outgoing = bytearray()  # Every local input, encoded
+        self.acked = 0  # How many of them the other side has
+        self.received = 0  # Remote inputs received in a row
+        self.inbox = deque()  # ("inputs", bytes) and ("checksum", turn, crc)
+        self.checksum = None  # Latest local (turn, crc)
+        self.remote_checksum = None
+
+        self.echo = None  # (stamp, time) of the newest packet received
+        self.rtt = None  # Smoothed round trip in seconds
+        self.rtt_deviation = 0.0
+        self.last_heard = time.monotonic()
+        self.remote_left = False
+        self.packets_sent = self.packets_lost = 0
+
+    @property
+    def port(self):
+        return self.transport.get_extra_info("sockname")[1]
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def error_received(self, exc):
+        # E.g. nothing listening yet while joining; UDP just carries on
+        pass
+
+    def packet(self, kind, payload=b""):
+        return _HEADER.pack(MAGIC, PROTOCOL_VERSION, kind) + payload
+
+    def transmit(self, data):
+        # Send a packet, through the simulated conditions
+        conditions = self.conditions
+        self.packets_sent += 1
+        if conditions.loss and self.rng.random() < conditions.loss:
+            self.packets_lost += 1
+            return
+        delay = conditions.latency
+        if conditions.jitter:
+            delay += self.rng.uniform(0, conditions.jitter)
+        if delay > 0:
+            self.loop.call_later(delay, self.sendto, data)
+        else:
+            self.sendto(data)
+
+    def sendto(self, data):
+        if self.transport is not None and not self.transport.is_closing():
+            self.transport.sendto(data, self.address)
+
+    def datagram_received(self, data, address):
+        if len(data) < _HEADER.size:
+            return
+        magic, version, kind = _HEADER.unpack_from(data)
+        if magic != MAGIC or version != PROTOCOL_VERSION:
+            return
+        if self.address is None:
+            if kind == HELLO and self.settings is not None:
+                self.address = address  # The first to say hello plays
+            else:
+                return
+        elif address != self.address:
+            return
+        self.last_heard = time.monotonic()
+
+        if kind == HELLO and self.local == 0:
+            # Also when our WELCOME was lost and they ask again
+            self.transmit(self.packet(WELCOME, encode_replay(self.settings)))
+            self.start()
+        elif kind == WELCOME and not self.connected.done():
+            try:
+                self.settings = decode_replay(data[_HEADER.size:])
+            except ReplayError:
+                return
+            self.start()
+        elif kind == INPUTS and self.connected.done():
+            self.inputs_received(data)
+        elif kind == BYE:
+            self.remote_left = True
+
+    def inputs_received(self, data):
+        ack, first, stamp, echo, echo_age, turn, crc = _INPUTS.unpack_from(
+            data, _HEADER.size)
+        now = time.monotonic()
+        self.acked = max(self.acked, min(ack, len(self.outgoing)))
+        self.echo = (stamp, now)
+        if echo != _NONE:
+            # Round trip as TCP measures it (RFC 6298)
+            sample = ((_stamp() - echo) & 0xFFFFFFFF) / 1000 - echo_age / 1000
+            sample = max(0.0, sample)
+            if self.rtt is None:
+                self.rtt, self.rtt_deviation = sample, sample / 2
+            else:
+                self.rtt_deviation += (abs(self.rtt - sample)
+                                       - self.rtt_deviation) / 4
+                self.rtt += (sample - self.rtt) / 8
+
+        # Only what follows on from the inputs we already have
+        codes = data[_HEADER.size + _INPUTS.size:]
+        if first <= self.received < first + len(codes):
+            new = codes[self.received - first:]
+            self.received += len(new)
+            self.inbox.append(("inputs", new))
+        if turn != _NONE and (turn, crc) != self.remote_checksum:
+            self.remote_checksum = (turn, crc)
+            self.inbox.append(("checksum", turn, crc))
+
+    def inputs_packet(self):
+        first = self.acked
+        codes = self.outgoing[first:first + MAX_INPUTS_PER_PACKET]
+        if self.echo is None:
+            echo, echo_age = _NONE, 0
+        else:
+            echo = self.echo[0]
+            echo_age = min(0xFFFF, int((time.monotonic() - self.echo[1])
+                                       * 1000))
+        turn, crc = self.checksum or (_NONE, 0)
+        return self.packet(INPUTS, _INPUTS.pack(
+            self.received, first, _stamp(), echo, echo_age, turn, crc)
+            + bytes(codes))
+
+    def start(self):
+        if self.connected.done():
+            return
+        self.connected.set_result(None)
+        self.sender = self.loop.create_task(self.send_loop())
+
+    async def send_loop(self):
+        while True:
+            self.transmit(self.inputs_packet())
+            await asyncio.sleep(SEND_INTERVAL)
+
+    # Called from the game's thread
+    def post_inputs(self, codes):
+        self.loop.call_soon_threadsafe(self.outgoing.extend, codes)
+
+    def post_checksum(self, turn, crc):
+        self.loop.call_soon_threadsafe(setattr, self, "checksum",
+                                       (turn, crc))
+
+    def check(self):
+        """Raise NetError if the other side left or went silent."""
+        if self.remote_left:
+            raise NetError("the other player left")
+        if time.monotonic() - self.last_heard > DISCONNECT_TIMEOUT:
+            raise NetError("lost the connection to the other player")
+
+    def close(self):
+        # Say goodbye once, not delayed or dropped, and stop
+        self.loop.call_soon_threadsafe(self._close)
+
+    def _close(self):
+        if self.sender is not None:
+            self.sender.cancel()
+        if self.transport is not None and not self.transport.is_closing():
+            if self.address is not None:
+                self.transport.sendto(self.packet(BYE), self.address)
+            self.transport.close()
+
+    async def drain(self, timeout=DRAIN_TIMEOUT):
+        # Wait until the other side has every input we sent, or timeout
+        deadline = self.loop.time() + timeout
+        while self.acked < len(self.outgoing) and not self.remote_left \
+                and self.loop.time() < deadline:
+            await asyncio.sleep(SEND_INTERVAL)
+
+
+# Function to open a port and wait for someone to join
+async def listen(settings, port=DEFAULT_PORT, bind="0.0.0.0",
+                 conditions=NO_CONDITIONS, seed=None):
+    """Return the host's Peer, listening; ``await peer.connected`` waits
+    for the other player. ``settings`` is the match as an empty Replay."""
+    loop = asyncio.get_running_loop()
+    _, peer = await loop.create_datagram_endpoint(
+        lambda: Peer(settings, conditions, seed), local_addr=(bind, port))
+    return peer
+
+
+# Function to host a match and wait until someone joins
+async def host(settings, port=DEFAULT_PORT, bind="0.0.0.0",
+               conditions=NO_CONDITIONS, seed=None):
+    peer = await listen(settings, port, bind, conditions, seed)
+    try:
+        await peer.connected
+    except BaseException:
+        peer._close()
+        raise
+    return peer
+
+
+# Function to join a match hosted at address, (host, port)
+async def join(address, conditions=NO_CONDITIONS, seed=None,
+               timeout=JOIN_TIMEOUT):
+    """Return the joining side's Peer once the host has sent the match."""
+    loop = asyncio.get_running_loop()
+    transport, peer = await loop.create_datagram_endpoint(
+        lambda: Peer(None, conditions, seed), remote_addr=address)
+    peer.address = transport.get_extra_info("peername")
+    try:
+        deadline = loop.time() + timeout
+        while not peer.connected.done():
+            if loop.time() > deadline:
+                raise NetError(f"no answer from {address[0]}:{address[1]}")
+            peer.transmit(peer.packet(HELLO))
+            await asyncio.wait([peer.connected], timeout=HELLO_INTERVAL)
+    except BaseException:
+        peer._close()
+        raise
+    return peer
+
+
+# Lockstep class: runs one side's match from both players' inputs
+class Lockstep:
+    def __init__(self, match, local, peer, recorder=None, tick_length=TICK):
+        self.match = match
+        self.local = local  # Index of the tank this side plays
+        self.remote = 1 - local
+        self.peer = peer
+        self.recorder = recorder  # Gets the input of every tick, once sure
+        self.tick_length = tick_length  # Seconds of real time per tick
+        self.tick = 0  # Next tick to run
+        self.inputs = ([], [])  # Controls of each tank, by tick
+        self.sent = 0  # Local inputs handed to the peer so far
+        self.updated = None  # Events of this tick's update, once it ran
+        self.predicted_from = None  # First tick run on a guess, if any
+        self.input_delay = MIN_INPUT_DELAY
+        self.delay_changed = 0  # Tick the input delay last changed
+        self.checksums = {}  # Turn -> our checksum, until compared
+        self.remote_checksums = {}
+        self.verified = 0  # Turns whose checksums matched
+        # Ticks of time nothing could run, ticks guessed, guesses that
+        # were wrong and the most ticks gone back at once
+        self.stalls = self.predicted = self.rollbacks = 0
+        self.longest_rollback = 0
+
+    @property
+    def waiting(self):
+        # Whether the tick to run needs input the other side has not sent
+        owner = self.match.tanks.index(self.match.current_tank)
+        return owner == self.remote and \
+            len(self.inputs[self.remote]) <= self.tick
+
+    def step(self, controls):
+        """Take the local player's input for one tick of real time and run
+        what can be run.
+
+        Returns a (Controls, events) pair for each tick run: none while
+        waiting for the other player, a few while catching up.
+        """
+        self.receive()
+        if self.waiting:
+            self.peer.check()
+        self.tune_delay()
+
+        local = self.inputs[self.local]
+        target = self.tick + self.input_delay
+        if len(local) <= target:
+            local.append(controls)
+            # When the delay grew, the keys held fill the ticks skipped
+            held = controls._replace(fire=False, weapon=0)
+            local.extend([held] * (target + 1 - len(local)))
+        if len(local) > self.sent:
+            self.peer.post_inputs(bytes(encode_controls(controls)
+                                        for controls in local[self.sent:]))
+            self.sent = len(local)
+
+        ran = []
+        for _ in range(1 + MAX_CATCH_UP):
+            result = self.run_tick()
+            if result is None:
+                break
+            ran.append(result)
+            if not self.behind():
+                break
+        if not ran:
+            self.stalls += 1
+        return ran
+
+    def behind(self):
+        owner = self.match.tanks.index(self.match.current_tank)
+        return len(self.inputs[owner]) - self.tick \
+            > self.input_delay + CATCH_UP_SLACK
+
+    def run_tick(self):
+        # Run the next tick if its input is here or can be guessed; returns
+        # (controls, events), or None to wait
+        self.confirm()
+        match = self.match
+        if self.updated is None:
+            self.updated = match.update()
+            self.verify(self.updated)
+        owner = match.tanks.index(match.current_tank)
+        inputs = self.inputs[owner]
+        if self.tick < len(inputs) and self.predicted_from is None:
+            controls = inputs[self.tick]
+            if self.recorder is not None:
+                self.recorder.record(controls)
+        elif owner == self.remote and match.winner is None \
+                and match.is_idle():
+            # Nothing moves, so no input is the likely input and changes
+            # nothing if it is wrong
+            controls = NO_INPUT
+            if self.predicted_from is None:
+                self.predicted_from = self.tick
+            self.predicted += 1
+        else:
+            return None
+        events = self.updated + match.control(controls)
+        self.updated = None
+        self.tick += 1
+        return controls, events
+
+    def confirm(self):
+        # Check the guessed ticks against the input that has arrived since
+        remote = self.inputs[self.remote]
+        while self.predicted_from is not None \
+                and self.predicted_from < min(len(remote), self.tick):
+            if remote[self.predicted_from] != NO_INPUT:
+                # Guessed wrong. Every tick since was idle, so the match is
+                # as it was then: just run them again with the real input.
+                self.rollbacks += 1
+                self.longest_rollback = max(self.longest_rollback,
+                                            self.tick - self.predicted_from)
+                self.tick = self.predicted_from
+                self.predicted_from = None
+                return
+            if self.recorder is not None:
+                self.recorder.record(NO_INPUT)
+            self.predicted_from += 1
+        if self.predicted_from == self.tick:
+            self.predicted_from = None
+
+    def receive(self):
+        inbox = self.peer.inbox
+        while inbox:
+            message = inbox.popleft()
+            if message[0] == "inputs":
+                self.inputs[self.remote].extend(decode_controls(code)
+                                                for code in message[1])
+            else:
+                _, turn, crc = message
+                self.remote_checksums[turn] = crc
+                self.compare(turn)
+
+    def verify(self, events):
+        # Checksum the match after every turn and when it is won
+        for event in events:
+            if event.kind == "turn_end":
+                turn = self.match.turn_counter
+            elif event.kind == "game_over":
+                turn = self.match.turn_counter + 1
+            else:
+                continue
+            crc = match_checksum(self.match)
+            self.checksums[turn] = crc
+            self.peer.post_checksum(turn, crc)
+            self.compare(turn)
+
+    def compare(self, turn):
+        if turn not in self.checksums or turn not in self.remote_checksums:
+            return
+        if self.checksums.pop(turn) != self.remote_checksums.pop(turn):
+            raise DesyncError(f"out of sync after turn {turn}")
+        self.verified += 1
+
+    def tune_delay(self):
+        # Enough delay for input to cross before it is needed, as measured
+        rtt = self.peer.rtt
+        if rtt is None:
+            return
+        one_way = rtt / 2 + 2 * self.peer.rtt_deviation
+        target = max(MIN_INPUT_DELAY, min(MAX_INPUT_DELAY, math.ceil(
+            one_way / self.tick_length)))
+        if target > self.input_delay or (
+                target < self.input_delay
+                and self.tick - self.delay_changed >= DELAY_SETTLE_TICKS):
+            self.input_delay = target if target > self.input_delay \
+                else self.input_delay - 1
+            self.delay_changed = self.tick
+
+
+# Network thread class: an asyncio event loop beside the game's own loop
+class NetworkThread:
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever,
+                                       name="network", daemon=True)
+        self.thread.start()
+
+    def run(self, coroutine):
+        # Start a coroutine on the loop; returns a concurrent.futures.Future
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+
+# Network bot class: a ComputerPlayer that allows for the input delay
+class NetBot:
+    def __init__(self, lockstep, skill="medium", rng=random):
+        self.lockstep = lockstep
+        self.tank = lockstep.match.tanks[lockstep.local]
+        self.computer = ComputerPlayer(lockstep.match, self.tank, skill, rng)
+
+    def controls(self):
+        computer, tank = self.computer, self.tank
+        match = self.lockstep.match
+        computer.controls()  # Thinks, and then knows its goal
+        if match.current_tank is not tank or not match.can_fire() \
+                or computer.goal is None:
+            return NO_INPUT
+        # Aim from where the input already sent will leave the cannon
+        pending = self.lockstep.inputs[self.lockstep.local][
+            self.lockstep.tick:]
+        if any(controls.fire for controls in pending):
+            return NO_INPUT
+        angle = tank.angle + sum(controls.aim for controls in pending)
+        power = tank.power + sum(controls.power for controls in pending)
+        goal_angle, goal_power = computer.goal
+        aim = (goal_angle > angle) - (goal_angle < angle)
+        change = (goal_power > power) - (goal_power < power)
+        return Controls(aim, change, not aim and not change)
+
+
+# Function to play one side of a match with a NetBot, in real time
+async def play_bot(peer, skill, speed=1.0, max_ticks=None, seed=None):
+    """Return (Lockstep, NetError or None) once the match is over."""
+    loop = asyncio.get_running_loop()
+    match = replay_match(peer.settings)
+    lockstep = Lockstep(match, peer.local, peer, ReplayRecorder(match),
+                        TICK / speed)
+    bot = NetBot(lockstep, skill, random.Random(seed))
+    error = None
+    due = loop.time()
+    try:
+        while match.winner is None and (max_ticks is None
+                                        or lockstep.tick < max_ticks):
+            lockstep.step(bot.controls())
+            due += lockstep.tick_length
+            await asyncio.sleep(max(0.0, due - loop.time()))
+    except NetError as e:
+        error = e
+    await peer.drain()
+    peer._close()
+    return lockstep, error
+
+
+# Function to play a whole match between two bots over localhost
+async def bot_match(settings, conditions=NO_CONDITIONS, skill="medium",
+                    speed=1.0, max_ticks=None, seed=0):
+    server = await listen(settings, 0, "127.0.0.1", conditions, seed)
+    client = await join(("127.0.0.1", server.port), conditions, seed + 1)
+    await server.connected
+    return await asyncio.gather(
+        play_bot(server, skill, speed, max_ticks, seed + 2),
+        play_bot(client, skill, speed, max_ticks, seed + 3))
+
+
+# Function to describe one side of a bot match, for the command line
+def describe_side(name, lockstep, error):
+    match, peer = lockstep.match, lockstep.peer
+    if error is not None:
+        ending = f"stopped: {error}"
+    elif match.winner is None:
+        ending = "no winner yet"
+    else:
+        ending = ("red" if match.winner is match.tanks[0] else "blue") \
+            + " won"
+    rtt = f"{peer.rtt * 1000:.0f} ms" if peer.rtt is not None else "-"
+    return (f"{name}: {ending} after {lockstep.tick} ticks, "
+            f"{match.turn_counter} turns; {lockstep.verified} checksums "
+            f"matched; round trip {rtt}, input delay {lockstep.input_delay}; "
+            f"{lockstep.stalls} stalls, {lockstep.predicted} ticks "
+            f"predicted, {lockstep.rollbacks} rollbacks (up to "
+            f"{lockstep.longest_rollback} ticks); {peer.packets_sent} "
+            f"packets sent, {peer.packets_lost} lost")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Play a network match between two computer players "
+                    "over localhost and check that both sides stay in "
+                    "sync.")
+    parser.add_argument("--latency", type=float, default=0,
+                        help="added one-way latency in ms")
+    parser.add_argument("--jitter", type=float, default=0,
+                        help="up to this many ms more, at random")
+    parser.add_argument("--loss", type=float, default=0,
+                        help="share of packets dropped, e.g. 0.1")
+    parser.add_argument("--difficulty", choices=DIFFICULTIES,
+                        default="medium")
+    parser.add_argument("--skill", choices=DIFFICULTIES, default="hard",
+                        help="how well the computer players aim")
+    parser.add_argument("--world-width", type=int, default=WIDTH)
+    parser.add_argument("--bitmap-terrain", action="store_true")
+    parser.add_argument("--settling", action="store_true")
+    parser.add_argument("--seed", type=lambda text: int(text, 0),
+                        help="match seed; random if not given")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="ticks run this many times faster than the "
+                             "game, with the same latency")
+    parser.add_argument("--max-ticks", type=int,
+                        help="stop after this many ticks")
+    args = parser.parse_args(argv)
+    if args.world_width < MIN_WIDTH:
+        parser.error(f"--world-width must be at least {MIN_WIDTH}")
+
+    seed = args.seed if args.seed is not None else new_seed()
+    settings = Replay(seed, args.difficulty, True, [], args.world_width,
+                      args.bitmap_terrain, args.settling)
+    conditions = NetConditions(args.latency / 1000, args.jitter / 1000,
+                               args.loss)
+    print(f"seed {seed:016x}, {args.difficulty}: {args.latency:.0f} ms "
+          f"latency, {args.jitter:.0f} ms jitter, {args.loss:.0%} loss "
+          f"each way")
+    sides = asyncio.run(bot_match(settings, conditions, args.skill,
+                                  args.speed, args.max_ticks,
+                                  seed & 0xFFFFFFFF))
+    for name, (lockstep, error) in zip(("host", "join"), sides):
+        print(describe_side(name, lockstep, error))
+
+    # Both sides must have run the same input on every tick they both ran
+    (host_side, host_error), (join_side, join_error) = sides
+    ticks = min(host_side.tick, join_side.tick)
+    host_inputs = list(iter_inputs(host_side.recorder.replay))[:ticks]
+    join_inputs = list(iter_inputs(join_side.recorder.replay))[:ticks]
+    in_sync = host_error is None and join_error is None \
+        and host_inputs == join_inputs
+    if in_sync and host_side.tick == join_side.tick:
+        in_sync = match_checksum(host_side.match) \
+            == match_checksum(join_side.match)
+    print(f"{ticks} ticks compared: {'in sync' if in_sync else 'OUT OF SYNC'}")
+    return 0 if in_sync else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
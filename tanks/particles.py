@@ -0,0 +1,185 @@
+"""Particles for crater debris, shell smoke and muzzle flashes.
+
+A ``ParticleSystem`` keeps every particle in fixed-capacity NumPy arrays,
+with the live ones packed at the front: emitting writes to the end of the
+packed run and dead particles are squeezed out once per tick, so there are
+no per-particle objects and nothing for the garbage collector to walk.
+``update`` moves all particles with a few array operations, whatever their
+kind; kinds differ only by the gravity, drag and wind in the tables below.
+
+Particles are purely cosmetic. They draw from their own RNG and never touch
+the match, so replays and headless runs are unaffected. Under load the
+front end calls ``adapt`` with its frame time: a slow frame lowers
+``budget``, the number of live particles allowed, and quiet frames raise it
+back. Emitters simply get fewer particles than they asked for.
+"""
+import math
+
+import numpy as np
+
+from tanks.simulation import GRAVITY, HEIGHT
+
+# Particle kinds
+DEBRIS = 0
+SMOKE = 1
+FLASH = 2
+KINDS = 3
+
+# Per-kind motion, indexed by kind: pull per tick (down is positive), drag
+# per tick and how much of the wind a particle catches
+KIND_GRAVITY = np.array([GRAVITY, -0.02, 0.0], dtype=np.float32)
+KIND_DRAG = np.array([0.99, 0.95, 0.8], dtype=np.float32)
+KIND_WIND = np.array([0.0, 0.5, 0.0], dtype=np.float32)
+
+# Sprites per kind over a particle's life, so they can be baked once
+FADE_STEPS = 8
+
+# A slow frame keeps this share of the budget; a quick one adds this share
+# of the capacity back
+BUDGET_CUT = 0.75
+BUDGET_RECOVERY = 0.02
+
+
+# Particle system class
+class ParticleSystem:
+    def __init__(self, capacity=50000, rng=None, min_budget=500):
+        self.capacity = capacity
+        self.budget = capacity  # Live particles allowed right now
+        self.min_budget = min(min_budget, capacity)
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.count = 0  # Live particles are the first count of each array
+        self.version = 0  # Changes whenever the particles do
+        self.x = np.zeros(capacity, dtype=np.float32)
+        self.y = np.zeros(capacity, dtype=np.float32)
+        self.velocity_x = np.zeros(capacity, dtype=np.float32)
+        self.velocity_y = np.zeros(capacity, dtype=np.float32)
+        self.age = np.zeros(capacity, dtype=np.float32)
+        self.life = np.ones(capacity, dtype=np.float32)
+        self.kind = np.zeros(capacity, dtype=np.int8)
+
+    def __len__(self):
+        return self.count
+
+    def _arrays(self):
+        return (self.x, self.y, self.velocity_x, self.velocity_y, self.age,
+                self.life, self.kind)
+
+    def emit(self, kind, x, y, velocity_x, velocity_y, life):
+        """Add particles of one kind and return how many fit the budget.
+
+        ``x`` to ``life`` are arrays or numbers, broadcast together; when
+        the budget is short the first ones are kept.
+        """
+        values = np.broadcast_arrays(x, y, velocity_x, velocity_y, life)
+        room = min(self.budget, self.capacity) - self.count
+        count = min(values[0].size, max(room, 0))
+        if not count:
+            return 0
+        start, stop = self.count, self.count + count
+        for array, value in zip((self.x, self.y, self.velocity_x,
+                                 self.velocity_y, self.life), values):
+            array[start:stop] = value.ravel()[:count]
+        self.age[start:stop] = 0
+        self.kind[start:stop] = kind
+        self.count = stop
+        self.version += 1
+        return count
+
+    def debris(self, x, y, count, speed=4.0):
+        # Dirt thrown up and out of a crater
+        angle = self.rng.uniform(0.15 * math.pi, 0.85 * math.pi, count)
+        speed = self.rng.uniform(0.3, 1.0, count) * speed
+        return self.emit(DEBRIS, x + self.rng.uniform(-4, 4, count),
+                         y + self.rng.uniform(-4, 4, count),
+                         np.cos(angle) * speed, -np.sin(angle) * speed,
+                         self.rng.uniform(40, 90, count))
+
+    def smoke(self, x, y):
+        # One puff behind each shell, at the arrays of positions given
+        count = np.size(x)
+        return self.emit(SMOKE, x, y, self.rng.normal(0, 0.15, count),
+                         self.rng.normal(0, 0.15, count),
+                         self.rng.uniform(25, 45, count))
+
+    def flash(self, x, y, angle, count=16):
+        # Sparks out of the cannon, around angle in degrees
+        angle = np.radians(angle + self.rng.uniform(-25, 25, count))
+        speed = self.rng.uniform(1.5, 5.0, count)
+        return self.emit(FLASH, x, y, np.cos(angle) * speed,
+                         -np.sin(angle) * speed,
+                         self.rng.uniform(6, 12, count))
+
+    def update(self, wind=0.0, ground=None):
+        """Move every particle one tick and drop the dead ones.
+
+        ``ground`` is a heightmap like ``Match.ground``; debris comes to
+        rest on it instead of falling through.
+        """
+        count = self.count
+        if not count:
+            return
+        x, y = self.x[:count], self.y[:count]
+        velocity_x = self.velocity_x[:count]
+        velocity_y = self.velocity_y[:count]
+        kind = self.kind[:count]
+
+        velocity_x += KIND_WIND[kind] * wind
+        x += velocity_x
+        y += velocity_y
+        velocity_y += KIND_GRAVITY[kind]
+        drag = KIND_DRAG[kind]
+        velocity_x *= drag
+        velocity_y *= drag
+        self.age[:count] += 1
+
+        if ground is not None and len(ground):
+            # Only the columns the debris is over are looked up
+            debris = np.flatnonzero(kind == DEBRIS)
+            if debris.size:
+                columns = np.clip(x[debris].astype(np.intp), 0,
+                                  len(ground) - 1)
+                first = int(columns.min())
+                heights = np.asarray(ground[first:int(columns.max()) + 1],
+                                     dtype=np.float32)
+                surface = HEIGHT - heights[columns - first]
+                below = y[debris] >= surface
+                landed = debris[below]
+                y[landed] = surface[below]
+                velocity_x[landed] = 0
+                velocity_y[landed] = 0
+
+        keep = (self.age[:count] < self.life[:count]) & (y <= HEIGHT)
+        if count > self.budget:
+            # Over budget: the oldest particles, at the front, go first
+            keep[:count - self.budget] = False
+        if not keep.all():
+            kept = int(keep.sum())
+            for array in self._arrays():
+                array[:kept] = array[:count][keep]
+            self.count = kept
+        self.version += 1
+
+    def adapt(self, frame_time, target):
+        """Adjust the budget to how long the last frame took, in seconds."""
+        if frame_time > target:
+            used = max(min(self.budget, self.count), self.min_budget)
+            self.budget = max(self.min_budget, int(used * BUDGET_CUT))
+        elif frame_time < target * BUDGET_CUT:
+            self.budget = min(self.capacity, self.budget
+                              + max(1, int(self.capacity * BUDGET_RECOVERY)))
+
+    def clear(self):
+        self.count = 0
+        self.version += 1
+
+    def sprites(self, steps=FADE_STEPS):
+        """Return (x, y, sprite) arrays of the live particles.
+
+        ``sprite`` is ``kind * steps`` plus how far through its life the
+        particle is, in ``steps`` stages, for a table of baked sprites.
+        """
+        count = self.count
+        stage = (self.age[:count] * steps / self.life[:count]).astype(np.intp)
+        np.minimum(stage, steps - 1, out=stage)
+        return (self.x[:count], self.y[:count],
+                self.kind[:count].astype(np.intp) * steps + stage)
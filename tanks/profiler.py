@@ -0,0 +1,141 @@
+"""Frame-time instrumentation for the game loop.
+
+``FrameProfiler`` times the stages of every frame with ``perf_counter_ns``.
+The loop calls ``begin_frame`` at the top of each frame and ``lap(name)``
+after each stage, which charges the time since the previous lap to that
+stage; ``timed`` wraps a function so its calls are charged to a stage of
+their own, e.g. drawing one kind of thing. A frame lasts from one
+``begin_frame`` to the next, so its total includes any time spent waiting
+for the frame cap.
+
+The last ``history`` frames are kept for rolling averages, the 99th
+percentile and a frame-time graph, and every frame can be written to a
+CSV or JSONL file for offline analysis. While ``enabled`` is False every
+call returns at once, so the profiler can stay in release builds.
+"""
+import csv
+import json
+import os
+from collections import deque
+from time import perf_counter_ns
+
+import numpy as np
+
+
+# Frame profiler class
+class FrameProfiler:
+    def __init__(self, stages=(), history=240):
+        self.enabled = False
+        self.history = history
+        self.stages = []  # Stage names, in the order they are reported
+        self.samples = {}  # Stage name -> nanoseconds of recent frames
+        self.current = {}  # Stage name -> nanoseconds so far this frame
+        self.frame_times = deque(maxlen=history)  # Nanoseconds per frame
+        self.frame = 0  # Frames recorded since the profiler was created
+        self.frame_start = self.last = None
+        self.export = None  # Open export file
+        self.writer = None  # Writes one frame to it
+        for name in stages:
+            self.add_stage(name)
+
+    def add_stage(self, name):
+        if name not in self.current:
+            self.stages.append(name)
+            self.samples[name] = deque(maxlen=self.history)
+            self.current[name] = 0
+
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+        self.frame_start = None  # Don't record a half-measured frame
+        for name in self.stages:
+            self.current[name] = 0
+
+    def begin_frame(self):
+        if not self.enabled:
+            return
+        now = perf_counter_ns()
+        if self.frame_start is not None:
+            self.end_frame(now)
+        self.frame_start = self.last = now
+
+    def lap(self, name):
+        # Charge the time since the last lap to a stage
+        if not self.enabled or self.frame_start is None:
+            return
+        now = perf_counter_ns()
+        self.add(name, now - self.last)
+        self.last = now
+
+    def add(self, name, nanoseconds):
+        if name not in self.current:
+            self.add_stage(name)
+        self.current[name] += nanoseconds
+
+    def timed(self, name, function):
+        """Return ``function`` wrapped to charge its run time to ``name``.
+
+        Only wrap when enabled; the wrapper itself always measures.
+        """
+        def run(*args, **kwargs):
+            start = perf_counter_ns()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.add(name, perf_counter_ns() - start)
+        return run
+
+    def end_frame(self, now):
+        total = now - self.frame_start
+        self.frame_times.append(total)
+        for name in self.stages:
+            self.samples[name].append(self.current[name])
+        if self.writer is not None:
+            self.writer(self.frame, total, self.current)
+        for name in self.stages:
+            self.current[name] = 0
+        self.frame += 1
+
+    def stats(self):
+        """Return (name, average ms, p99 ms) for the frame and each stage,
+        over the recent frames."""
+        rows = []
+        for name, samples in [("frame", self.frame_times)] \
+                + [(name, self.samples[name]) for name in self.stages]:
+            if samples:
+                values = np.fromiter(samples, dtype=np.float64) / 1e6
+                rows.append((name, values.mean(),
+                             np.percentile(values, 99)))
+            else:
+                rows.append((name, 0.0, 0.0))
+        return rows
+
+    def start_export(self, path):
+        """Write every recorded frame to ``path`` and enable the profiler.
+
+        A ``.csv`` file gets one column per stage known now, in
+        nanoseconds; anything else gets one JSON object per line with
+        every stage.
+        """
+        self.close()
+        self.export = open(path, "w", newline="")
+        if os.path.splitext(path)[1].lower() == ".csv":
+            writer = csv.writer(self.export)
+            stages = list(self.stages)
+            writer.writerow(["frame", "frame_ns"]
+                            + [f"{name}_ns" for name in stages])
+
+            def write(frame, total, current):
+                writer.writerow([frame, total]
+                                + [current.get(name, 0) for name in stages])
+        else:
+            def write(frame, total, current):
+                self.export.write(json.dumps({"frame": frame,
+                                              "frame_ns": total,
+                                              "stages": current}) + "\n")
+        self.writer = write
+        self.set_enabled(True)
+
+    def close(self):
+        if self.export is not None:
+            self.export.close()
+            self.export = self.writer = None
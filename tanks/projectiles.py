@@ -0,0 +1,271 @@
+"""Shells in flight, kept as a struct of arrays.
+
+A ``Match`` keeps every shell in one ``ProjectilePool``. Positions,
+velocities and what each shell does when it lands all live in preallocated
+NumPy arrays. A freed slot goes on a free list and is reused by the next
+shell, so firing allocates nothing once the pool is big enough. ``step``
+moves all live shells with the arithmetic of ``Projectile.move``, and
+``contacts`` tests all their paths against the ground and the tanks in one
+batched pass. A volley of hundreds of shells costs about as much
+per tick as a single one.
+"""
+from collections import namedtuple
+
+import numpy as np
+
+from tanks.settling import merge_run
+from tanks.simulation import (
+    CRATER_RADIUS,
+    FLYING,
+    GRAVITY,
+    GROUND,
+    HEIGHT,
+    NO_SPLIT,
+    OFF_SCREEN,
+    WIND_RESISTANCE,
+    tank_box,
+)
+from tanks.trajectory import (
+    height_levels,
+    point_contacts,
+    swept_contacts,
+    tank_contacts,
+)
+
+# Projectile pool class
+class ProjectilePool:
+    def __init__(self, capacity=64):
+        self.capacity = 0
+        self.free = []  # Free slots; the lowest is reused first
+        self.in_flight = set()  # Live slots, for walking a few shells
+        self.x = self.y = self.velocity_x = self.velocity_y = np.empty(0)
+        self.start_x = self.start_y = np.empty(0)
+        self.crater = np.empty(0, dtype=np.int32)
+        self.split = np.empty(0, dtype=np.int8)
+        self.fragments = np.empty(0, dtype=np.int32)
+        self.fragment_crater = np.empty(0, dtype=np.int32)
+        self.alive = np.empty(0, dtype=bool)
+        self.grow(capacity)
+
+    def grow(self, capacity):
+        # Reallocate every array with room for capacity shells
+        def resize(array):
+            grown = np.zeros(capacity, dtype=array.dtype)
+            grown[:self.capacity] = array
+            return grown
+
+        self.x, self.y = resize(self.x), resize(self.y)
+        self.velocity_x = resize(self.velocity_x)
+        self.velocity_y = resize(self.velocity_y)
+        self.start_x, self.start_y = resize(self.start_x), resize(self.start_y)
+        self.crater = resize(self.crater)
+        self.split = resize(self.split)
+        self.fragments = resize(self.fragments)
+        self.fragment_crater = resize(self.fragment_crater)
+        self.alive = resize(self.alive)
+        self.free[:0] = range(capacity - 1, self.capacity - 1, -1)
+        self.capacity = capacity
+
+    def __len__(self):
+        return len(self.in_flight)
+
+    def live(self):
+        # Slots of the shells in flight, in order
+        return np.flatnonzero(self.alive)
+
+    def spawn(self, x, y, velocity_x, velocity_y, crater=CRATER_RADIUS,
+              split=NO_SPLIT, fragments=0, fragment_crater=0):
+        """Add shells and return their slots.
+
+        ``x`` to ``velocity_y`` are arrays or numbers, broadcast together.
+        """
+        x, y, velocity_x, velocity_y = np.broadcast_arrays(
+            *(np.asarray(value, dtype=np.float64)
+              for value in (x, y, velocity_x, velocity_y)))
+        count = x.size
+        if count > len(self.free):
+            capacity = max(self.capacity, 1)
+            while capacity - len(self) < count:
+                capacity *= 2
+            self.grow(capacity)
+        taken = self.free[:-count - 1:-1]
+        del self.free[-count:]
+        self.in_flight.update(taken)
+        slots = np.array(taken, dtype=np.intp)
+
+        self.x[slots] = self.start_x[slots] = x.ravel()
+        self.y[slots] = self.start_y[slots] = y.ravel()
+        self.velocity_x[slots] = velocity_x.ravel()
+        self.velocity_y[slots] = velocity_y.ravel()
+        self.crater[slots] = crater
+        self.split[slots] = split
+        self.fragments[slots] = fragments
+        self.fragment_crater[slots] = fragment_crater
+        self.alive[slots] = True
+        return slots
+
+    def kill(self, slots):
+        slots = np.asarray(slots, dtype=np.intp)
+        slots = slots[self.alive[slots]]
+        self.alive[slots] = False
+        slots = slots.tolist()
+        self.in_flight.difference_update(slots)
+        self.free.extend(slots)
+        self.free.sort(reverse=True)
+
+    def clear(self):
+        self.alive[:] = False
+        self.in_flight.clear()
+        self.free = list(range(self.capacity - 1, -1, -1))
+
+    def step(self, wind):
+        """Move every live shell one tick and return their slots.
+
+        Same update order as ``Projectile.move``, so a lone shell flies
+        exactly as it always did. ``start_x`` and ``start_y`` keep where
+        each shell was before the move.
+        """
+        slots = self.live()
+        x, y = self.x[slots], self.y[slots]
+        velocity_x = self.velocity_x[slots]
+        velocity_y = self.velocity_y[slots]
+        self.start_x[slots] = x
+        self.start_y[slots] = y
+
+        velocity_x += wind
+        x += velocity_x
+        y += velocity_y
+        velocity_y += GRAVITY
+        velocity_x *= WIND_RESISTANCE
+        velocity_y *= WIND_RESISTANCE
+
+        self.x[slots], self.y[slots] = x, y
+        self.velocity_x[slots] = velocity_x
+        self.velocity_y[slots] = velocity_y
+        return slots
+
+    def move(self, slot, wind):
+        """Move one shell one tick, like ``step`` but with plain floats.
+
+        Returns (start_x, start_y, x, y, velocity_y). For a shell or two
+        this is far cheaper than slicing every array in ``step``, and the
+        arithmetic is the same, so the shell lands in the same place.
+        """
+        start_x, start_y = self.x.item(slot), self.y.item(slot)
+        velocity_x = self.velocity_x.item(slot)
+        velocity_y = self.velocity_y.item(slot)
+
+        velocity_x += wind
+        x = start_x + velocity_x
+        y = start_y + velocity_y
+        velocity_y += GRAVITY
+        velocity_x *= WIND_RESISTANCE
+        velocity_y *= WIND_RESISTANCE
+
+        self.start_x[slot], self.start_y[slot] = start_x, start_y
+        self.x[slot], self.y[slot] = x, y
+        self.velocity_x[slot] = velocity_x
+        self.velocity_y[slot] = velocity_y
+        return start_x, start_y, x, y, velocity_y
+
+    def positions(self, alpha=1.0):
+        """Return (slots, x, y) of live shells, ``alpha`` of the way
+        through the last tick, for drawing between ticks."""
+        slots = self.live()
+        start_x, start_y = self.start_x[slots], self.start_y[slots]
+        return (slots, start_x + (self.x[slots] - start_x) * alpha,
+                start_y + (self.y[slots] - start_y) * alpha)
+
+    def contacts(self, slots, tanks, world_width, ground_index=None,
+                 mask=None, swept=True):
+        """Test the last tick of the shells in ``slots`` in one pass.
+
+        Returns (outcome, tank, stop_x, stop_y) arrays, as ``first_contact``
+        (or ``point_contact`` with ``swept=False``) would for each shell
+        against the ground in ``ground_index``, or in ``mask`` for bitmap
+        terrain. Shells that touched nothing but left the world are
+        OFF_SCREEN.
+        """
+        x0, y0 = self.start_x[slots], self.start_y[slots]
+        x1, y1 = self.x[slots], self.y[slots]
+        tank_boxes = [tank_box(tank) for tank in tanks]
+        if ground_index is not None:
+            ground_index.refresh()
+        if not swept:
+            solid = mask.solid_at(x1, y1) if mask is not None else None
+            ground = ground_index.ground if ground_index is not None \
+                else None
+            outcome, tank = point_contacts(x1, y1, ground, tank_boxes,
+                                           solid)
+            stop_x, stop_y = x1.copy(), y1.copy()
+        elif mask is not None:
+            best, stop_x, stop_y = mask.segment_contacts(x0, y0, x1, y1)
+            outcome = np.where(best < np.inf, GROUND, FLYING).astype(np.int8)
+            tank = np.full(x0.size, -1, dtype=np.int8)
+            tank_contacts(x0, y0, x1, y1, tank_boxes, best, outcome, tank,
+                          stop_x, stop_y)
+        else:
+            outcome, tank, stop_x, stop_y = swept_contacts(
+                x0, y0, x1, y1, ground_index.ground, ground_index.levels,
+                ground_index.lowest, tank_boxes)
+
+        off_screen = (outcome == FLYING) & ((x1 < 0) | (x1 > world_width)
+                                            | (y1 > HEIGHT))
+        outcome[off_screen] = OFF_SCREEN
+        stop_x[off_screen] = x1[off_screen]
+        stop_y[off_screen] = y1[off_screen]
+        return outcome, tank, stop_x, stop_y
+
+
+# Range maximum over a heightmap that follows the craters dug into it
+class GroundIndex:
+    def __init__(self, ground):
+        self.source = ground  # The list the game digs into
+        self.ground = np.asarray(ground, dtype=np.float64)
+        self.levels = height_levels(self.ground)  # levels[0] is ground
+        # Craters only lower the ground, so the first peak stays a bound
+        self.lowest = HEIGHT - self.levels[-1].max()
+        # Runs of columns changed since the last refresh, kept apart so
+        # craters far from each other do not refresh everything between
+        self.stale = []
+
+    def __len__(self):
+        return len(self.ground)
+
+    def max_height(self, start, stop):
+        """Highest ground in columns start..stop inclusive, like
+        ``TerrainIndex.max_height``; call ``refresh`` first."""
+        level = (stop - start + 1).bit_length() - 1
+        heights = self.levels[level]
+        return max(heights[start], heights[stop - (1 << level) + 1])
+
+    def mark(self, columns):
+        self.stale = merge_run(self.stale, columns)
+
+    def refresh(self):
+        # Copy in changed columns and redo only the maxima they feed into;
+        # a tick's craters are all taken in at once, run by run
+        if not self.stale:
+            return
+        runs = [(run.start, run.stop) for run in self.stale]
+        self.stale = []
+        for start, stop in runs:
+            self.ground[start:stop] = self.source[start:stop]
+        span = 1
+        for below, level in zip(self.levels, self.levels[1:]):
+            # Each level reaches further left; runs that grow into each
+            # other are redone once
+            grown = []
+            for start, stop in runs:
+                start = max(0, start - span)
+                stop = min(len(level), stop)
+                if grown and start <= grown[-1][1]:
+                    start, reached = grown.pop()
+                    stop = max(stop, reached)
+                grown.append((start, stop))
+            runs = grown
+            for start, stop in runs:
+                if start < stop:
+                    level[start:stop] = np.maximum(
+                        below[start:stop], below[start + span:stop + span])
+            span *= 2
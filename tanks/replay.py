@@ -0,0 +1,243 @@
+"""Compact replays: a match's seed and settings plus the input of each tick.
+
+Everything random in a ``Match`` comes from its seed, so the seed, the
+settings and the ``Controls`` of every tick are enough to play a match
+again exactly. Inputs are stored as runs, since a player holds the same
+keys (usually none) for many ticks in a row; a typical match is a few
+hundred bytes.
+
+File layout, little-endian:
+
+    magic       4 bytes   b"OTTR"
+    version     1 byte
+    difficulty  1 byte    index into DIFFICULTIES
+    flags       1 byte    bit 0: swept collision, bit 1: bitmap terrain,
+                          bit 2: terrain settling
+    seed        8 bytes
+    ticks       4 bytes   number of ticks recorded
+    width       4 bytes   world width (version 2 on; version 1 is 800)
+    runs        until all ticks are covered: one input byte, then the run
+                length as an unsigned LEB128 varint
+
+An input byte holds aim + 1 in bits 0-1, power + 1 in bits 2-3, fire in
+bit 4 and weapon switch in bit 5.
+
+Run ``python -m tanks.replay FILE...`` to re-simulate replays headless at
+full speed and print how each match ended.
+"""
+import argparse
+import struct
+import time
+from collections import namedtuple
+
+from tanks.simulation import MIN_WIDTH, NO_INPUT, WIDTH, Controls, Match
+
+MAGIC = b"OTTR"
+VERSION = 2
+DIFFICULTIES = ("easy", "medium", "hard")
+_HEADER = struct.Struct("<4sBBBQI")
+_WIDTH = struct.Struct("<I")
+_SWEPT = 1
+_BITMAP = 2
+_SETTLING = 4
+
+# A recorded match; runs is a list of (Controls, tick count)
+Replay = namedtuple("Replay", ["seed", "difficulty", "swept", "runs",
+                               "width", "bitmap", "settling"],
+                    defaults=(WIDTH, False, False))
+
+# What re-simulating a replay produced; events are (tick, Event) pairs
+ReplayResult = namedtuple("ReplayResult", ["match", "ticks", "events"])
+
+
+# Class for errors in replay data
+class ReplayError(ValueError):
+    pass
+
+
+# Function to pack Controls into one byte
+def encode_controls(controls):
+    return (controls.aim + 1) | (controls.power + 1) << 2 \
+        | bool(controls.fire) << 4 | bool(controls.weapon) << 5
+
+
+# Function to unpack one byte into Controls
+def decode_controls(code):
+    return Controls((code & 3) - 1, (code >> 2 & 3) - 1, bool(code & 16),
+                    code >> 5 & 1)
+
+
+# Replay recorder class
+class ReplayRecorder:
+    def __init__(self, match):
+        self.seed = match.seed
+        self.difficulty = match.difficulty
+        self.swept = match.swept
+        self.width = match.width
+        self.bitmap = match.mask is not None
+        self.settling = match.settler is not None
+        self.runs = []
+
+    def record(self, controls):
+        # Call once per tick with the Controls passed to Match.tick
+        if self.runs and self.runs[-1][0] == controls:
+            self.runs[-1][1] += 1
+        else:
+            self.runs.append([controls, 1])
+
+    @property
+    def replay(self):
+        return Replay(self.seed, self.difficulty, self.swept,
+                      [tuple(run) for run in self.runs], self.width,
+                      self.bitmap, self.settling)
+
+
+# Function to count the ticks in a replay
+def replay_ticks(replay):
+    return sum(count for _, count in replay.runs)
+
+
+# Function to list a replay's inputs one tick at a time
+def iter_inputs(replay):
+    for controls, count in replay.runs:
+        for _ in range(count):
+            yield controls
+
+
+# Function to turn a replay into bytes
+def encode_replay(replay):
+    flags = (_SWEPT if replay.swept else 0) \
+        | (_BITMAP if replay.bitmap else 0) \
+        | (_SETTLING if replay.settling else 0)
+    data = bytearray(_HEADER.pack(MAGIC, VERSION,
+                                  DIFFICULTIES.index(replay.difficulty),
+                                  flags, replay.seed, replay_ticks(replay)))
+    data += _WIDTH.pack(replay.width)
+    for controls, count in replay.runs:
+        data.append(encode_controls(controls))
+        while count >= 0x80:
+            data.append(count & 0x7F | 0x80)
+            count >>= 7
+        data.append(count)
+    return bytes(data)
+
+
+# Function to read a replay back from bytes
+def decode_replay(data):
+    if len(data) < _HEADER.size:
+        raise ReplayError("replay is too short")
+    magic, version, difficulty, flags, seed, ticks = _HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ReplayError("not a replay file")
+    if not 1 <= version <= VERSION:
+        raise ReplayError(f"unsupported replay version {version}")
+    if difficulty >= len(DIFFICULTIES):
+        raise ReplayError(f"unknown difficulty {difficulty}")
+
+    runs = []
+    position = _HEADER.size
+    width = WIDTH
+    if version >= 2:
+        if len(data) < position + _WIDTH.size:
+            raise ReplayError("replay is too short")
+        width, = _WIDTH.unpack_from(data, position)
+        position += _WIDTH.size
+        if width < MIN_WIDTH:
+            raise ReplayError(f"world width {width} is less than {MIN_WIDTH}")
+    total = 0
+    try:
+        while total < ticks:
+            controls = decode_controls(data[position])
+            count = shift = 0
+            while True:
+                position += 1
+                byte = data[position]
+                count |= (byte & 0x7F) << shift
+                shift += 7
+                if not byte & 0x80:
+                    break
+            position += 1
+            runs.append((controls, count))
+            total += count
+    except IndexError:
+        raise ReplayError("replay is truncated") from None
+    if total != ticks:
+        raise ReplayError("replay tick count does not match its inputs")
+    return Replay(seed, DIFFICULTIES[difficulty], bool(flags & _SWEPT), runs,
+                  width, bool(flags & _BITMAP), bool(flags & _SETTLING))
+
+
+# Function to save a replay to a file
+def save_replay(path, replay):
+    with open(path, "wb") as file:
+        file.write(encode_replay(replay))
+
+
+# Function to load a replay from a file
+def load_replay(path):
+    with open(path, "rb") as file:
+        return decode_replay(file.read())
+
+
+# Function to set up the match a replay starts from
+def replay_match(replay):
+    return Match(replay.difficulty, swept=replay.swept, seed=replay.seed,
+                 width=replay.width, bitmap=replay.bitmap,
+                 settling=replay.settling)
+
+
+# Function to play a replay through headless as fast as possible
+def resimulate(replay):
+    """Run every recorded tick and return a ReplayResult.
+
+    Ticks with no input, no shell in flight and nothing settling change
+    nothing, so whole runs of them are skipped instead of stepped;
+    everything else goes through ``Match.tick`` exactly as it did when the
+    match was played.
+    """
+    match = replay_match(replay)
+    events = []
+    tick = 0
+    for controls, count in replay.runs:
+        end = tick + count
+        while tick < end:
+            if controls == NO_INPUT and not match.shells \
+                    and not match.is_settling():
+                tick = end  # Nothing moves until the next input
+                break
+            for event in match.tick(controls):
+                events.append((tick, event))
+            tick += 1
+    return ReplayResult(match, tick, events)
+
+
+# Function to describe how a re-simulated match ended, for the command line
+def describe_result(result):
+    match = result.match
+    if match.winner is None:
+        ending = "no winner"
+    else:
+        ending = f"tank {match.tanks.index(match.winner) + 1} won"
+    health = "/".join(str(tank.health) for tank in match.tanks)
+    return (f"{ending} after {result.ticks} ticks, {match.turn_counter} "
+            f"turns, health {health}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Re-simulate replays headless at full speed.")
+    parser.add_argument("replays", nargs="+", help="replay files to check")
+    args = parser.parse_args(argv)
+
+    for path in args.replays:
+        replay = load_replay(path)
+        start = time.perf_counter()
+        result = resimulate(replay)
+        elapsed = time.perf_counter() - start
+        speed = result.ticks / 60 / elapsed if elapsed else float("inf")
+        print(f"{path}: seed {replay.seed:016x}, {replay.difficulty}, "
+              f"{describe_result(result)} ({speed:.0f}x real time)")
+
+
+if __name__ == "__main__":
+    main()
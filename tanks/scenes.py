@@ -0,0 +1,181 @@
+"""Scenes and the one loop that runs them.
+
+The front end is a stack of scenes: the main menu, a menu pushed on top of
+it, the game, the pause menu over the game and so on. ``SceneManager.run``
+is the only loop. It hands each event to the scene on top, runs the
+delayed actions in its ``TimerQueue`` when they fall due and asks the scene
+for a frame every ``frame_interval`` seconds. In between it sleeps in
+``pygame.event.wait`` until the next event, timer or frame, whichever comes
+first, and nothing ever sleeps in ``pygame.time.delay``.
+
+A scene whose ``frame_interval`` is None only changes on input, like the
+game over screen: it is drawn once when it comes to the top, and while it
+stays there the loop sleeps until something happens, so an idle game uses
+no CPU at all.
+"""
+import heapq
+import itertools
+import math
+import time
+from collections import deque
+
+import pygame
+
+# Events after which a still scene is drawn again, e.g. when the window
+# was covered and uncovered
+EXPOSE_EVENTS = (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED)
+
+
+# Timer queue class: actions to run after a delay, soonest first
+class TimerQueue:
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.timers = []  # Heap of (due time, handle, action)
+        self.handles = itertools.count()  # Also orders timers due together
+        self.cancelled = set()
+
+    def schedule(self, delay, action):
+        """Run ``action()`` after ``delay`` seconds; returns a handle for
+        ``cancel``."""
+        handle = next(self.handles)
+        heapq.heappush(self.timers, (self.clock() + delay, handle, action))
+        return handle
+
+    def cancel(self, handle):
+        if any(timer[1] == handle for timer in self.timers):
+            self.cancelled.add(handle)
+
+    def next_due(self):
+        # When the next timer is due, or None if there is none
+        while self.timers and self.timers[0][1] in self.cancelled:
+            self.cancelled.discard(heapq.heappop(self.timers)[1])
+        return self.timers[0][0] if self.timers else None
+
+    def run_due(self):
+        # Run every action that is due, in the order they fell due
+        now = self.clock()
+        while True:
+            due = self.next_due()
+            if due is None or due > now:
+                break
+            heapq.heappop(self.timers)[2]()
+
+    def clear(self):
+        self.timers.clear()
+        self.cancelled.clear()
+
+
+# Base scene class
+class Scene:
+    # Seconds between frames while the scene is on top, or None for a scene
+    # that only changes on input
+    frame_interval = None
+
+    def __init__(self):
+        self.manager = None  # Set when the scene is pushed
+
+    def enter(self):
+        # Called whenever the scene comes to the top, before its first frame
+        pass
+
+    def handle(self, event):
+        # Called for every event while the scene is on top
+        pass
+
+    def frame(self, elapsed):
+        # Update and draw; elapsed is the seconds since the last frame, or 0
+        # for the first one after enter
+        pass
+
+
+# Scene manager class
+class SceneManager:
+    def __init__(self):
+        self.stack = []
+        self.timers = TimerQueue()
+        self.pending = deque()  # Events not handled yet
+        self.shown = None  # The scene on top when the last frame was drawn
+        self.last_frame = None  # When it was drawn, or None to draw now
+
+    @property
+    def scene(self):
+        return self.stack[-1] if self.stack else None
+
+    def push(self, scene):
+        scene.manager = self
+        self.stack.append(scene)
+
+    def pop(self):
+        return self.stack.pop()
+
+    def reset(self, scene):
+        # Make scene the only one, e.g. when going back to the main menu
+        self.stack.clear()
+        self.push(scene)
+
+    def quit(self):
+        self.stack.clear()
+        self.timers.clear()
+
+    def run(self):
+        """Run the scenes until the last one is gone."""
+        while self.stack:
+            self.step()
+
+    def wait(self, timeout):
+        """Return the events that arrive within ``timeout`` seconds, or
+        block until one does if ``timeout`` is None."""
+        if timeout is None:
+            events = [pygame.event.wait()]
+        elif timeout > 0:
+            # Rounded up, so the loop does not wake just before it is due
+            events = [pygame.event.wait(math.ceil(timeout * 1000))]
+        else:
+            events = []
+        return [event for event in events if event.type != pygame.NOEVENT] \
+            + pygame.event.get()
+
+    def step(self):
+        """Wait for the next event, timer or frame, then handle whatever
+        is due."""
+        scene = self.stack[-1]
+        if scene is not self.shown:
+            self.shown = scene
+            self.last_frame = None
+            scene.enter()
+            if self.scene is not scene:
+                return
+
+        # Sleep until the next timer or frame is due, or an event comes
+        due = self.timers.next_due()
+        if self.last_frame is None:
+            due = 0  # A scene that just came up is drawn at once
+        elif scene.frame_interval is not None:
+            frame_due = self.last_frame + scene.frame_interval
+            due = frame_due if due is None else min(due, frame_due)
+        if not self.pending:
+            self.pending.extend(self.wait(
+                None if due is None else due - time.perf_counter()))
+
+        # Events left over when the scene changes go to the new one
+        while self.pending and self.scene is scene:
+            event = self.pending.popleft()
+            if event.type == pygame.QUIT:
+                self.quit()
+            elif event.type in EXPOSE_EVENTS \
+                    and scene.frame_interval is None:
+                self.last_frame = None
+            else:
+                scene.handle(event)
+        self.timers.run_due()
+        if self.scene is not scene:
+            return
+
+        now = time.perf_counter()
+        if self.last_frame is None:
+            scene.frame(0.0)
+            self.last_frame = now
+        elif scene.frame_interval is not None \
+                and now >= self.last_frame + scene.frame_interval:
+            scene.frame(now - self.last_frame)
+            self.last_frame = now
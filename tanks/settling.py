@@ -0,0 +1,189 @@
+"""Terrain settling: ground that slides and falls after craters.
+
+With ``Match(settling=True)`` craters no longer leave cliffs standing and
+overhangs hanging in the air. Every tick, ground that is steeper than it
+can rest slides a little towards its lower neighbour, and on bitmap terrain
+every pixel with air anywhere beneath it drops a row. Ground rests at
+``MAX_SLOPE``, or as steep as it was when the match began, so only what
+craters disturbed moves and the hills themselves stay up. Both are cellular
+updates made of a few array operations over neighbouring pairs of columns,
+taken in two passes (even pairs, then odd) so no column is moved twice at
+once.
+
+Only the dirty columns around recent craters are processed. They are kept
+as separate runs, one per patch of ground that is still moving, each
+followed one column wider on each side and dropped once it has come to
+rest. Craters far apart settle as two small runs and not as one span
+between them, so the cost is proportional to the disturbed area and not to
+the width of the world.
+"""
+import numpy as np
+
+# Steepest slope the ground holds, in pixels of height per column
+MAX_SLOPE = 2
+# Most height a column of the heightmap passes to a neighbour per tick, so
+# a slide plays out over several frames
+SLIDE_RATE = 2.0
+# Slopes less than this over MAX_SLOPE count as at rest, so the ground
+# stops creeping
+SETTLE_EPSILON = 0.5
+# Bitmap terrain moves a pixel at a time; this many updates per tick make
+# it fall and slide about as fast as a heightmap
+MASK_SUBSTEPS = 4
+
+
+# Function to split a run of columns into its neighbouring pairs, as views
+def column_pairs(values, parity):
+    # Pairs (k, k + 1) for k = parity, parity + 2, ...
+    return values[parity:len(values) - 1:2], values[parity + 1::2]
+
+
+# Function to add a range of columns to sorted, separate runs; returns the
+# new list, where runs the range overlaps or touches are merged with it
+def merge_run(runs, columns):
+    if not columns:
+        return runs
+    start, stop = columns.start, columns.stop
+    kept = []
+    for run in runs:
+        if run.stop < start or run.start > stop:
+            kept.append(run)
+        else:
+            start, stop = min(start, run.start), max(stop, run.stop)
+    kept.append(range(start, stop))
+    kept.sort(key=lambda run: run.start)
+    return kept
+
+
+# Base class for settling that works on runs of dirty columns
+class DirtyColumns:
+    def __init__(self, heights):
+        self.width = len(heights)
+        # Columns that may still move: sorted runs with a gap between each
+        self.dirty = []
+        # Steepest slope between each column and the next that holds
+        self.rest_slope = np.maximum(MAX_SLOPE, np.abs(np.diff(heights)))
+
+    @property
+    def active(self):
+        return bool(self.dirty)
+
+    def mark(self, columns):
+        # Note that the ground changed in some columns, e.g. under a crater
+        self.dirty = merge_run(self.dirty, columns)
+
+    def regions(self):
+        # Each dirty run and one more column on each side, whose slope to
+        # the dirty ones can change too; runs whose margins meet are taken
+        # together, so no column is in two regions
+        regions = []
+        for run in self.dirty:
+            start = max(0, run.start - 1)
+            stop = min(self.width, run.stop + 1)
+            if regions and start <= regions[-1].stop:
+                regions[-1] = range(regions[-1].start, stop)
+            else:
+                regions.append(range(start, stop))
+        return regions
+
+    def pair_rest_slopes(self, region, parity):
+        # rest_slope for the pairs column_pairs gives over a region
+        return self.rest_slope[region.start + parity:region.stop - 1:2]
+
+    def step(self):
+        """Settle one tick and return the runs of columns that changed.
+
+        Only the changed columns stay dirty for the next tick.
+        """
+        moved = []
+        for region in self.regions():
+            moved.extend(self.settle(region))
+        self.dirty = moved
+        return moved
+
+    def moved(self, region, changed):
+        """Split the changed columns of a region into runs."""
+        changed = np.flatnonzero(changed) + region.start
+        if not changed.size:
+            return []
+        gaps = np.flatnonzero(np.diff(changed) > 1)
+        starts = changed[np.concatenate(([0], gaps + 1))].tolist()
+        stops = (changed[np.concatenate((gaps, [-1]))] + 1).tolist()
+        return [range(start, stop) for start, stop in zip(starts, stops)]
+
+
+# Settling for a heightmap: steep ground slides, mass is kept
+class HeightmapSettling(DirtyColumns):
+    def __init__(self, ground):
+        super().__init__(np.asarray(ground, dtype=np.float64))
+        self.ground = ground  # The list the game digs into
+
+    def settle(self, region):
+        # Slide the ground in one region; returns the runs that changed
+        heights = np.array(self.ground[region.start:region.stop],
+                           dtype=np.float64)
+        before = heights.copy()
+        for parity in (0, 1):
+            left, right = column_pairs(heights, parity)
+            drop = left - right
+            # Half the excess over the steepest stable slope evens it out
+            excess = np.abs(drop) - self.pair_rest_slopes(region, parity)
+            amount = np.where(excess > SETTLE_EPSILON,
+                              np.minimum(excess / 2, SLIDE_RATE), 0.0) \
+                * np.sign(drop)
+            left -= amount
+            right += amount
+
+        runs = self.moved(region, heights != before)
+        for run in runs:
+            self.ground[run.start:run.stop] = heights[
+                run.start - region.start:run.stop - region.start].tolist()
+        return runs
+
+
+# Settling for a TerrainMask: unsupported pixels fall, steep ground slides
+class MaskSettling(DirtyColumns):
+    def __init__(self, mask):
+        super().__init__(mask.top)
+        self.mask = mask
+
+    def settle(self, region):
+        # Drop and slide the pixels in one region; returns the runs that
+        # changed
+        mask = self.mask
+        solid = mask.columns(region.start, region.stop)
+        before = solid.copy()
+        columns = np.arange(len(solid))
+        for _ in range(MASK_SUBSTEPS):
+            # Every pixel with air somewhere below it falls one row
+            air_below = np.zeros_like(solid)
+            air_below[:, :-1] = np.logical_or.accumulate(
+                ~solid[:, :0:-1], axis=1)[:, ::-1]
+            falling = solid & air_below
+            solid &= ~falling
+            solid[:, 1:] |= falling[:, :-1]
+
+            # Then the top pixel of a column steeper above its neighbour
+            # than it can rest slides onto it
+            for parity in (0, 1):
+                top = mask._first_solid(solid)
+                left, right = column_pairs(columns, parity)
+                step = top[right] - top[left]  # Positive where left is higher
+                high = np.where(step > 0, left, right)
+                low = np.where(step > 0, right, left)
+                slide = np.abs(step) > self.pair_rest_slopes(region,
+                                                             parity)
+                high, low = high[slide], low[slide]
+                solid[high, top[high]] = False
+                solid[low, top[low] - 1] = True
+
+        changed = (solid != before).any(axis=1)
+        runs = self.moved(region, changed)
+        for run in runs:
+            start = run.start - region.start
+            stop = run.stop - region.start
+            mask.bits[run.start:run.stop] = np.packbits(solid[start:stop],
+                                                        axis=1)
+            mask.top[run.start:run.stop] = mask._first_solid(
+                solid[start:stop])
+        return runs
@@ -0,0 +1,707 @@
+"""Pygame-free simulation core for Over The Top Tanks.
+
+Terrain, tanks, shells, craters, turns and wind all live here. Nothing in
+this module touches pygame, so a whole match can be played out headless;
+the front end only draws the state and reacts to the events that
+``Match.update`` reports.
+"""
+import math
+import random
+from collections import namedtuple
+
+import numpy as np
+
+from tanks.mask import TerrainMask
+from tanks.settling import HeightmapSettling, MaskSettling
+from tanks.terrain import generate_heightmap, smooth_heights
+
+# World settings; WIDTH is the screen and the default world width
+WIDTH, HEIGHT = 800, 600
+# Narrowest world a match is played in, the classic map; narrower ones
+# leave no room to place the tanks apart
+MIN_WIDTH = WIDTH
+
+# Tanks start 100 pixels in from the edges, centred and at most this far
+# apart on wide worlds; a full-power shot carries about 4000 pixels
+MAX_TANK_SPACING = 2400
+
+# Colors
+RED = (255, 0, 0)
+BLUE = (0, 0, 255)
+
+# Physics settings
+GRAVITY = 0.5
+WIND_RESISTANCE = 0.99  # Wind resistance to simulate more realistic physics
+
+# Tank hitbox is 50x30 pixels around the tank position
+TANK_HALF_WIDTH = 25
+TANK_HALF_HEIGHT = 15
+TANK_HEALTH = 3  # Tanks can be hit three times
+
+CRATER_RADIUS = 15
+
+# With settling, a tank that falls further than this many pixels loses a
+# health point, and one more for every FALL_DAMAGE_DROP beyond
+FALL_SAFE_DROP = 40
+FALL_DAMAGE_DROP = 100
+
+# Weapons. A shot fires a fan of shells spread evenly over some degrees,
+# each digging a crater of its own radius. A shell can split into
+# fragments at the top of its flight (MIRV) or where it lands (cluster
+# bomb); fragments have their own crater radius.
+NO_SPLIT = 0
+SPLIT_AT_APEX = 1
+SPLIT_ON_IMPACT = 2
+
+Weapon = namedtuple("Weapon", ["name", "shells", "spread", "crater", "split",
+                               "fragments", "fragment_crater"])
+
+WEAPONS = (
+    Weapon("Shell", 1, 0, CRATER_RADIUS, NO_SPLIT, 0, 0),
+    Weapon("Shotgun", 12, 12, 6, NO_SPLIT, 0, 0),
+    Weapon("MIRV", 1, 0, 8, SPLIT_AT_APEX, 5, 10),
+    Weapon("Cluster Bomb", 1, 0, 10, SPLIT_ON_IMPACT, 30, 5),
+    Weapon("Volley", 500, 60, 3, NO_SPLIT, 0, 0),
+)
+
+# Up to this many shells in flight are moved one at a time with plain
+# floats; more are moved and tested in one batched NumPy pass
+SCALAR_SHELLS = 4
+
+# MIRV warheads fan out this much sideways, in pixels per tick
+MIRV_SPREAD = 2.5
+# Cluster bomblets fly up at random angles (degrees) and speeds
+CLUSTER_ANGLES = (20, 160)
+CLUSTER_SPEEDS = (3, 8)
+
+# Something that happened during Match.update, for the front end to show.
+# columns is the range of ground columns that changed, if any.
+Event = namedtuple("Event", ["kind", "x", "y", "tank", "columns"],
+                   defaults=(None, None, None, None))
+
+# Player input for one tick: aim and power are -1, 0 or 1, fire is a bool
+# and weapon is 1 to switch to the next weapon
+Controls = namedtuple("Controls", ["aim", "power", "fire", "weapon"],
+                      defaults=(0, 0, False, 0))
+NO_INPUT = Controls()
+
+
+# Tank class
+class Tank:
+    def __init__(self, x, color):
+        self.x = x
+        self.color = color
+        self.power = 30  # Starting power adjusted to new max
+        self.angle = 45
+        self.health = TANK_HEALTH
+        self.y = 0  # Will be set based on ground height
+        self.weapon = 0  # Index into Match.weapons
+        self.fall_speed = 0
+        self.fall_from = None  # Where a falling tank started to fall
+
+    def aim(self, delta_angle):
+        self.angle += delta_angle
+        self.angle = max(0, min(180, self.angle))
+
+    def change_power(self, delta_power):
+        self.power += delta_power
+        self.power = max(10, min(70, self.power))  # Adjusted max power to 70
+
+    def next_weapon(self, weapon_count):
+        self.weapon = (self.weapon + 1) % weapon_count
+
+    def shoot(self, world_width=WIDTH):
+        radian_angle = math.radians(self.angle)
+        velocity_x = math.cos(radian_angle) * self.power
+        velocity_y = -math.sin(radian_angle) * self.power
+        return Projectile(self.x, self.y - 10, velocity_x, velocity_y,
+                          world_width)
+
+    def is_hit(self, projectile):
+        if projectile is None:
+            return False
+        return (
+            self.x - TANK_HALF_WIDTH < projectile.x < self.x + TANK_HALF_WIDTH
+            and self.y - TANK_HALF_HEIGHT < projectile.y
+            < self.y + TANK_HALF_HEIGHT
+        )
+
+
+# Projectile class
+class Projectile:
+    def __init__(self, x, y, velocity_x, velocity_y, world_width=WIDTH):
+        self.x = x
+        self.y = y
+        self.velocity_x = velocity_x
+        self.velocity_y = velocity_y
+        self.gravity = GRAVITY
+        self.wind_resistance = WIND_RESISTANCE
+        self.world_width = world_width
+        self.active = True
+
+    def move(self, wind):
+        if self.active:
+            self.velocity_x += wind  # Apply wind as a constant force
+            self.x += self.velocity_x
+            self.y += self.velocity_y
+            self.velocity_y += self.gravity
+            self.velocity_x *= self.wind_resistance  # Reduce speed due to air resistance
+            self.velocity_y *= self.wind_resistance
+
+            # Mark the projectile as inactive if it leaves the world
+            if self.x < 0 or self.x > self.world_width or self.y > HEIGHT:
+                self.active = False
+
+
+# Collision
+#
+# A shell can move tens of pixels in one tick, so testing only where it ends
+# up lets fast shots pass through thin peaks and the 50x30 tank boxes.
+# first_contact follows the segment the shell travelled during the tick and
+# returns the first point where it touches the ground or a tank; the ground
+# test walks only the columns the segment crosses. point_contact is the
+# original end-point test, used by Match(swept=False). Both take an optional
+# TerrainMask, which then stands in for the heightmap as the ground.
+
+# How a shell's flight ended
+FLYING = 0  # Still in the air
+GROUND = 1
+TANK = 2
+OFF_SCREEN = 3
+
+# Where a shell touched something; tank is an index into the tanks, or -1
+Contact = namedtuple("Contact", ["outcome", "x", "y", "tank"])
+
+
+# Function to get the hitbox of a tank as (left, right, top, bottom)
+def tank_box(tank):
+    return (tank.x - TANK_HALF_WIDTH, tank.x + TANK_HALF_WIDTH,
+            tank.y - TANK_HALF_HEIGHT, tank.y + TANK_HALF_HEIGHT)
+
+
+# Function to test a single point, like the original game loop did
+def point_contact(x, y, ground, tanks, mask=None):
+    if mask is not None:
+        if mask.is_solid(x, y):
+            return Contact(GROUND, x, y, -1)
+    elif 0 <= int(x) < len(ground) and y >= HEIGHT - ground[int(x)]:
+        return Contact(GROUND, x, y, -1)
+    for index, tank in enumerate(tanks):
+        left, right, top, bottom = tank_box(tank)
+        if left < x < right and top < y < bottom:
+            return Contact(TANK, x, y, index)
+    return None
+
+
+# Function to find where a segment first goes into the ground
+def ground_contact(x0, y0, x1, y1, ground):
+    """Return ``(t, x, y)`` of the first contact along the segment, or None.
+
+    ``t`` runs from 0 at (x0, y0) to 1 at (x1, y1). Column ``c`` covers
+    x in [c, c + 1) and is solid from ``HEIGHT - ground[c]`` down.
+    """
+    columns = len(ground)
+    dx = x1 - x0
+    dy = y1 - y0
+    first = math.floor(x0)
+    last = math.floor(x1)
+    step = 1 if last >= first else -1
+    if step == 1:
+        first, last = max(first, 0), min(last, columns - 1)
+    else:
+        first, last = min(first, columns - 1), max(last, 0)
+    if (last - first) * step < 0:
+        return None  # The whole segment is outside the world
+    # Most of a flight is far above the ground; rule that out in one pass
+    if max(y0, y1) < HEIGHT - max(ground[min(first, last):max(first, last)
+                                         + 1]):
+        return None
+
+    for column in range(first, last + step, step):
+        # Part of the segment that lies in this column
+        if dx:
+            enter = (column - x0) / dx
+            leave = (column + 1 - x0) / dx
+            if enter > leave:
+                enter, leave = leave, enter
+            enter = max(enter, 0.0)
+            leave = min(leave, 1.0)
+        else:
+            enter, leave = 0.0, 1.0
+        surface = HEIGHT - ground[column]
+        enter_y = y0 + enter * dy
+        if enter_y >= surface:
+            return enter, x0 + enter * dx, enter_y
+        if y0 + leave * dy >= surface:
+            t = (surface - y0) / dy  # dy > 0: the shell is coming down
+            return t, x0 + t * dx, surface
+    return None
+
+
+# Function to find where a segment first enters a box
+def box_contact(x0, y0, x1, y1, box):
+    """Return the ``t`` where the segment enters ``box``, or None.
+
+    A segment that starts inside the box (a shell leaving its own tank)
+    only counts if it also ends inside, as with the end-point test.
+    """
+    left, right, top, bottom = box
+    if left < x0 < right and top < y0 < bottom:
+        return 1.0 if left < x1 < right and top < y1 < bottom else None
+
+    enter, leave = 0.0, 1.0
+    for start, delta, low, high in ((x0, x1 - x0, left, right),
+                                    (y0, y1 - y0, top, bottom)):
+        if delta:
+            near = (low - start) / delta
+            far = (high - start) / delta
+            if near > far:
+                near, far = far, near
+            enter = max(enter, near)
+            leave = min(leave, far)
+            if enter > leave:
+                return None
+        elif not low < start < high:
+            return None
+    return enter
+
+
+# Function to find the first thing a shell touched during one tick
+def first_contact(x0, y0, x1, y1, ground, tanks, mask=None):
+    """Return the earliest Contact along the segment, or None.
+
+    On a tie the ground wins, as it is tested first in the game loop.
+    """
+    best = None
+    if mask is not None:
+        hit = mask.segment_contact(x0, y0, x1, y1)
+    else:
+        hit = ground_contact(x0, y0, x1, y1, ground)
+    if hit is not None:
+        t, x, y = hit
+        best = (t, Contact(GROUND, x, y, -1))
+    for index, tank in enumerate(tanks):
+        t = box_contact(x0, y0, x1, y1, tank_box(tank))
+        if t is not None and (best is None or t < best[0]):
+            best = (t, Contact(TANK, x0 + t * (x1 - x0), y0 + t * (y1 - y0),
+                               index))
+    return best[1] if best else None
+
+
+# Function to generate terrain with multiple peaks
+def generate_terrain(width, rng=random):
+    # Cosine-interpolated peaks, smoothed; see tanks.terrain. Worlds wider
+    # than the screen get as many peaks per screen as the classic map.
+    peak_count = None
+    if width > WIDTH:
+        peak_count = max(3, rng.randint(3, 6) * width // WIDTH)
+    return generate_heightmap(width, rng, peak_count).tolist()
+
+
+# Function to smooth the ground
+def smooth_ground(ground, smoothing_passes=1):
+    return smooth_heights(ground, smoothing_passes).tolist()
+
+
+# Function to dig a crater where a projectile landed
+def dig_crater(ground, x, crater_radius=CRATER_RADIUS):
+    """Lower the ground around ``x`` and return the range of columns touched."""
+    start = max(0, int(x) - crater_radius)
+    end = min(len(ground), int(x) + crater_radius)
+    for i in range(start, end):
+        distance = abs(i - x)
+        if distance <= crater_radius:
+            depth = ((crater_radius - distance) ** 0.5) * 5
+            ground[i] = max(0, ground[i] - int(depth))
+    return range(start, end)
+
+
+# Function to get the health a fall of some pixels costs
+def fall_damage(drop):
+    if drop <= FALL_SAFE_DROP:
+        return 0
+    return 1 + int((drop - FALL_SAFE_DROP) // FALL_DAMAGE_DROP)
+
+
+# Function to refuse a world too narrow to place the tanks apart in
+def check_width(width):
+    if width < MIN_WIDTH:
+        raise ValueError(f"world width {width} is less than {MIN_WIDTH}")
+
+
+# Function to place the two tanks in a world of a given width
+def spawn_positions(width):
+    # 100 and 700 on the classic 800-pixel map
+    center = width // 2
+    half = min(MAX_TANK_SPACING, width - 200) // 2
+    return center - half, center + half
+
+
+# Function to pick a fresh 64-bit seed for a match
+def new_seed():
+    return random.SystemRandom().getrandbits(64)
+
+
+# Function to pick the wind at the start of a match
+def initial_wind(difficulty, rng=random):
+    if difficulty == "easy":
+        return 0  # No wind
+    elif difficulty == "medium":
+        return rng.uniform(-1, 1)  # Weak wind
+    else:
+        return rng.uniform(-2, 2)  # Strong wind
+
+
+# Function to pick the wind after a turn has ended
+def next_wind(difficulty, turn_counter, wind, rng=random):
+    if difficulty == "easy":
+        return 0  # Wind remains zero
+    elif turn_counter % 3 == 0:
+        return initial_wind(difficulty, rng)  # Wind changes every third turn
+    return wind
+
+
+# Match class: the full state of one game between two tanks
+class Match:
+    def __init__(self, difficulty="medium", ground=None, swept=True,
+                 seed=None, width=WIDTH, bitmap=False, settling=False):
+        # Imported here because tanks.projectiles builds on
+        # tanks.trajectory, which imports this module
+        from tanks.projectiles import GroundIndex, ProjectilePool
+
+        check_width(len(ground) if ground is not None else width)
+
+        self.difficulty = difficulty
+        # Test the whole path of a shell each tick, not just where it ends
+        self.swept = swept
+        # Terrain and wind come only from this RNG, so the seed and the
+        # inputs of every tick are enough to play the match again
+        self.seed = seed if seed is not None else new_seed()
+        self.rng = random.Random(self.seed)
+        self.ground = ground if ground is not None \
+            else generate_terrain(width, self.rng)
+        # The world is as wide as its ground; it may be wider than the screen
+        self.width = len(self.ground)
+        # Bitmap terrain: the mask is the ground and craters are round, so
+        # they can undercut it. self.ground then follows the top surface,
+        # for the AI and anything else that reads a heightmap.
+        self.mask = TerrainMask.from_heights(self.ground, HEIGHT) \
+            if bitmap else None
+        # NumPy copy of the heightmap and its range maxima, kept up to date
+        # for testing many shells at once and for the AI's searches
+        self.ground_index = GroundIndex(self.ground)
+        # Settling: ground around craters slides and falls over the next
+        # ticks, and tanks fall with it instead of snapping down
+        self.settler = None
+        if settling:
+            self.settler = MaskSettling(self.mask) if bitmap \
+                else HeightmapSettling(self.ground)
+        self.tanks = [Tank(x, color) for x, color
+                      in zip(spawn_positions(self.width), (RED, BLUE))]
+        self.current_tank = self.tanks[0]
+        self.weapons = WEAPONS
+        self.shells = ProjectilePool()  # Every shell in flight
+        self.wind = initial_wind(difficulty, self.rng)
+        self.turn_counter = 0
+        self.shot_fired = False
+        self.winner = None
+        self.place_tanks()
+
+    @property
+    def other_tank(self):
+        return self.tanks[1] if self.current_tank is self.tanks[0] \
+            else self.tanks[0]
+
+    def surface_under(self, tank):
+        if self.mask is not None:
+            # The first ground under the tank; it falls into anything dug
+            # out beneath it
+            return self.mask.surface_below(int(tank.x), tank.y)
+        return HEIGHT - self.ground[int(tank.x)]
+
+    def place_tanks(self):
+        # Update tanks' positions based on ground height
+        for tank in self.tanks:
+            tank.y = self.surface_under(tank)
+
+    def is_settling(self):
+        # Whether ground is still sliding or a tank still falling; nothing
+        # moves once the match is won
+        return self.settler is not None and self.winner is None and (
+            self.settler.active
+            or any(tank.fall_from is not None for tank in self.tanks))
+
+    def changed_ground(self, columns):
+        # Bring the mask's heightmap and the heightmap index up to date
+        if self.mask is not None:
+            self.ground[columns.start:columns.stop] = \
+                self.mask.heights(columns.start, columns.stop).tolist()
+        self.ground_index.mark(columns)
+
+    def dig(self, x, y, radius=CRATER_RADIUS):
+        # Make a crater and return the range of columns that changed
+        if self.mask is None:
+            columns = dig_crater(self.ground, x, radius)
+        else:
+            columns = self.mask.carve(x, y, radius)
+        self.changed_ground(columns)
+        if self.settler is not None:
+            self.settler.mark(columns)
+        return columns
+
+    def settle(self):
+        """Let the ground and the tanks settle for one tick.
+
+        Returns the events: "settle" with each run of columns that moved,
+        and "fall" for a tank that landed hard enough to be hurt.
+        """
+        events = []
+        for columns in self.settler.step():
+            self.changed_ground(columns)
+            events.append(Event("settle", columns=columns))
+
+        for tank in self.tanks:
+            surface = self.surface_under(tank)
+            if tank.y < surface:
+                # Fall under gravity, from where the tank started to fall
+                if tank.fall_from is None:
+                    tank.fall_from = tank.y
+                tank.fall_speed += GRAVITY
+                tank.y = min(surface, tank.y + tank.fall_speed)
+                if tank.y < surface:
+                    continue
+            tank.y = surface  # Ground that slid under a tank lifts it
+            if tank.fall_from is None:
+                continue
+            damage = fall_damage(tank.y - tank.fall_from)
+            tank.fall_from = None
+            tank.fall_speed = 0
+            if damage:
+                tank.health -= damage
+                events.append(Event("fall", tank.x, tank.y, tank))
+                if tank.health <= 0 and self.winner is None:
+                    self.winner = self.tanks[1] if tank is self.tanks[0] \
+                        else self.tanks[0]
+                    self.shells.clear()
+                    events.append(Event("game_over", tank=self.winner))
+        return events
+
+    def is_idle(self):
+        # Whether a tick with no input would change nothing: no shell in
+        # flight, no turn about to end and nothing settling
+        return not self.shells and not self.shot_fired \
+            and not self.is_settling()
+
+    def can_fire(self):
+        return (self.winner is None and not self.shot_fired
+                and not self.shells)
+
+    def fire(self):
+        """Let the current tank fire its weapon.
+
+        Returns the slots of the new shells in ``shells``, or None.
+        """
+        if not self.can_fire():
+            return None
+        tank = self.current_tank
+        weapon = self.weapons[tank.weapon]
+        angles = [tank.angle]
+        if weapon.shells > 1:
+            angles = [tank.angle + weapon.spread * (i / (weapon.shells - 1)
+                                                   - 0.5)
+                      for i in range(weapon.shells)]
+        # Each shell leaves the cannon like Tank.shoot
+        velocity_x = [math.cos(math.radians(angle)) * tank.power
+                      for angle in angles]
+        velocity_y = [-math.sin(math.radians(angle)) * tank.power
+                      for angle in angles]
+        self.shot_fired = True
+        return self.shells.spawn(tank.x, tank.y - 10, velocity_x, velocity_y,
+                                 weapon.crater, weapon.split,
+                                 weapon.fragments,
+                                 weapon.fragment_crater).tolist()
+
+    def end_turn(self):
+        self.current_tank = self.other_tank
+        self.turn_counter += 1
+        self.shells.clear()
+        self.shot_fired = False
+
+        previous_wind = self.wind  # Store the previous wind value
+        self.wind = next_wind(self.difficulty, self.turn_counter, self.wind,
+                              self.rng)
+
+        events = [Event("turn_end", tank=self.current_tank)]
+        if self.wind != previous_wind:
+            events.append(Event("wind_change"))
+        return events
+
+    def tick(self, controls=NO_INPUT):
+        """Advance one fixed tick: the shells first, then the player's input.
+
+        This is the order the game loop has always used, so a tick is one
+        frame of the original 60 FPS game.
+        """
+        events = self.update()
+        events.extend(self.control(controls))
+        return events
+
+    def control(self, controls):
+        """Apply the current player's input: the second half of a tick.
+
+        Network play runs ``update`` first to learn whose turn the tick is,
+        then waits for that player's input before calling this.
+        """
+        events = []
+        if controls.weapon:
+            self.current_tank.next_weapon(len(self.weapons))
+        if controls.fire and self.fire():
+            events.append(Event("shot", tank=self.current_tank))
+        if controls.aim:
+            self.current_tank.aim(controls.aim)
+        if controls.power:
+            self.current_tank.change_power(controls.power)
+        return events
+
+    def resolve_shot(self, max_ticks=10000):
+        """Step the shells in flight until they land, as fast as possible.
+
+        With settling, also until the ground and tanks have come to rest.
+        """
+        events = []
+        for _ in range(max_ticks):
+            if not self.shells and not self.is_settling():
+                break
+            events.extend(self.update())
+        return events
+
+    def move_shells(self):
+        """Move every shell one tick and find what each one touched.
+
+        Returns (finished, apex): (slot, outcome, tank, x, y) of every shell
+        that stopped, in slot order, and the slots of MIRVs that have begun
+        to fall. Up to SCALAR_SHELLS shells are moved and tested one by one
+        with plain floats, which costs a lone shell a fraction of the
+        batched pass; more go through ProjectilePool in one pass. Both do
+        the same arithmetic, so they give the same results.
+        """
+        shells = self.shells
+        finished = []
+        if len(shells) <= SCALAR_SHELLS:
+            apex = []
+            for slot in sorted(shells.in_flight):
+                start_x, start_y, x, y, velocity_y = shells.move(slot,
+                                                                 self.wind)
+                if self.swept:
+                    contact = first_contact(start_x, start_y, x, y,
+                                            self.ground, self.tanks,
+                                            self.mask)
+                else:
+                    contact = point_contact(x, y, self.ground, self.tanks,
+                                            self.mask)
+                if contact is not None:
+                    finished.append((slot, contact.outcome, contact.tank,
+                                     contact.x, contact.y))
+                elif x < 0 or x > self.width or y > HEIGHT:
+                    finished.append((slot, OFF_SCREEN, -1, x, y))
+                elif velocity_y >= 0 and shells.split[slot] == SPLIT_AT_APEX:
+                    apex.append(slot)
+            return finished, apex
+
+        # Move every shell, then test all their paths in one pass
+        slots = shells.step(self.wind)
+        outcome, hit, stop_x, stop_y = shells.contacts(
+            slots, self.tanks, self.width,
+            self.ground_index if self.mask is None else None, self.mask,
+            self.swept)
+        done = np.flatnonzero(outcome != FLYING)
+        finished = list(zip(slots[done].tolist(), outcome[done].tolist(),
+                            hit[done].tolist(), stop_x[done].tolist(),
+                            stop_y[done].tolist()))
+        apex = slots[(outcome == FLYING)
+                     & (shells.split[slots] == SPLIT_AT_APEX)
+                     & (shells.velocity_y[slots] >= 0)].tolist()
+        return finished, apex
+
+    def update(self):
+        """Advance the match by one frame and return the events it produced."""
+        events = []
+        if self.winner is not None:
+            return events
+
+        shells = self.shells
+        if shells:
+            finished, apex = self.move_shells()
+
+            # Free the shells that stopped. Their slots can be reused by
+            # fragments below, so read what they do first.
+            if finished:
+                done = [slot for slot, _, _, _, _ in finished]
+                craters = shells.crater[done].tolist()
+                splits = shells.split[done].tolist()
+                fragments = shells.fragments[done].tolist()
+                fragment_craters = shells.fragment_crater[done].tolist()
+                shells.kill(done)
+
+            dug = False
+            for i, (_, outcome, hit, x, y) in enumerate(finished):
+                # Check if the shell hits the ground
+                if outcome == GROUND:
+                    columns = self.dig(x, y, craters[i])
+                    events.append(Event("crater", x, y, columns=columns))
+                    dug = True
+                    if splits[i] == SPLIT_ON_IMPACT:
+                        # Bomblets scatter upwards from the crater
+                        angles = [math.radians(self.rng.uniform(
+                            *CLUSTER_ANGLES)) for _ in range(fragments[i])]
+                        speeds = [self.rng.uniform(*CLUSTER_SPEEDS)
+                                  for _ in range(fragments[i])]
+                        shells.spawn(x, y, [math.cos(angle) * speed for
+                                            angle, speed in zip(angles,
+                                                                speeds)],
+                                     [-math.sin(angle) * speed for
+                                      angle, speed in zip(angles, speeds)],
+                                     fragment_craters[i])
+                        events.append(Event("split", x, y))
+
+                # Check if either tank is hit
+                elif outcome == TANK:
+                    hit_tank = self.tanks[hit]
+                    hit_tank.health -= 1
+                    events.append(Event("hit", x, y, hit_tank))
+                    if hit_tank.health <= 0:
+                        self.winner = self.tanks[1] \
+                            if hit_tank is self.tanks[0] else self.tanks[0]
+                        shells.clear()
+                        events.append(Event("game_over", tank=self.winner))
+                        return events
+            if dug and self.settler is None:
+                self.place_tanks()
+
+            # MIRVs burst into warheads once they start to fall
+            if apex:
+                bursts = list(zip(shells.x[apex].tolist(),
+                                  shells.y[apex].tolist(),
+                                  shells.velocity_x[apex].tolist(),
+                                  shells.velocity_y[apex].tolist(),
+                                  shells.fragments[apex].tolist(),
+                                  shells.fragment_crater[apex].tolist()))
+                shells.kill(apex)
+                for x, y, velocity_x, velocity_y, count, crater in bursts:
+                    spread = MIRV_SPREAD * (np.arange(count)
+                                            - (count - 1) / 2)
+                    shells.spawn(x, y, velocity_x + spread, velocity_y,
+                                 crater)
+                    events.append(Event("split", x, y))
+
+        if self.settler is not None:
+            events.extend(self.settle())
+            if self.winner is not None:
+                return events
+
+        # The turn ends once every shell fired has landed or left the world,
+        # and with settling once the ground and tanks are at rest
+        if self.shot_fired and not shells and not self.is_settling():
+            events.extend(self.end_turn())
+
+        return events
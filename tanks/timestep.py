@@ -0,0 +1,44 @@
+"""Fixed-timestep clock for running the simulation independent of frame rate.
+
+The game rules advance in constant ticks of ``1 / TICK_RATE`` seconds, no
+matter how fast frames are drawn. ``FixedTimestep.advance`` takes the real
+time that passed since the last frame, scales it by ``time_scale`` and says
+how many ticks to run; ``alpha`` is how far the renderer is between the
+last two ticks, for interpolating positions.
+"""
+
+# Simulation ticks per second; the physics constants are tuned for 60
+TICK_RATE = 60
+TICK = 1 / TICK_RATE
+
+
+# Fixed timestep class
+class FixedTimestep:
+    def __init__(self, tick_rate=TICK_RATE, time_scale=1.0,
+                 max_ticks_per_frame=30):
+        self.tick = 1 / tick_rate
+        self.time_scale = time_scale  # 2.0 runs the game twice as fast
+        # After a long stall, drop time instead of trying to catch up forever
+        self.max_ticks_per_frame = max_ticks_per_frame
+        self.accumulator = 0.0
+
+    def reset(self):
+        # Forget time that passed while the game was not running
+        self.accumulator = 0.0
+
+    def advance(self, elapsed):
+        """Add ``elapsed`` real seconds and return the ticks to run now."""
+        self.accumulator += elapsed * self.time_scale
+        ticks = int(self.accumulator / self.tick)
+        limit = self.max_ticks_per_frame * max(1.0, self.time_scale)
+        if ticks > limit:
+            ticks = int(limit)
+            self.accumulator = 0.0
+        else:
+            self.accumulator -= ticks * self.tick
+        return ticks
+
+    @property
+    def alpha(self):
+        # Fraction of a tick since the last one, from 0 up to (not) 1
+        return min(1.0, self.accumulator / self.tick)
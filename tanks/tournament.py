@@ -0,0 +1,508 @@
+"""Headless tournaments between computer players, with Elo and Glicko ratings.
+
+Every player is a ``ComputerPlayer`` variant, given on the command line as
+``skill[:budget]``: ``hard`` aims like the hard computer opponent, and
+``hard:1`` does too but stops thinking after 1 ms a turn. Without a budget
+the shot search runs to its end, which takes a few milliseconds and does
+not depend on how busy the machine is, so a game is decided by its seed
+alone; players with a budget play better or worse with the load.
+Matches are played headless at full speed by ``play_game``: the computer
+sets its cannon and fires at once with ``ComputerPlayer.take_turn`` and
+``Match.resolve_shot`` flies the shells, so a match takes a few
+milliseconds of CPU per turn, and nothing waits for a frame.
+
+Games run in a pool of worker processes, one game per task, so they scale
+with the cores: a game needs only its players and a seed, and sends back a
+small dict. A round robin schedules every game at once; a Swiss tournament
+pairs each round by the standings after the last one. Results come back in
+any order, but are applied to the ratings in schedule order, so the
+ratings do not depend on which worker finished first.
+
+With ``--log``, every result is appended to a JSON Lines file as soon as it
+arrives, after a header that describes the tournament. If the run is
+stopped or crashes, ``--resume`` with the same arguments and log plays only
+the games that are missing. Without budgets, it ends with the same ratings
+as a run that was never interrupted.
+
+Run ``python -m tanks.tournament easy medium hard hard:1`` to rate some
+players against each other.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from tanks.ai import AI_SKILLS, THINK_BUDGET, ComputerPlayer
+from tanks.replay import DIFFICULTIES
+from tanks.simulation import MIN_WIDTH, WIDTH, Match
+
+FORMAT_VERSION = 1
+ROUND_ROBIN = "round-robin"
+SWISS = "swiss"
+
+# A match still undecided after this many turns is a draw
+DEFAULT_MAX_TURNS = 100
+
+# Everyone starts at the same rating; Elo moves it by up to ELO_K a game
+START_RATING = 1500
+ELO_K = 16
+# Glicko-1: the deviation of a new player, and how much it grows for every
+# rating period (round) a player sits out, back to the start in about 100
+GLICKO_START_DEVIATION = 350
+GLICKO_GROWTH = 34.6
+_Q = math.log(10) / 400
+
+# A computer player: skill is a key of AI_SKILLS, budget seconds per turn
+# to think, or math.inf to search to the end
+Player = namedtuple("Player", ["name", "skill", "budget"])
+
+# One game to play; red moves first
+Game = namedtuple("Game", ["id", "round", "red", "blue", "seed"])
+
+# The rules every game of a tournament is played by
+Settings = namedtuple("Settings", ["difficulty", "width", "bitmap",
+                                   "settling", "max_turns"],
+                      defaults=("medium", WIDTH, False, False,
+                                DEFAULT_MAX_TURNS))
+
+
+# Class for a log that does not belong to the tournament being resumed
+class LogError(ValueError):
+    pass
+
+
+# Function to read a player from the command line, like "hard" or "hard:1"
+def parse_player(spec):
+    skill, _, budget = spec.partition(":")
+    if skill not in AI_SKILLS:
+        raise ValueError(f"unknown skill {skill!r} in {spec!r}; choose from "
+                         f"{', '.join(AI_SKILLS)}")
+    try:
+        budget = float(budget) / 1000 if budget else math.inf
+    except ValueError:
+        raise ValueError(f"budget in {spec!r} is not a number of ms") \
+            from None
+    return Player(spec, skill, budget)
+
+
+# Function to play one game to the end; runs in a worker process
+def play_game(game, red, blue, settings):
+    """Return the result of a game as a dict, ready for JSON."""
+    start = time.perf_counter()
+    match = Match(settings.difficulty, seed=game.seed, width=settings.width,
+                  bitmap=settings.bitmap, settling=settings.settling)
+    rng = random.Random(game.seed)  # Aim errors, so a seed replays alike
+    players = [ComputerPlayer(match, tank, player.skill, rng, player.budget)
+               for tank, player in zip(match.tanks, (red, blue))]
+    for _ in range(settings.max_turns):
+        if match.winner is not None:
+            break
+        players[match.tanks.index(match.current_tank)].take_turn()
+        match.resolve_shot()
+
+    winner = None
+    if match.winner is not None:
+        winner = "red" if match.winner is match.tanks[0] else "blue"
+    return {"game": game.id, "round": game.round, "red": red.name,
+            "blue": blue.name, "seed": game.seed, "winner": winner,
+            "turns": match.turn_counter,
+            "health": [tank.health for tank in match.tanks],
+            "seconds": round(time.perf_counter() - start, 4)}
+
+
+# Function to get the seed of a game from the tournament's seed
+def game_seed(seed, game_id):
+    return random.Random(f"{seed}/{game_id}").getrandbits(64)
+
+
+# Function to pair everyone with everyone once, in rounds (circle method)
+def round_robin(names):
+    """Return a list of rounds, each a list of (a, b) pairs."""
+    circle = list(names) + ([None] if len(names) % 2 else [])
+    rounds = []
+    for round_index in range(len(circle) - 1):
+        pairs = []
+        for i in range(len(circle) // 2):
+            a, b = circle[i], circle[-1 - i]
+            if a is not None and b is not None:
+                # Alternate who is listed first, which plays red first
+                pairs.append((a, b) if (round_index + i) % 2 else (b, a))
+        rounds.append(pairs)
+        circle.insert(1, circle.pop())
+    return rounds
+
+
+# Elo ratings class, updated after every game
+class EloRatings:
+    def __init__(self, k=ELO_K):
+        self.k = k
+        self.ratings = {}
+
+    def rating(self, name):
+        return self.ratings.get(name, START_RATING)
+
+    def expected(self, a, b):
+        # a's expected score against b
+        return 1 / (1 + 10 ** ((self.rating(b) - self.rating(a)) / 400))
+
+    def update(self, a, b, score):
+        change = self.k * (score - self.expected(a, b))
+        self.ratings[a] = self.rating(a) + change
+        self.ratings[b] = self.rating(b) - change
+
+
+# Glicko ratings class: a rating and its deviation, updated from all the
+# games of a rating period at once
+class GlickoRatings:
+    def __init__(self):
+        self.ratings = {}  # Name -> (rating, deviation)
+        self.period = []  # (a, b, a's score) since the period began
+
+    def rating(self, name):
+        return self.ratings.get(name, (START_RATING, GLICKO_START_DEVIATION))
+
+    def add(self, a, b, score):
+        self.period.append((a, b, score))
+
+    def end_period(self, names):
+        """Update everyone in names from the games of the period (Glicko-1)."""
+        # Uncertainty grows with time, whether or not a player played
+        start = {}
+        for name in names:
+            rating, deviation = self.rating(name)
+            start[name] = (rating, min(math.hypot(deviation, GLICKO_GROWTH),
+                                       GLICKO_START_DEVIATION))
+        games = {name: [] for name in names}
+        for a, b, score in self.period:
+            games[a].append((b, score))
+            games[b].append((a, 1 - score))
+
+        for name in names:
+            rating, deviation = start[name]
+            if games[name]:
+                information = delta = 0.0
+                for opponent, score in games[name]:
+                    opponent_rating, opponent_deviation = start[opponent]
+                    g = 1 / math.sqrt(1 + 3 * (_Q * opponent_deviation) ** 2
+                                      / math.pi ** 2)
+                    expected = 1 / (1 + 10 ** (-g * (rating - opponent_rating)
+                                               / 400))
+                    information += _Q ** 2 * g ** 2 * expected \
+                        * (1 - expected)
+                    delta += g * (score - expected)
+                precision = 1 / deviation ** 2 + information
+                rating += _Q / precision * delta
+                deviation = math.sqrt(1 / precision)
+            self.ratings[name] = (rating, deviation)
+        self.period = []
+
+
+# Tournament class: the schedule, the results and the standings
+class Tournament:
+    def __init__(self, players, settings=Settings(), style=ROUND_ROBIN,
+                 games=2, rounds=None, seed=0):
+        self.players = {player.name: player for player in players}
+        self.names = list(self.players)
+        self.settings = settings
+        self.style = style
+        self.games = games  # Per pairing and round; colours alternate
+        self.seed = seed
+        if style == ROUND_ROBIN:
+            self.pairings = round_robin(self.names)
+            self.rounds = len(self.pairings)
+        else:
+            self.pairings = None
+            # Enough rounds to separate everyone, by default
+            self.rounds = rounds or max(1, math.ceil(math.log2(
+                len(self.names)))) + 1
+        self.schedule = []  # Games of every round scheduled so far
+        self.results = {}  # Game id -> result, applied or not yet
+        self.next_game = (0, 0)  # (round, index) of the next to apply
+        self.elo = EloRatings()
+        self.glicko = GlickoRatings()
+        self.points = dict.fromkeys(self.names, 0.0)
+        self.record = {name: [0, 0, 0] for name in self.names}  # W, D, L
+        self.met = set()  # Pairs that have played, for Swiss pairing
+        self.byes = set()  # Who sat out a Swiss round
+
+    def header(self):
+        # What the log starts with; a resumed log must match it
+        return {"tournament": FORMAT_VERSION,
+                "players": self.names, "style": self.style,
+                "games": self.games, "rounds": self.rounds,
+                "seed": self.seed, "settings": self.settings._asdict()}
+
+    def can_schedule(self):
+        # A round robin is known up front; a Swiss round waits for the
+        # last one to be applied
+        return len(self.schedule) < self.rounds and (
+            self.style == ROUND_ROBIN
+            or self.next_game[0] == len(self.schedule))
+
+    def schedule_round(self):
+        round_index = len(self.schedule)
+        if self.style == ROUND_ROBIN:
+            pairs = self.pairings[round_index]
+        else:
+            pairs = self.swiss_pairs()
+        games = []
+        for pair_index, (a, b) in enumerate(pairs):
+            self.met.add(frozenset((a, b)))
+            for n in range(self.games):
+                red, blue = (a, b) if n % 2 == 0 else (b, a)
+                game_id = f"{round_index}-{pair_index}-{n}"
+                games.append(Game(game_id, round_index, red, blue,
+                                  game_seed(self.seed, game_id)))
+        self.schedule.append(games)
+        return games
+
+    def swiss_pairs(self):
+        # Best against best, avoiding rematches where possible; with an odd
+        # number the lowest placed who has not sat out yet gets a bye
+        order = sorted(self.names, key=lambda name: (
+            -self.points[name], -self.elo.rating(name),
+            self.names.index(name)))
+        if len(order) % 2:
+            bye = next((name for name in reversed(order)
+                        if name not in self.byes), order[-1])
+            order.remove(bye)
+            self.byes.add(bye)
+            self.points[bye] += 1
+        pairs = []
+        while order:
+            a = order.pop(0)
+            b = next((name for name in order
+                      if frozenset((a, name)) not in self.met), order[0])
+            order.remove(b)
+            pairs.append((a, b))
+        return pairs
+
+    def add_result(self, result):
+        """Store a result and apply every result now due, in schedule
+        order. Returns the rounds this completed."""
+        self.results[result["game"]] = result
+        finished = []
+        round_index, index = self.next_game
+        while round_index < len(self.schedule):
+            games = self.schedule[round_index]
+            if index == len(games):
+                self.glicko.end_period(self.names)
+                finished.append(round_index)
+                round_index, index = round_index + 1, 0
+                continue
+            result = self.results.get(games[index].id)
+            if result is None:
+                break
+            self.apply(games[index], result)
+            index += 1
+        self.next_game = (round_index, index)
+        return finished
+
+    def apply(self, game, result):
+        if (result["red"], result["blue"]) != (game.red, game.blue):
+            raise LogError(f"game {game.id} was {result['red']} against "
+                           f"{result['blue']} in the log, not {game.red} "
+                           f"against {game.blue}")
+        score = {"red": 1.0, "blue": 0.0, None: 0.5}[result["winner"]]
+        self.elo.update(game.red, game.blue, score)
+        self.glicko.add(game.red, game.blue, score)
+        self.points[game.red] += score
+        self.points[game.blue] += 1 - score
+        for name, own in ((game.red, score), (game.blue, 1 - score)):
+            self.record[name][0 if own == 1 else 1 if own == 0.5 else 2] += 1
+
+    @property
+    def finished(self):
+        return self.next_game[0] >= self.rounds
+
+    def standings(self):
+        """Return (name, games, wins, draws, losses, points, Elo, Glicko
+        rating, Glicko deviation) rows, best first."""
+        rows = []
+        for name in self.names:
+            wins, draws, losses = self.record[name]
+            rating, deviation = self.glicko.rating(name)
+            rows.append((name, wins + draws + losses, wins, draws, losses,
+                         self.points[name], self.elo.rating(name), rating,
+                         deviation))
+        return sorted(rows, key=lambda row: -row[7])
+
+
+# Function to read the results logged so far, checking they belong here
+def load_log(path, tournament):
+    """Return the logged results in the order they were written.
+
+    A last line cut short by a crash is ignored, and cut from the file, so
+    the results that follow start on a line of their own.
+    """
+    with open(path, "rb") as file:
+        data = file.read()
+    complete = data[:data.rfind(b"\n") + 1]
+    lines = complete.decode().splitlines()
+    if not lines:
+        return []
+    try:
+        if json.loads(lines[0]) != tournament.header():
+            raise LogError(f"{path} is the log of a different tournament")
+        results = [json.loads(line) for line in lines[1:]]
+    except json.JSONDecodeError as e:
+        raise LogError(f"{path} is not a tournament log: {e}") from None
+    if len(complete) < len(data):
+        with open(path, "rb+") as file:
+            file.truncate(len(complete))
+    return results
+
+
+# Function to play a tournament in a process pool
+def run_tournament(tournament, workers=None, log_path=None, resume=False,
+                   report=print):
+    """Play every game not already in the log and return the tournament.
+
+    ``report`` is called with a line of progress after every round.
+    """
+    logged = load_log(log_path, tournament) \
+        if resume and log_path and os.path.exists(log_path) else []
+    logged = {result["game"]: result for result in logged}
+    log = None
+    if log_path:
+        log = open(log_path, "a" if logged else "w")
+        if not logged:
+            write_line(log, tournament.header())
+
+    start = time.perf_counter()
+    played = turns = 0
+    pool = ProcessPoolExecutor(workers)
+    try:
+        running = {}
+        while not tournament.finished:
+            while tournament.can_schedule():
+                players = tournament.players
+                for game in tournament.schedule_round():
+                    if game.id in logged:
+                        # Played before the restart; counts right away
+                        finish_round(tournament, logged[game.id], report,
+                                     start, played, turns)
+                    else:
+                        running[pool.submit(
+                            play_game, game, players[game.red],
+                            players[game.blue], tournament.settings)] = game
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                running.pop(future)
+                result = future.result()
+                if log is not None:
+                    write_line(log, result)
+                played += 1
+                turns += result["turns"]
+                finish_round(tournament, result, report, start, played,
+                             turns)
+    finally:
+        pool.shutdown(cancel_futures=True)
+        if log is not None:
+            log.close()
+    return tournament
+
+
+# Function to add a result and report any rounds it completed
+def finish_round(tournament, result, report, start, played, turns):
+    for round_index in tournament.add_result(result):
+        elapsed = time.perf_counter() - start
+        rate = played / elapsed if elapsed else 0.0
+        report(f"round {round_index + 1}/{tournament.rounds} done: "
+               f"{played} games played, {turns} turns, {rate:.1f} games/s")
+
+
+# Function to append one JSON line and make sure it is on disk
+def write_line(file, data):
+    file.write(json.dumps(data) + "\n")
+    file.flush()
+    os.fsync(file.fileno())
+
+
+# Function to format the standings as a table
+def format_standings(tournament):
+    lines = [f"{'player':<16} {'games':>5} {'W-D-L':>11} {'points':>7} "
+             f"{'Elo':>6} {'Glicko':>13}"]
+    for (name, games, wins, draws, losses, points, elo, rating,
+         deviation) in tournament.standings():
+        lines.append(f"{name:<16} {games:>5} "
+                     f"{f'{wins}-{draws}-{losses}':>11} {points:>7.1f} "
+                     f"{elo:>6.0f} {rating:>6.0f} ±{2 * deviation:>4.0f}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Play computer players against each other headless, "
+                    "in parallel, and rate them.")
+    parser.add_argument("players", nargs="+",
+                        help="players as skill[:budget in ms], e.g. hard "
+                             f"or medium:{THINK_BUDGET * 1000:g} to think "
+                             "as long as in the game; with no budget the "
+                             "search runs to its end")
+    parser.add_argument("--format", choices=(ROUND_ROBIN, SWISS),
+                        default=ROUND_ROBIN)
+    parser.add_argument("--games", type=int, default=2,
+                        help="games per pairing and round, alternating "
+                             "who moves first")
+    parser.add_argument("--rounds", type=int,
+                        help="rounds of a Swiss tournament")
+    parser.add_argument("--workers", type=int,
+                        help="worker processes; one per CPU by default")
+    parser.add_argument("--difficulty", choices=DIFFICULTIES,
+                        default="medium", help="wind strength")
+    parser.add_argument("--world-width", type=int, default=WIDTH)
+    parser.add_argument("--bitmap-terrain", action="store_true")
+    parser.add_argument("--settling", action="store_true")
+    parser.add_argument("--max-turns", type=int, default=DEFAULT_MAX_TURNS,
+                        help="turns after which a game is a draw")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="seed for the terrain and aim of every game")
+    parser.add_argument("--log", help="append every result to this JSON "
+                                      "Lines file as it arrives")
+    parser.add_argument("--resume", action="store_true",
+                        help="play only the games not yet in --log")
+    args = parser.parse_args(argv)
+    if len(set(args.players)) != len(args.players):
+        parser.error("every player must be different")
+    if len(args.players) < 2:
+        parser.error("a tournament needs at least two players")
+    if args.resume and not args.log:
+        parser.error("--resume needs --log")
+    if args.world_width < MIN_WIDTH:
+        parser.error(f"--world-width must be at least {MIN_WIDTH}")
+    try:
+        players = [parse_player(spec) for spec in args.players]
+    except ValueError as e:
+        parser.error(str(e))
+
+    tournament = Tournament(
+        players, Settings(args.difficulty, args.world_width,
+                          args.bitmap_terrain, args.settling,
+                          args.max_turns),
+        args.format, args.games, args.rounds, args.seed)
+    start = time.perf_counter()
+    try:
+        run_tournament(tournament, args.workers, args.log, args.resume)
+    except LogError as e:
+        return f"error: {e}"
+    except (BrokenProcessPool, KeyboardInterrupt) as e:
+        if args.log:
+            print(f"stopped; the results so far are in {args.log}, run "
+                  f"again with --resume to play the rest", file=sys.stderr)
+        if isinstance(e, KeyboardInterrupt):
+            return 130
+        raise
+    print(f"{len(tournament.results)} games in "
+          f"{time.perf_counter() - start:.1f} s")
+    print(format_standings(tournament))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,513 @@
+"""Batch shell simulation with NumPy.
+
+``simulate_shots`` flies many shells at once under the same rules as
+``Projectile.move`` and ``Match.update``: wind, gravity and drag are applied
+in the same order, the path of each tick is tested against the ground and
+the tanks (or only its end point with ``swept=False``), and a shell that
+leaves the world ends its flight. All shells advance in lockstep, one frame
+per iteration, and finished shells drop out of the working set so the cost
+follows the number of shells still in the air.
+"""
+import math
+from collections import namedtuple
+
+import numpy as np
+
+from tanks.simulation import (
+    GRAVITY,
+    HEIGHT,
+    FLYING,
+    GROUND,
+    OFF_SCREEN,
+    TANK,
+    WIND_RESISTANCE,
+    first_contact,
+    tank_box,
+)
+
+# Shells whose ground test is done at once; bounds the padded column walk
+GROUND_CHUNK = 65536
+
+# Per-shell results of simulate_shots; frame counts Match.update calls
+ShotResults = namedtuple("ShotResults", ["x", "y", "frame", "outcome", "tank"])
+
+
+# Function to turn angles and powers into launch velocities like Tank.shoot
+def launch_velocities(angles, powers):
+    radian_angles = np.radians(np.asarray(angles, dtype=np.float64))
+    powers = np.asarray(powers, dtype=np.float64)
+    return np.cos(radian_angles) * powers, -np.sin(radian_angles) * powers
+
+
+# Function to build range-maximum levels over the heightmap as arrays
+def height_levels(ground):
+    """Return levels[k], the highest ground over each run of 2**k columns."""
+    levels = [ground]
+    span = 1
+    while span * 2 <= len(ground):
+        levels.append(np.maximum(levels[-1][:-span], levels[-1][span:]))
+        span *= 2
+    return levels
+
+
+# Function to find the first ground contact of many segments at once
+def ground_contacts(x0, y0, x1, y1, ground, rows=None):
+    """Vectorized ``ground_contact``: returns (t, x, y) arrays.
+
+    Every segment walks the columns it crosses, padded to the longest walk
+    in the batch, with the same arithmetic as the scalar version so the
+    results are bit-identical. ``t`` is infinite where there is no contact.
+    With ``rows``, ``ground`` holds one heightmap per row and each segment
+    is tested against the row it names.
+    """
+    columns = ground.shape[-1]
+    dx = x1 - x0
+    dy = y1 - y0
+    first = np.floor(x0)
+    last = np.floor(x1)
+    step = np.where(last >= first, 1.0, -1.0)
+    forward = step > 0
+    first = np.where(forward, np.maximum(first, 0), np.minimum(first,
+                                                               columns - 1))
+    last = np.where(forward, np.minimum(last, columns - 1), np.maximum(last,
+                                                                       0))
+    span = (last - first) * step  # Negative when outside the world
+    count = x0.size
+    hit_t = np.full(count, np.inf)
+    hit_x = np.full(count, np.nan)
+    hit_y = np.full(count, np.nan)
+    if not count or span.max() < 0:
+        return hit_t, hit_x, hit_y
+
+    offsets = np.arange(int(span.max()) + 1, dtype=np.float64)
+    column = first[:, None] + step[:, None] * offsets
+    walked = offsets <= span[:, None]
+    index = np.where(walked, column, 0).astype(np.intp)
+    surface = HEIGHT - (ground[index] if rows is None
+                        else ground[rows[:, None], index])
+
+    moving = (dx != 0)[:, None]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        enter = (column - x0[:, None]) / dx[:, None]
+        leave = (column + 1 - x0[:, None]) / dx[:, None]
+    enter, leave = np.minimum(enter, leave), np.maximum(enter, leave)
+    enter = np.where(moving, np.maximum(enter, 0.0), 0.0)
+    leave = np.where(moving, np.minimum(leave, 1.0), 1.0)
+    enter_y = y0[:, None] + enter * dy[:, None]
+    starts_inside = enter_y >= surface
+    crosses = y0[:, None] + leave * dy[:, None] >= surface
+    touched = walked & (starts_inside | crosses)
+
+    hit = touched.any(axis=1)
+    rows = np.flatnonzero(hit)
+    cell = touched[rows].argmax(axis=1)
+    inside = starts_inside[rows, cell]
+    t_enter = enter[rows, cell]
+    level = surface[rows, cell]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t_cross = (level - y0[rows]) / dy[rows]
+    t = np.where(inside, t_enter, t_cross)
+    hit_t[rows] = t
+    hit_x[rows] = x0[rows] + t * dx[rows]
+    hit_y[rows] = np.where(inside, enter_y[rows, cell], level)
+    return hit_t, hit_x, hit_y
+
+
+# Function to test where many shells ended the tick, like point_contact
+def point_contacts(x, y, ground, tank_boxes, solid=None):
+    """Vectorized ``point_contact``: returns (outcome, tank) arrays."""
+    # Ground contact, using int() truncation like ground[int(x)], unless
+    # the ground test was already done on a TerrainMask (solid)
+    if solid is None:
+        columns = len(ground)
+        column = np.trunc(x)
+        in_world = (column >= 0) & (column < columns)
+        column = np.where(in_world, column, 0).astype(np.intp)
+        solid = in_world & (y >= HEIGHT - ground[column])
+    outcome = np.where(solid, GROUND, FLYING).astype(np.int8)
+
+    # Tanks are only checked when the ground was not hit first
+    tank = np.full(x.size, -1, dtype=np.int8)
+    for index in range(len(tank_boxes) - 1, -1, -1):
+        left, right, top, bottom = tank_boxes[index]
+        inside = (left < x) & (x < right) & (top < y) & (y < bottom)
+        tank[inside] = index
+    tank_hit = (outcome == FLYING) & (tank >= 0)
+    outcome[tank_hit] = TANK
+    return outcome, np.where(tank_hit, tank, -1).astype(np.int8)
+
+
+# Function to find when many segments first enter a box, like box_contact
+def _box_contacts(x0, y0, x1, y1, box):
+    left, right, top, bottom = box
+    enter = np.zeros(x0.size)
+    leave = np.ones(x0.size)
+    valid = np.ones(x0.size, dtype=bool)
+    for start, end, low, high in ((x0, x1, left, right),
+                                  (y0, y1, top, bottom)):
+        delta = end - start
+        moving = delta != 0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            near = (low - start) / delta
+            far = (high - start) / delta
+        near, far = np.minimum(near, far), np.maximum(near, far)
+        enter = np.where(moving, np.maximum(enter, near), enter)
+        leave = np.where(moving, np.minimum(leave, far), leave)
+        valid &= moving | ((low < start) & (start < high))
+    t = np.where(valid & (enter <= leave), enter, np.inf)
+
+    # Leaving a tank only counts when the shell is still inside at the end
+    starts_inside = (left < x0) & (x0 < right) & (top < y0) & (y0 < bottom)
+    ends_inside = (left < x1) & (x1 < right) & (top < y1) & (y1 < bottom)
+    return np.where(starts_inside, np.where(ends_inside, 1.0, np.inf), t)
+
+
+# Function to find the first contact of many segments, like first_contact
+def swept_contacts(x0, y0, x1, y1, ground, levels, lowest, tank_boxes):
+    """Vectorized ``first_contact``: returns (outcome, tank, x, y) arrays."""
+    count = x0.size
+    columns = len(ground)
+    outcome = np.full(count, FLYING, dtype=np.int8)
+    tank = np.full(count, -1, dtype=np.int8)
+    stop_x = np.full(count, np.nan)
+    stop_y = np.full(count, np.nan)
+    best = np.full(count, np.inf)
+
+    # Only segments that reach below the highest ground they pass over
+    # need the column walk; the range maximum rules out the rest
+    reach = np.maximum(y0, y1)
+    candidates = np.flatnonzero(reach >= lowest)
+    if candidates.size:
+        left = np.floor(np.minimum(x0[candidates], x1[candidates]))
+        right = np.floor(np.maximum(x0[candidates], x1[candidates]))
+        in_world = (right >= 0) & (left <= columns - 1)
+        start = np.clip(left, 0, columns - 1).astype(np.intp)
+        stop = np.clip(right, 0, columns - 1).astype(np.intp)
+        level = np.log2(stop - start + 1).astype(np.intp)
+        peak = np.zeros(candidates.size)
+        for depth in np.unique(level):
+            rows = level == depth
+            heights = levels[depth]
+            peak[rows] = np.maximum(heights[start[rows]],
+                                    heights[stop[rows] - (1 << depth) + 1])
+        candidates = candidates[in_world
+                                & (reach[candidates] >= HEIGHT - peak)]
+
+    for first in range(0, candidates.size, GROUND_CHUNK):
+        rows = candidates[first:first + GROUND_CHUNK]
+        t, hit_x, hit_y = ground_contacts(x0[rows], y0[rows], x1[rows],
+                                          y1[rows], ground)
+        hit = t < np.inf
+        rows = rows[hit]
+        best[rows] = t[hit]
+        outcome[rows] = GROUND
+        stop_x[rows] = hit_x[hit]
+        stop_y[rows] = hit_y[hit]
+
+    tank_contacts(x0, y0, x1, y1, tank_boxes, best, outcome, tank, stop_x,
+                  stop_y)
+    return outcome, tank, stop_x, stop_y
+
+
+# Function to let tanks take over contacts they are touched before
+def tank_contacts(x0, y0, x1, y1, tank_boxes, best, outcome, tank, stop_x,
+                  stop_y):
+    """Vectorized ``box_contact`` over every tank, updating the arrays."""
+    # Updates the arrays in place. A tank only wins when it is touched
+    # strictly before everything else. A box may hold arrays, one tank
+    # per segment, when the segments fly in different matches.
+    reach = np.maximum(y0, y1)
+    for index, box in enumerate(tank_boxes):
+        left, right, top, bottom = box
+        near = np.flatnonzero((np.minimum(x0, x1) <= right)
+                               & (left <= np.maximum(x0, x1))
+                               & (np.minimum(y0, y1) <= bottom)
+                               & (top <= reach))
+        if not near.size:
+            continue
+        if np.ndim(left):
+            box = tuple(side[near] for side in box)
+        t = _box_contacts(x0[near], y0[near], x1[near], y1[near], box)
+        closer = t < best[near]
+        rows = near[closer]
+        t = t[closer]
+        best[rows] = t
+        outcome[rows] = TANK
+        tank[rows] = index
+        stop_x[rows] = x0[rows] + t * (x1[rows] - x0[rows])
+        stop_y[rows] = y0[rows] + t * (y1[rows] - y0[rows])
+
+
+# Function to fly a batch of shells until each one lands or leaves the world
+def simulate_shots(angles, powers, winds, origin_x, origin_y, ground,
+                   tanks=(), max_frames=10000, swept=True):
+    """Simulate every shell and return a ShotResults of per-shell arrays.
+
+    ``angles``, ``powers``, ``winds``, ``origin_x`` and ``origin_y`` are
+    broadcast against each other, so one wind or origin can be shared by the
+    whole batch. ``tanks`` is a sequence of objects with ``x`` and ``y``
+    (such as ``Match.tanks``); ``tank`` in the result is the index of the
+    tank that was hit, or -1. ``swept`` matches ``Match(swept=...)``.
+    """
+    velocity_x, velocity_y = launch_velocities(angles, powers)
+    velocity_x, velocity_y, winds, x, y = np.broadcast_arrays(
+        velocity_x, velocity_y,
+        np.asarray(winds, dtype=np.float64),
+        np.asarray(origin_x, dtype=np.float64),
+        np.asarray(origin_y, dtype=np.float64),
+    )
+    shape = x.shape
+    count = x.size
+
+    # Working set of shells still in flight, compacted every frame
+    live = np.arange(count)
+    x = x.ravel().copy()
+    y = y.ravel().copy()
+    velocity_x = velocity_x.ravel().copy()
+    velocity_y = velocity_y.ravel().copy()
+    winds = winds.ravel().copy()
+
+    result_x = np.full(count, np.nan)
+    result_y = np.full(count, np.nan)
+    result_frame = np.full(count, max_frames, dtype=np.int32)
+    result_outcome = np.full(count, FLYING, dtype=np.int8)
+    result_tank = np.full(count, -1, dtype=np.int8)
+
+    ground = np.asarray(ground, dtype=np.float64)
+    world_width = len(ground)
+    tank_boxes = [tank_box(tank) for tank in tanks]
+    levels = height_levels(ground)
+    lowest = HEIGHT - levels[-1].max()  # Screen y of the highest peak
+
+    for frame in range(1, max_frames + 1):
+        if not live.size:
+            break
+
+        start_x = x.copy()
+        start_y = y.copy()
+
+        # Same update order as Projectile.move
+        velocity_x += winds
+        x += velocity_x
+        y += velocity_y
+        velocity_y += GRAVITY
+        velocity_x *= WIND_RESISTANCE
+        velocity_y *= WIND_RESISTANCE
+        off_screen = (x < 0) | (x > world_width) | (y > HEIGHT)
+
+        if swept:
+            outcome, tank, stop_x, stop_y = swept_contacts(
+                start_x, start_y, x, y, ground, levels, lowest, tank_boxes)
+        else:
+            outcome, tank = point_contacts(x, y, ground, tank_boxes)
+            stop_x, stop_y = x, y
+        tank_hit = outcome == TANK
+        outcome[(outcome == FLYING) & off_screen] = OFF_SCREEN
+
+        done = outcome != FLYING
+        if done.any():
+            finished = live[done]
+            result_x[finished] = np.where(outcome[done] == OFF_SCREEN, x[done],
+                                          stop_x[done])
+            result_y[finished] = np.where(outcome[done] == OFF_SCREEN, y[done],
+                                          stop_y[done])
+            result_frame[finished] = frame
+            result_outcome[finished] = outcome[done]
+            result_tank[finished] = np.where(tank_hit[done], tank[done], -1)
+
+            keep = ~done
+            live = live[keep]
+            x = x[keep]
+            y = y[keep]
+            velocity_x = velocity_x[keep]
+            velocity_y = velocity_y[keep]
+            winds = winds[keep]
+
+    # Shells still flying report where they got to
+    result_x[live] = x
+    result_y[live] = y
+
+    return ShotResults(
+        result_x.reshape(shape),
+        result_y.reshape(shape),
+        result_frame.reshape(shape),
+        result_outcome.reshape(shape),
+        result_tank.reshape(shape),
+    )
+
+
+# Function to score shots fired by a tank in a match without changing it
+def simulate_match_shots(match, angles, powers, tank=None):
+    tank = tank if tank is not None else match.current_tank
+    return simulate_shots(angles, powers, match.wind, tank.x, tank.y - 10,
+                          match.ground, match.tanks, swept=match.swept)
+
+
+# Closed-form flight
+#
+# Every frame Projectile.move does x += vx + wind, vx = (vx + wind) * r and
+# y += vy, vy = (vy + gravity) * r. Both velocities relax geometrically
+# towards a terminal value, so the state after k frames is a geometric
+# series that can be evaluated directly instead of stepping k times.
+
+# Impact found by find_impact; frame counts Match.update calls
+Impact = namedtuple("Impact", ["x", "y", "frame", "outcome", "tank"])
+
+# Frames that find_impact checks one by one once the search has narrowed
+_SCAN_FRAMES = 4
+# Slack on the search bounds so rounding never prunes a real contact
+_BOUND_SLACK = 1e-6
+_LOG_RESISTANCE = math.log(WIND_RESISTANCE)
+
+
+# Function to get the terms of p(k) = p0 + k * drift + coef * (1 - r^k)
+def flight_terms(velocity_x, velocity_y, wind):
+    """Return (terminal, coef, drift) for x, then for y."""
+    r = WIND_RESISTANCE
+    terminal_x = r * wind / (1 - r)
+    terminal_y = r * GRAVITY / (1 - r)
+    return (terminal_x, (velocity_x - terminal_x) / (1 - r), wind / (1 - r),
+            terminal_y, (velocity_y - terminal_y) / (1 - r), terminal_y)
+
+
+# Function to get a shell's state after a number of frames in O(1)
+def state_at(x, y, velocity_x, velocity_y, wind, frame):
+    """Return (x, y, velocity_x, velocity_y) after ``frame`` calls to move.
+
+    Velocities are the stored values that ``Projectile`` keeps between
+    frames. Works on floats or NumPy arrays, so a whole trajectory preview
+    is ``state_at(..., np.arange(n))``. The shell is assumed to stay in the
+    air; use ``find_impact`` to learn when it stops.
+    """
+    (terminal_x, coef_x, drift_x,
+     terminal_y, coef_y, drift_y) = flight_terms(velocity_x, velocity_y, wind)
+    decay = WIND_RESISTANCE ** frame
+    return (
+        x + frame * drift_x + coef_x * (1 - decay),
+        y + frame * drift_y + coef_y * (1 - decay),
+        terminal_x + decay * (velocity_x - terminal_x),
+        terminal_y + decay * (velocity_y - terminal_y),
+    )
+
+
+# Function to bound p(k) = p0 + k * drift + coef * (1 - r^k) on [first, last]
+def _extent(start, drift, coef, first, last):
+    def position(k):
+        return start + k * drift + coef * (1 - WIND_RESISTANCE ** k)
+
+    values = [position(first), position(last)]
+    # p has at most one turning point, where r^k = drift / (coef * ln r)
+    if coef:
+        turning = drift / (coef * _LOG_RESISTANCE)
+        if turning > 0:
+            k = math.log(turning) / _LOG_RESISTANCE
+            if first < k < last:
+                values.append(position(k))
+    return min(values) - _BOUND_SLACK, max(values) + _BOUND_SLACK
+
+
+# Range maximum over the heightmap, for the impact search
+class TerrainIndex:
+    def __init__(self, ground):
+        # levels[j][i] is the highest column in ground[i:i + 2 ** j]
+        level = np.asarray(ground, dtype=np.float64)
+        self.levels = [level.tolist()]
+        span = 1
+        while span * 2 <= len(level):
+            level = np.maximum(level[:-span], level[span:])
+            self.levels.append(level.tolist())
+            span *= 2
+
+    def __len__(self):
+        return len(self.levels[0])
+
+    def max_height(self, start, stop):
+        """Highest ground in columns start..stop inclusive, in O(1)."""
+        level = (stop - start + 1).bit_length() - 1
+        heights = self.levels[level]
+        return max(heights[start], heights[stop - (1 << level) + 1])
+
+
+# Function to find where and when a shell first lands, hits or leaves
+def find_impact(x, y, velocity_x, velocity_y, wind, ground, tanks=(),
+                terrain_index=None, max_frames=10000, swept=True):
+    """Return the Impact of a shell in flight without stepping every frame.
+
+    Frame ranges are bisected and discarded whenever the shell's bounding
+    box over that range cannot touch the ground (checked with a
+    ``TerrainIndex`` range maximum), a tank or the world edge. Only the last
+    few candidate frames are evaluated one by one with ``state_at``, using
+    the same tests in the same order as ``Match.update``. Pass a prebuilt
+    ``terrain_index`` when searching many shots over the same ground, such
+    as a match's ``ground_index``.
+    With ``swept`` each frame is the segment from the frame before, so the
+    bounds of a range also cover the frame before it.
+    """
+    if terrain_index is None:
+        terrain_index = TerrainIndex(ground)
+    columns = len(terrain_index)
+    (_, coef_x, drift_x,
+     _, coef_y, drift_y) = flight_terms(velocity_x, velocity_y, wind)
+    tank_boxes = [tank_box(tank) for tank in tanks]
+    heights = ground
+    reach = 1 if swept else 0
+
+    def may_stop(first, last):
+        min_x, max_x = _extent(x, drift_x, coef_x, first - reach, last)
+        min_y, max_y = _extent(y, drift_y, coef_y, first - reach, last)
+        if min_x < 0 or max_x > columns or max_y > HEIGHT:
+            return True
+        for left, right, top, bottom in tank_boxes:
+            if min_x < right and left < max_x and min_y < bottom \
+                    and top < max_y:
+                return True
+        # int() truncates, so every x above -1 can land in column 0
+        start = max(0, int(min_x)) if min_x > -1 else 0
+        stop = min(columns - 1, int(max_x))
+        return start <= stop \
+            and max_y >= HEIGHT - terrain_index.max_height(start, stop)
+
+    def stop_at(frame):
+        shell_x, shell_y, _, _ = state_at(x, y, velocity_x, velocity_y, wind,
+                                          frame)
+        if swept:
+            start_x, start_y, _, _ = state_at(x, y, velocity_x, velocity_y,
+                                              wind, frame - 1)
+            contact = first_contact(start_x, start_y, shell_x, shell_y,
+                                    heights, tanks)
+            if contact is not None:
+                return Impact(contact.x, contact.y, frame, contact.outcome,
+                              contact.tank)
+            if shell_x < 0 or shell_x > columns or shell_y > HEIGHT:
+                return Impact(shell_x, shell_y, frame, OFF_SCREEN, -1)
+            return None
+        column = int(shell_x)
+        if 0 <= column < columns and \
+                shell_y >= HEIGHT - heights[column]:
+            return Impact(shell_x, shell_y, frame, GROUND, -1)
+        for index, (left, right, top, bottom) in enumerate(tank_boxes):
+            if left < shell_x < right and top < shell_y < bottom:
+                return Impact(shell_x, shell_y, frame, TANK, index)
+        if shell_x < 0 or shell_x > columns or shell_y > HEIGHT:
+            return Impact(shell_x, shell_y, frame, OFF_SCREEN, -1)
+        return None
+
+    # Depth-first over frame ranges, earliest range first
+    ranges = [(1, max_frames)]
+    while ranges:
+        first, last = ranges.pop()
+        if not may_stop(first, last):
+            continue
+        if last - first < _SCAN_FRAMES:
+            for frame in range(first, last + 1):
+                impact = stop_at(frame)
+                if impact is not None:
+                    return impact
+            continue
+        middle = (first + last) // 2
+        ranges.append((middle + 1, last))
+        ranges.append((first, middle))
+
+    shell_x, shell_y, _, _ = state_at(x, y, velocity_x, velocity_y, wind,
+                                      max_frames)
+    return Impact(shell_x, shell_y, max_frames, FLYING, -1)
@@ -0,0 +1,58 @@
+"""Retained text and panel surfaces for the pygame menus and HUD.
+
+Fonts are created once per size, rendered strings are kept in an LRU cache
+keyed by (text, size, color), and static panels are built once and only
+rebuilt when their content key changes. Menus that redraw every frame then
+cost a handful of blits instead of font construction and text rendering.
+"""
+from functools import lru_cache
+
+import pygame
+
+# Font cache keyed by size
+_fonts = {}
+
+# Static panels: name -> (content key, surface)
+_panels = {}
+
+
+# Function to get the default font at a size, created only once
+def get_font(size):
+    font = _fonts.get(size)
+    if font is None:
+        font = _fonts[size] = pygame.font.Font(None, size)
+    return font
+
+
+# Function to render a string, reusing the surface if it was rendered before
+@lru_cache(maxsize=512)
+def render_text(text, size, color):
+    return get_font(size).render(text, True, color)
+
+
+# Function to blit cached text horizontally centered on a surface
+def blit_centered(surface, text, size, color, y):
+    rendered = render_text(text, size, color)
+    surface.blit(rendered, (surface.get_width() // 2 - rendered.get_width()
+                            // 2, y))
+    return rendered
+
+
+# Function to get a static panel, building it only when its content changed
+def cached_panel(name, key, build):
+    """Return the panel ``name``, calling ``build()`` if ``key`` is new.
+
+    ``key`` must describe everything the panel shows; the surface returned
+    by ``build`` is kept until a different key is passed for the same name.
+    """
+    cached = _panels.get(name)
+    if cached is None or cached[0] != key:
+        cached = _panels[name] = (key, build())
+    return cached[1]
+
+
+# Function to drop every cached font, text and panel, e.g. after pygame.quit
+def clear_caches():
+    _fonts.clear()
+    _panels.clear()
+    render_text.cache_clear()